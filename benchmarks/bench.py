@@ -0,0 +1,307 @@
+"""
+Benchmark shbin against a local fake GitHub API.
+
+Each scenario runs shbin in a subprocess against a fresh fake server and reports the
+wall time, the API calls, the bytes sent and received and the peak memory of the process.
+Run it from the root of the repository with `python -m benchmarks.bench`.
+
+Usage:
+  bench [<scenario>...] [options]
+
+Options:
+  --quick                   Skip the slowest scenarios (1000 files, 100 MB).
+  --latency=<seconds>       Delay of every API response [default: 0].
+  --throttle-every=<n>      Throttle every n-th request with a secondary rate limit [default: 0].
+  --json=<path>             Write the results as json.
+  --baseline=<path>         Fail if a scenario makes more API calls or sends more bytes than in these results.
+  --list                    List the scenarios.
+"""
+
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+from rich import print
+from rich.table import Table
+
+from .fake_github import FakeGitHub
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+KB = 1024
+MB = 1024 * KB
+
+
+def write_files(directory, count, size):
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        (directory / f"{i:04d}.txt").write_bytes(b"%d" % i + b"x" * (size - len(b"%d" % i)))
+
+
+def write_payload(path, size):
+    # random bytes, so the file isn't sent inline as text
+    with open(path, "wb") as f:
+        for offset in range(0, size, MB):
+            f.write(os.urandom(min(MB, size - offset)))
+
+
+def write_payloads(directory, count, size):
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        write_payload(directory / f"{i:04d}.bin", size)
+
+
+def touch_files(directory, round):
+    for path in sorted(directory.iterdir()):
+        path.write_bytes(path.read_bytes() + b"%d" % round)
+
+
+class Scenario:
+    """
+    A benchmark: `setup(workdir)` prepares local files, `seed` are the shbin commands that fill
+    the repo beforehand, not measured, and `commands` those measured. `before(workdir, i)` runs
+    before the i-th measured command.
+    """
+
+    def __init__(self, name, description, setup, commands, seed=(), before=None, slow=False):
+        self.name = name
+        self.description = description
+        self.setup = setup
+        self.commands = commands
+        self.seed = seed
+        self.before = before
+        self.slow = slow
+
+
+SCENARIOS = [
+    Scenario("upload-1", "one 1 KB text file", lambda w: write_files(w / "files", 1, KB), [["files/0000.txt"]]),
+    Scenario("upload-100", "a directory of 100 1 KB files", lambda w: write_files(w / "files", 100, KB), [["files"]]),
+    Scenario(
+        "upload-1000",
+        "a directory of 1000 1 KB files",
+        lambda w: write_files(w / "files", 1000, KB),
+        [["files"]],
+        slow=True,
+    ),
+    Scenario(
+        "upload-binary-100",
+        "a directory of 100 1 KB binary files, a blob each",
+        lambda w: write_payloads(w / "files", 100, KB),
+        [["files"]],
+    ),
+    Scenario("payload-1kb", "a 1 KB binary file", lambda w: write_payload(w / "payload.bin", KB), [["payload.bin"]]),
+    Scenario("payload-1mb", "a 1 MB binary file", lambda w: write_payload(w / "payload.bin", MB), [["payload.bin"]]),
+    Scenario(
+        "payload-10mb", "a 10 MB binary file", lambda w: write_payload(w / "payload.bin", 10 * MB), [["payload.bin"]]
+    ),
+    Scenario(
+        "payload-100mb",
+        "a 100 MB binary file, stored in parts",
+        lambda w: write_payload(w / "payload.bin", 100 * MB),
+        [["payload.bin"]],
+        slow=True,
+    ),
+    Scenario(
+        "dl-recursive",
+        "download a directory of 100 files",
+        lambda w: write_files(w / "files", 100, KB),
+        [["dl", "bench/files/"]],
+        seed=[["files"]],
+    ),
+    Scenario(
+        "dl-archive",
+        "download a directory of 100 files as an archive",
+        lambda w: write_files(w / "files", 100, KB),
+        [["dl", "bench/files/", "--archive"]],
+        seed=[["files"]],
+    ),
+    Scenario(
+        "dl-10mb",
+        "download a 10 MB file",
+        lambda w: write_payload(w / "payload.bin", 10 * MB),
+        [["dl", "bench/payload.bin"]],
+        seed=[["payload.bin"]],
+    ),
+    Scenario(
+        "dl-10mb-again",
+        "download a 10 MB file 5 times, removing it in between",
+        lambda w: write_payload(w / "payload.bin", 10 * MB),
+        [["dl", "bench/payload.bin"]] * 5,
+        seed=[["payload.bin"]],
+        before=lambda w, i: (w.parent / "out" / "payload.bin").unlink(missing_ok=True),
+    ),
+    Scenario(
+        "dl-100mb",
+        "download a 100 MB file stored in parts",
+        lambda w: write_payload(w / "payload.bin", 100 * MB),
+        [["dl", "bench/payload.bin"]],
+        seed=[["payload.bin"]],
+        slow=True,
+    ),
+    Scenario(
+        "update-1",
+        "update a file 10 times",
+        lambda w: write_files(w / "files", 1, KB),
+        [["files/0000.txt"]] * 10,
+        seed=[["files/0000.txt"]],
+        before=lambda w, i: touch_files(w / "files", i),
+    ),
+    Scenario(
+        "update-100",
+        "update a directory of 100 files 5 times",
+        lambda w: write_files(w / "files", 100, KB),
+        [["files"]] * 5,
+        seed=[["files"]],
+        before=lambda w, i: touch_files(w / "files", i),
+    ),
+]
+
+
+# runs shbin and writes its peak memory into the file given as first argument. On linux, that's
+# read from /proc: ru_maxrss would count the memory of the benchmark process it was forked from.
+CHILD = """
+import resource, sys
+from shbin import main
+
+try:
+    main(sys.argv[2:])
+finally:
+    try:
+        with open("/proc/self/status") as status:
+            peak = next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:"))
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(sys.argv[1], "w") as f:
+        f.write(str(peak))
+"""
+
+
+def run_shbin(argv, cwd, env, log):
+    """
+    Run shbin with `argv` and return its peak resident memory in bytes.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        peak = pathlib.Path(tmp) / "peak"
+        process = subprocess.run(
+            [sys.executable, "-c", CHILD, str(peak), *argv], cwd=cwd, env=env, stdout=log, stderr=log
+        )
+        if process.returncode:
+            log.seek(0)
+            raise RuntimeError(f"shbin {' '.join(argv)} failed:\n{log.read().decode(errors='replace')}")
+        return int(peak.read_text())
+
+
+def run_scenario(scenario, latency=0.0, throttle_every=0):
+    """
+    Run `scenario` against a fresh fake server. Returns its results.
+    """
+    with tempfile.TemporaryDirectory(prefix="shbin-bench-") as tmp, FakeGitHub(
+        latency=latency, throttle_every=throttle_every
+    ) as server, tempfile.TemporaryFile() as log:
+        workdir = pathlib.Path(tmp) / "work"
+        out = pathlib.Path(tmp) / "out"
+        workdir.mkdir()
+        out.mkdir()
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+            "XDG_CONFIG_HOME": str(pathlib.Path(tmp) / "config"),
+            "SHBIN_API_URL": server.url,
+            "SHBIN_GITHUB_TOKEN": "bench",
+            "SHBIN_REPO": "bench/pastebin",
+            "SHBIN_COPY_URL": "0",
+        }
+        scenario.setup(workdir)
+        for argv in scenario.seed:
+            run_shbin(argv, workdir, env, log)
+        server.reset_stats()
+
+        peak_rss = 0
+        start = time.perf_counter()
+        for i, argv in enumerate(scenario.commands):
+            if scenario.before:
+                scenario.before(workdir, i)
+            cwd = out if argv[0] == "dl" else workdir
+            peak_rss = max(peak_rss, run_shbin(argv, cwd, env, log))
+        wall_time = time.perf_counter() - start
+        stats = server.stats()
+    return {
+        "scenario": scenario.name,
+        "wall_time": round(wall_time, 3),
+        "calls": stats["calls"],
+        "bytes_sent": stats["bytes_received"],
+        "bytes_received": stats["bytes_sent"],
+        "peak_rss": peak_rss,
+        "throttled": stats["throttled"],
+        "endpoints": stats["endpoints"],
+    }
+
+
+def regressions(results, baseline):
+    """
+    Return the scenarios that make more calls or send more bytes than in `baseline`.
+    Times and memory aren't compared, they depend too much on the machine.
+    """
+    before = {result["scenario"]: result for result in baseline}
+    found = []
+    for result in results:
+        previous = before.get(result["scenario"])
+        for key in ("calls", "bytes_sent"):
+            if previous and result[key] > previous[key]:
+                found.append(f"{result['scenario']}: {key} went from {previous[key]} to {result[key]}")
+    return found
+
+
+def report(results):
+    table = Table()
+    for column in ("scenario", "wall time", "API calls", "sent", "received", "peak RSS", "throttled"):
+        table.add_column(column, justify="left" if column == "scenario" else "right")
+    for result in results:
+        table.add_row(
+            result["scenario"],
+            f"{result['wall_time']:.2f}s",
+            str(result["calls"]),
+            f"{result['bytes_sent'] / MB:.2f} MB",
+            f"{result['bytes_received'] / MB:.2f} MB",
+            f"{result['peak_rss'] / MB:.0f} MB",
+            str(result["throttled"]),
+        )
+    print(table)
+
+
+def main(argv=None):
+    args = docopt(__doc__, argv)
+    if args["--list"]:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:16}{scenario.description}")
+        return
+
+    names = args["<scenario>"]
+    unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    scenarios = [s for s in SCENARIOS if s.name in names or (not names and not (args["--quick"] and s.slow))]
+
+    results = []
+    for scenario in scenarios:
+        print(f"[dim]running {scenario.name}: {scenario.description}[/dim]", file=sys.stderr)
+        results.append(run_scenario(scenario, float(args["--latency"]), int(args["--throttle-every"])))
+    report(results)
+
+    if args["--json"]:
+        pathlib.Path(args["--json"]).write_text(json.dumps(results, indent=2))
+    if args["--baseline"]:
+        found = regressions(results, json.loads(pathlib.Path(args["--baseline"]).read_text()))
+        for regression in found:
+            print(f"[red]x[/red] {regression}")
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
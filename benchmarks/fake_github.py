@@ -0,0 +1,485 @@
+"""
+A local stand-in for the parts of the GitHub API shbin uses: the contents API, the Git Data
+API (blobs, trees, commits and refs), the tarball of the branch and the rate limit. It keeps
+a single repository in memory.
+
+Every request can be delayed by a fixed latency, and every n-th one throttled the way GitHub
+does with its secondary rate limit. The server counts the calls and the bytes in each direction.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+OWNER = "bench"
+REPO = "pastebin"
+BRANCH = "main"
+
+# the contents API doesn't include the content of bigger files
+CONTENTS_MAX_SIZE = 1024 * 1024
+
+
+class NotFound(Exception):
+    pass
+
+
+class Unprocessable(Exception):
+    pass
+
+
+class Conflict(Exception):
+    pass
+
+
+def git_blob_sha(content):
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class Repository:
+    """
+    The git objects of the repository, addressed by sha, and its only branch.
+    Trees are nested as in git, so subtrees can be listed by their own sha.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.head = self.commit("initial commit", self.build({}), [])
+
+    def blob(self, content):
+        sha = git_blob_sha(content)
+        self.blobs[sha] = content
+        return sha
+
+    def tree(self, entries):
+        """
+        Store a tree of {name: (mode, type, sha)} entries.
+        """
+        sha = hashlib.sha1(json.dumps(sorted(entries.items())).encode()).hexdigest()
+        self.trees[sha] = entries
+        return sha
+
+    def commit(self, message, tree, parents):
+        sha = hashlib.sha1(json.dumps([message, tree, parents, time.time()]).encode()).hexdigest()
+        self.commits[sha] = {"message": message, "tree": tree, "parents": parents}
+        return sha
+
+    def files(self, tree, prefix=""):
+        """
+        Return the {path: (mode, sha)} of the blobs under `tree`.
+        """
+        files = {}
+        for name, (mode, type, sha) in self.trees[tree].items():
+            if type == "tree":
+                files.update(self.files(sha, f"{prefix}{name}/"))
+            else:
+                files[f"{prefix}{name}"] = (mode, sha)
+        return files
+
+    def build(self, files):
+        """
+        Store the nested trees for the {path: (mode, sha)} `files`. Returns the root tree sha.
+        """
+        entries, subdirs = {}, {}
+        for path, (mode, sha) in files.items():
+            name, _, rest = path.partition("/")
+            if rest:
+                subdirs.setdefault(name, {})[rest] = (mode, sha)
+            else:
+                entries[name] = (mode, "blob", sha)
+        for name, subfiles in subdirs.items():
+            entries[name] = ("040000", "tree", self.build(subfiles))
+        return self.tree(entries)
+
+    def resolve(self, sha):
+        """
+        The tree `sha`, or the tree of the commit `sha`, as the trees endpoint accepts both.
+        """
+        if sha in self.commits:
+            return self.commits[sha]["tree"]
+        if sha not in self.trees:
+            raise NotFound(sha)
+        return sha
+
+    def lookup(self, path):
+        """
+        Return the (mode, type, sha) of `path` in the head commit.
+        """
+        entry = ("040000", "tree", self.commits[self.head]["tree"])
+        for name in filter(None, path.split("/")):
+            if entry[1] != "tree" or name not in self.trees[entry[2]]:
+                raise NotFound(path)
+            entry = self.trees[entry[2]][name]
+        return entry
+
+    def is_ancestor(self, ancestor, sha):
+        pending = [sha]
+        while pending:
+            sha = pending.pop()
+            if sha == ancestor:
+                return True
+            pending.extend(self.commits[sha]["parents"])
+        return False
+
+
+class FakeGitHub:
+    """
+    The server, listening on a free local port once started. Use it as a context manager.
+    """
+
+    def __init__(self, latency=0.0, throttle_every=0, retry_after=1, rate_limit=5000):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.repo = Repository()
+        self.lock = threading.RLock()
+        self.reset_stats()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls = Counter()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.throttled = 0
+            self.remaining = self.rate_limit
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "endpoints": dict(self.calls),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "throttled": self.throttled,
+            }
+
+    @property
+    def repo_url(self):
+        return f"{self.url}/repos/{OWNER}/{REPO}"
+
+    @property
+    def html_url(self):
+        return f"{self.url}/{OWNER}/{REPO}"
+
+    def metadata(self):
+        return {
+            "url": self.repo_url,
+            "html_url": self.html_url,
+            "full_name": f"{OWNER}/{REPO}",
+            "name": REPO,
+            "default_branch": BRANCH,
+            "owner": {"login": OWNER},
+        }
+
+    def ref(self):
+        return {
+            "ref": f"refs/heads/{BRANCH}",
+            "url": f"{self.repo_url}/git/refs/heads/{BRANCH}",
+            "object": {"sha": self.repo.head, "type": "commit", "url": f"{self.repo_url}/git/commits/{self.repo.head}"},
+        }
+
+    def commit_data(self, sha):
+        commit = self.repo.commits[sha]
+        return {
+            "sha": sha,
+            "url": f"{self.repo_url}/git/commits/{sha}",
+            "html_url": f"{self.html_url}/commit/{sha}",
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"], "url": f"{self.repo_url}/git/trees/{commit['tree']}"},
+            "parents": [
+                {"sha": parent, "url": f"{self.repo_url}/git/commits/{parent}"} for parent in commit["parents"]
+            ],
+        }
+
+    def content_data(self, path, mode_type_sha, with_content=False):
+        _, type, sha = mode_type_sha
+        data = {
+            "type": "dir" if type == "tree" else "file",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": sha,
+            "size": len(self.repo.blobs[sha]) if type == "blob" else 0,
+            "url": f"{self.repo_url}/contents/{path}",
+            "html_url": f"{self.html_url}/blob/{BRANCH}/{path}",
+            "git_url": f"{self.repo_url}/git/{'trees' if type == 'tree' else 'blobs'}/{sha}",
+            "download_url": None,
+        }
+        if with_content:
+            content = self.repo.blobs[sha]
+            if len(content) > CONTENTS_MAX_SIZE:
+                data.update(encoding="none", content="")
+            else:
+                data.update(encoding="base64", content=base64.b64encode(content).decode())
+        return data
+
+    def tree_data(self, sha, recursive):
+        entries = []
+
+        def walk(tree, prefix):
+            for name, (mode, type, entry_sha) in sorted(self.repo.trees[tree].items()):
+                entry = {"path": f"{prefix}{name}", "mode": mode, "type": type, "sha": entry_sha}
+                if type == "blob":
+                    entry["size"] = len(self.repo.blobs[entry_sha])
+                entries.append(entry)
+                if recursive and type == "tree":
+                    walk(entry_sha, f"{prefix}{name}/")
+
+        walk(sha, "")
+        return {"sha": sha, "url": f"{self.repo_url}/git/trees/{sha}", "tree": entries, "truncated": False}
+
+    def move_head(self, sha, force=False):
+        if not force and not self.repo.is_ancestor(self.repo.head, sha):
+            raise Unprocessable("Update is not a fast forward")
+        self.repo.head = sha
+
+    # the endpoints: each gets the path after the repo url, the query and the json body
+
+    def get_contents(self, path, query, body):
+        path = path.strip("/")
+        mode, type, sha = self.repo.lookup(path)
+        if type == "tree":
+            return [
+                self.content_data(f"{path}/{name}".lstrip("/"), entry)
+                for name, entry in sorted(self.repo.trees[sha].items())
+            ]
+        return self.content_data(path, (mode, type, sha), with_content=True)
+
+    def put_contents(self, path, query, body):
+        path = path.strip("/")
+        files = self.repo.files(self.repo.commits[self.repo.head]["tree"])
+        if path in files and body.get("sha") is None:
+            raise Unprocessable('Invalid request.\n\n"sha" wasn\'t supplied.')
+        if path in files and body["sha"] != files[path][1]:
+            raise Conflict(f"{path} does not match {body['sha']}")
+        files[path] = ("100644", self.repo.blob(base64.b64decode(body["content"])))
+        commit = self.repo.commit(body["message"], self.repo.build(files), [self.repo.head])
+        self.move_head(commit)
+        return {
+            "content": self.content_data(path, ("100644", "blob", files[path][1])),
+            "commit": self.commit_data(commit),
+        }
+
+    def post_blob(self, path, query, body):
+        content = body["content"]
+        content = base64.b64decode(content) if body.get("encoding") == "base64" else content.encode()
+        sha = self.repo.blob(content)
+        return {"sha": sha, "url": f"{self.repo_url}/git/blobs/{sha}"}
+
+    def get_blob(self, sha, query, body):
+        if sha not in self.repo.blobs:
+            raise NotFound(sha)
+        content = self.repo.blobs[sha]
+        return {
+            "sha": sha,
+            "size": len(content),
+            "url": f"{self.repo_url}/git/blobs/{sha}",
+            "encoding": "base64",
+            "content": base64.b64encode(content).decode(),
+        }
+
+    def post_tree(self, path, query, body):
+        files = self.repo.files(self.repo.resolve(body["base_tree"])) if body.get("base_tree") else {}
+        for element in body["tree"]:
+            if "content" in element:
+                files[element["path"]] = (element["mode"], self.repo.blob(element["content"].encode()))
+            elif element.get("sha") is None:
+                files.pop(element["path"], None)
+            else:
+                files[element["path"]] = (element["mode"], element["sha"])
+        return self.tree_data(self.repo.build(files), recursive=False)
+
+    def get_tree(self, sha, query, body):
+        return self.tree_data(self.repo.resolve(sha), recursive="recursive" in query)
+
+    def post_commit(self, path, query, body):
+        return self.commit_data(self.repo.commit(body["message"], body["tree"], body.get("parents", [])))
+
+    def get_commit(self, sha, query, body):
+        if sha not in self.repo.commits:
+            raise NotFound(sha)
+        return self.commit_data(sha)
+
+    def get_ref(self, ref, query, body):
+        if ref != f"heads/{BRANCH}":
+            raise NotFound(ref)
+        return self.ref()
+
+    def patch_ref(self, ref, query, body):
+        if ref != f"heads/{BRANCH}":
+            raise NotFound(ref)
+        if body["sha"] not in self.repo.commits:
+            raise Unprocessable("Object does not exist")
+        self.move_head(body["sha"], body.get("force", False))
+        return self.ref()
+
+    def get_tarball(self, ref, query, body):
+        """
+        The files of the head commit as a gzipped tarball, under a "<owner>-<repo>-<sha>/" directory.
+        """
+        if ref != BRANCH:
+            raise NotFound(ref)
+        root = f"{OWNER}-{REPO}-{self.repo.head[:7]}"
+        fileobj = io.BytesIO()
+        with tarfile.open(fileobj=fileobj, mode="w:gz") as tar:
+            directory = tarfile.TarInfo(root)
+            directory.type = tarfile.DIRTYPE
+            tar.addfile(directory)
+            for path, (mode, sha) in sorted(self.repo.files(self.repo.commits[self.repo.head]["tree"]).items()):
+                info = tarfile.TarInfo(f"{root}/{path}")
+                info.size = len(self.repo.blobs[sha])
+                tar.addfile(info, io.BytesIO(self.repo.blobs[sha]))
+        return fileobj.getvalue()
+
+    ROUTES = [
+        ("GET", "contents/", "contents", get_contents),
+        ("PUT", "contents/", "contents", put_contents),
+        ("POST", "git/blobs", "git/blobs", post_blob),
+        ("GET", "git/blobs/", "git/blobs", get_blob),
+        ("POST", "git/trees", "git/trees", post_tree),
+        ("GET", "git/trees/", "git/trees", get_tree),
+        ("POST", "git/commits", "git/commits", post_commit),
+        ("GET", "git/commits/", "git/commits", get_commit),
+        ("GET", "tarball/", "tarball", get_tarball),
+        ("GET", "git/ref/", "git/refs", get_ref),
+        ("GET", "git/refs/", "git/refs", get_ref),
+        ("PATCH", "git/ref/", "git/refs", patch_ref),
+        ("PATCH", "git/refs/", "git/refs", patch_ref),
+    ]
+
+    def route(self, method, path):
+        """
+        Return the (endpoint name, handler, argument) for a request, or raise NotFound.
+        """
+        if method == "GET" and path == "/user":
+            return "user", lambda *args: {"login": OWNER}, None
+        if method == "GET" and path == "/rate_limit":
+            return "rate_limit", lambda *args: self.rate_limit_data(), None
+        prefix = f"/repos/{OWNER}/{REPO}"
+        if method == "GET" and path == prefix:
+            return "repo", lambda *args: self.metadata(), None
+        if not path.startswith(f"{prefix}/"):
+            raise NotFound(path)
+        rest = path[len(prefix) + 1 :]
+        for route_method, start, name, handler in self.ROUTES:
+            if method == route_method and (rest == start or (start.endswith("/") and rest.startswith(start))):
+                return name, handler.__get__(self), unquote(rest[len(start) :])
+        raise NotFound(path)
+
+    def rate_limit_data(self):
+        core = {"limit": self.rate_limit, "remaining": self.remaining, "reset": int(time.time()) + 3600}
+        return {"resources": {"core": core}, "rate": core}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def do_PUT(self):
+        self.handle_api("PUT")
+
+    def do_PATCH(self):
+        self.handle_api("PATCH")
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def handle_api(self, method):
+        fake = self.server.fake
+        body = self.read_body()
+        if fake.latency:
+            time.sleep(fake.latency)
+        with fake.lock:
+            fake.bytes_received += len(body)
+            response = self.dispatch(method, body)
+        # sent out of the lock, so big responses don't hold back the others
+        self.respond(*response)
+
+    def dispatch(self, method, body):
+        """
+        Return the (status, data, headers) to answer the request with.
+        """
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        try:
+            name, handler, argument = fake.route(method, url.path)
+        except NotFound:
+            return 404, {"message": "Not Found"}, None
+        fake.calls[f"{method} {name}"] += 1
+        if fake.throttle_every and sum(fake.calls.values()) % fake.throttle_every == 0:
+            fake.throttled += 1
+            message = {"message": "You have exceeded a secondary rate limit."}
+            return 403, message, {"Retry-After": str(fake.retry_after)}
+        fake.remaining = max(fake.remaining - 1, 0)
+        try:
+            data = handler(argument, parse_qs(url.query), json.loads(body) if body else {})
+        except NotFound:
+            return 404, {"message": "Not Found"}, None
+        except Unprocessable as e:
+            return 422, {"message": str(e)}, None
+        except Conflict as e:
+            return 409, {"message": str(e)}, None
+        if name == "git/blobs" and method == "GET" and "raw" in self.headers.get("Accept", ""):
+            return 200, fake.repo.blobs[data["sha"]], None
+        return 201 if method in ("POST", "PUT") else 200, data, None
+
+    def respond(self, status, data, headers=None):
+        fake = self.server.fake
+        content = data if isinstance(data, bytes) else json.dumps(data).encode()
+        etag = f'W/"{hashlib.sha1(content).hexdigest()}"'
+        if status == 200 and self.command == "GET" and self.headers.get("If-None-Match") == etag:
+            # like GitHub, a 304 doesn't count against the rate limit
+            status, content = 304, b""
+            with fake.lock:
+                fake.remaining += 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if isinstance(data, bytes) else "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Limit", str(fake.rate_limit))
+        self.send_header("X-RateLimit-Remaining", str(fake.remaining))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+        with fake.lock:
+            fake.bytes_sent += len(content)
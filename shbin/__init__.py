@@ -2,28 +2,52 @@
 Turns a Github repo into a pastebin.
 """
 
-import itertools
+import contextlib
+import hashlib
+import io
 import os
 import pathlib
+import posixpath
 import re
 import secrets
+import shutil
 import sys
-from mimetypes import guess_extension
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 
 import pyclip
 from docopt import DocoptExit, docopt
-from github import Github, GithubException
 from rich import print
-from .auth import do_auth, load_config
+
+# PyGithub (and the modules using it) is imported when needed, as it's slow to import.
+from . import agent, shards, trace, transport
+from .auth import do_auth, load_config, save_config
+from .blobs import CHUNK_SIZE, STREAM_THRESHOLD, download_blob
+from .cache import TreeCache, file_blob_sha
+from .cache import is_enabled as cache_enabled
+from .fetch import TruncatedTree, download_archive, download_directory
+from .sniff import get_extension
+from .transport import API_URL, DEFAULT_JOBS, install as install_transport
+from .walk import expand_paths
 
 
 usage = """
 
 Usage:
-  shbin dl <url_or_path>  
+  shbin dl <url_or_path> [--jobs=<jobs>] [--list] [--resume] [--archive] [--profile]
   shbin auth
+  shbin agent
+  shbin ls [<namespace>] [-l] [--sync] [--profile]
+  shbin search <query>... [--sync] [--profile]
+  shbin watch <path>... [-m <message>] [-d <target-dir>] [--namespace=<namespace>] [--jobs=<jobs>]
+        [--exclude=<pattern>]... [--debounce=<seconds>]
+  shbin gc [<glob>...] [--older-than=<days>] [--larger-than=<size>] [--quota=<size>] [--exclude=<pattern>]...
+        [-m <message>] [--dry-run] [--profile]
   shbin (<path>... | -x | -) [-f <file-name>] [-n] [-m <message>] [-d <target-dir>] 
-        [--namespace=<namespace>] [--url-link-to-pages]
+        [--namespace=<namespace>] [--url-link-to-pages] [--jobs=<jobs>] [--exclude=<pattern>]... [--pack]
+        [--image-quality=<quality>] [--resume] [--profile]
   shbin (-h | --help)
   
 
@@ -37,23 +61,75 @@ Options:
   --namespace=<namespace>                           Base namespace to upload. Default to
                                                     SHBIN_NAMESPACE envvar or "{user}/". 
   -p, --url-link-to-pages                           Reformat the url to link to Github pages. 
+  -j <jobs>, --jobs=<jobs>                          Concurrent requests to upload or download several files.
+                                                    Default to SHBIN_JOBS envvar or 8.
+  -e <pattern>, --exclude=<pattern>                 Skip the files matching this gitignore-like pattern.
+                                                    Can be repeated. .gitignore and .shbinignore files
+                                                    are honored too.
+  --pack                                            Upload the files as a single compressed tarball
+                                                    (a pack), that `shbin dl` extracts.
+  --image-quality=<quality>                         Recompress a pasted image before uploading it, if Pillow
+                                                    is installed: "lossless" (PNG), a WebP quality from
+                                                    1 to 100, or "avif:<quality>". Default to
+                                                    SHBIN_IMAGE_QUALITY envvar, or no recompression.
+  -l --list                                         List the files in a pack instead of extracting them.
+                                                    With ls, list sizes and last commits live from GitHub.
+  --sync                                            Sync the local index before listing or searching,
+                                                    even if it was synced recently.
+  --debounce=<seconds>                              Wait for the watched files to stay untouched this long
+                                                    before uploading what changed [default: 2].
+  --archive                                         Download a directory as a single archive of the branch,
+                                                    extracted while it's downloaded. Better for thousands
+                                                    of files.
+  --resume                                          Continue an upload or download that was interrupted,
+                                                    skipping what it already transferred.
+  --older-than=<days>                               With gc, delete the files last changed more than this
+                                                    many days ago.
+  --larger-than=<size>                              With gc, delete the files bigger than this (e.g. 10MB).
+  --quota=<size>                                    With gc, delete the oldest files of each namespace until
+                                                    it fits in this size (e.g. 1GB).
+  --dry-run                                         With gc, only tell what would be deleted.
+  --profile                                         Print how long each phase took and the requests sent.
+                                                    SHBIN_TRACE=<path> logs them to a file as json lines.
 """
 
 __version__ = "0.4.0"
 
+# how long the repo and user metadata are used without revalidating them
+METADATA_TTL = 24 * 60 * 60
+
 
 class FakePath:
     """
     A wrapper on a PurePath object (ie it doesn’t actually access a filesystem)
-    with an explicity content in bytes.
+    with an explicity content in bytes, or a file object for contents too big to keep in memory.
     """
 
-    def __init__(self, *args, content=b""):
+    def __init__(self, *args, content=b"", fileobj=None):
         self._path = pathlib.PurePath(*args)
         self._content = content
+        self._fileobj = fileobj
 
     def read_bytes(self):
-        return self._content
+        if self._fileobj is None:
+            return self._content
+        with self.open() as f:
+            return f.read()
+
+    def open(self, mode="rb"):
+        if self._fileobj is None:
+            return io.BytesIO(self._content)
+        # a duplicated descriptor can be closed without closing our file object
+        self._fileobj.flush()
+        f = os.fdopen(os.dup(self._fileobj.fileno()), mode)
+        f.seek(0)
+        return f
+
+    def stat(self):
+        if self._fileobj is None:
+            return SimpleNamespace(st_size=len(self._content))
+        self._fileobj.flush()
+        return os.fstat(self._fileobj.fileno())
 
     def __getattr__(self, attr):
         return getattr(self._path, attr)
@@ -69,163 +145,669 @@ def get_repo_and_user():
             "Run [bold]shbin auth[/bold] to authenticate."
         )
         raise SystemExit(1)
-    gh = Github(token)
-    return gh.get_repo(repo), gh.get_user().login
+    install_transport(token)
+    from github import Github
+    from github.Repository import Repository
+
+    names = shards.parse(repo)
+    metadata = get_metadata(data, token, ",".join(names))
+    # our transport paces the requests (see transport.RateLimiter): PyGithub's own throttle
+    # would sleep between concurrent writes
+    github = Github(token, base_url=API_URL, seconds_between_requests=None, seconds_between_writes=None)
+    repos = [github.create_from_raw_data(Repository, metadata[key]) for key in repo_keys(len(names))]
+    # with several repos, each command picks the one holding its namespace
+    shards.register(dict(zip(names, repos)))
+    return repos[0], metadata["user"]
+
+
+def repo_keys(count):
+    """
+    Where the metadata of each repo is kept: "repo" for the first one, "repo1", "repo2"... for the others.
+    """
+    return ["repo"] + [f"repo{i}" for i in range(1, count)]
 
 
-def expand_paths(path_or_patterns):
+def get_metadata(config, token, repo):
     """
-    receive a list of relative paths or glob patterns and return an iterator of Path instances
+    Return the metadata of the `repo` (or the comma separated repos) and the user's login,
+    cached in the config.
+
+    Once METADATA_TTL expires, they are revalidated with conditional requests, that
+    GitHub answers with 304 (not counting against the rate limit) if nothing changed.
     """
-    patterns = []
-    for path_or_pattern in path_or_patterns:
-        if str(path_or_pattern).startswith("/"):
-            # if it's absolute, we assume it's a path
-            patterns.append([pathlib.Path(path_or_pattern)])
-        else:
-            patterns.append(pathlib.Path(".").glob(path_or_pattern))
+    # a different token or repo invalidates the cache
+    key = hashlib.sha256(f"{token}:{repo}".encode()).hexdigest()[:16]
+    metadata = config.get("metadata") or {}
+    if metadata.get("key") != key:
+        metadata = {"key": key}
+    elif time.time() - metadata.get("checked_at", 0) < METADATA_TTL:
+        return metadata
+
+    def revalidate(endpoint, name):
+        etag = metadata.get(f"{name}_etag")
+        response = transport.request("GET", f"{API_URL}{endpoint}", headers={"If-None-Match": etag} if etag else {})
+        if response.status_code != 304:
+            metadata[f"{name}_etag"] = response.headers.get("ETag")
+            return response.json()
+
+    names = shards.parse(repo)
+    endpoints = [f"/repos/{name}" for name in names] + ["/user"]
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as pool:
+        *repos_data, user_data = pool.map(revalidate, endpoints, repo_keys(len(names)) + ["user"])
+    for name, repo_data in zip(repo_keys(len(names)), repos_data):
+        if repo_data:
+            metadata[name] = {key: repo_data[key] for key in ("url", "html_url", "full_name", "name", "default_branch")}
+            metadata[name]["owner"] = {"login": repo_data["owner"]["login"]}
+    if user_data:
+        metadata["user"] = user_data["login"]
+    metadata["checked_at"] = time.time()
+    config["metadata"] = metadata
+    save_config(config)
+    return metadata
+
+
+def get_namespace(namespace, user, target_dir=None):
+    """
+    Resolve the namespace + target-dir (without ending slash).
+    It also interpolates {user}.
+    """
+    if namespace is None:
+        namespace = os.environ.get("SHBIN_NAMESPACE", "{user}")
+    namespace = namespace.format(user=user).rstrip("/")
+    if target_dir:
+        namespace += f"/{target_dir.rstrip('/')}"
+    return namespace
+
+
+def get_jobs(args):
+    """
+    Resolve the amount of concurrent requests from --jobs or SHBIN_JOBS.
+    """
+    value = args.get("--jobs") or os.environ.get("SHBIN_JOBS") or DEFAULT_JOBS
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise DocoptExit(f"--jobs must be a positive integer, got {value!r}")
+    transport.reserve(jobs)
+    return jobs
 
-    return itertools.chain.from_iterable(patterns)
 
+def get_image_quality(args):
+    """
+    Resolve how pasted images are recompressed, from --image-quality or SHBIN_IMAGE_QUALITY,
+    as (format, quality). None if they aren't.
+    """
+    from .image import parse_quality
 
-def get_extension(content):
+    value = args.get("--image-quality") or os.environ.get("SHBIN_IMAGE_QUALITY", "").strip()
+    if not value:
+        return None
     try:
-        import magic
-    except ImportError as e:
-        print(
-            f"[bold yellow]warning:[/bold yellow] check the README to correctly install python-magic. Import Error: {e}"
-        )
-        return ""
-        # Optionally could we detect a few formats in our own?
-        # for instance, images are easy https://stackoverflow.com/a/27670182/811740
-    else:
-        return guess_extension(magic.from_buffer(content, mime=True))
+        return parse_quality(value)
+    except ValueError as e:
+        raise DocoptExit(str(e))
+
+
+def recompress_paste(content, fileobj, image_quality):
+    """
+    Recompress the pasted `content` as `image_quality` asks, if it's an image. If the content is
+    in `fileobj`, `content` is its head.
+    Returns the content, its file object, and its extension before and after.
+    """
+    from .image import MAX_SIZE, RECOMPRESSED, recompress
+
+    trace.phase("sniff")
+    extension = get_extension(content)
+    if extension not in RECOMPRESSED:
+        return content, fileobj, extension, extension
+    data = content
+    if fileobj is not None:
+        if fileobj.seek(0, os.SEEK_END) > MAX_SIZE:
+            return content, fileobj, extension, extension
+        fileobj.seek(0)
+        data = fileobj.read()
+    trace.phase("recompress")
+    recompressed, new_extension = recompress(data, extension, *image_quality)
+    if recompressed is data:
+        return content, fileobj, extension, extension
+    if fileobj is not None:
+        fileobj.close()
+    return recompressed, None, extension, new_extension
+
+
+def read_stdin():
+    """
+    Read the standard input. Returns its head and, if it doesn't fit in memory comfortably,
+    a temporary file with the whole content.
+    """
+    head = sys.stdin.buffer.read(STREAM_THRESHOLD + 1)
+    if len(head) <= STREAM_THRESHOLD:
+        return head, None
+    fileobj = tempfile.TemporaryFile(prefix="shbin-")
+    fileobj.write(head)
+    shutil.copyfileobj(sys.stdin.buffer, fileobj, CHUNK_SIZE)
+    return head[:STREAM_THRESHOLD], fileobj
+
 
+def parse_url_or_path(url_or_path, full_name, branch):
+    """
+    Return the path in the repo of a github url or a path, and whether it's a directory.
+    """
+    url = re.match(rf"^https://github\.com/{full_name}/(blob|tree)/{branch}/(.*)", url_or_path)
+    path = url.group(2) if url else url_or_path
+    is_dir = path.endswith("/") or bool(url and url.group(1) == "tree")
+    return path.rstrip("/"), is_dir
 
-def download(url_or_path, repo, user):
+
+def download(
+    url_or_path, repo, user, jobs=DEFAULT_JOBS, cache=None, list_pack=False, resume=False, store=None, archive=False
+):
     """
     # download a file
     $ shbin dl https://github.com/Shiphero/pastebin/blob/main/bibo/AWS_API_fullfilment_methods/AWS_fulfillment_methods.ipynb
     $ shbin dl bibo/AWS_API_fullfilment_methods/AWS_fulfillment_methods.ipynb
 
-    # or a folder
-    $ shbin dl https://github.com/Shiphero/pastebin/blob/main/bibo/AWS_API_fullfilment_methods/
+    # or a folder, keeping its structure under a local directory with the same name
+    $ shbin dl https://github.com/Shiphero/pastebin/tree/main/bibo/AWS_API_fullfilment_methods/
     $ shbin dl bibo/AWS_API_fullfilment_methods/
+
+    # a pack is extracted into a local directory named like it. Or just list its files
+    $ shbin dl bibo/logs.pack.tar.gz --list
+
+    # a file stored in parts is downloaded by its name or its manifest
+    $ shbin dl bibo/dump.hprof
+    $ shbin dl bibo/dump.hprof.chunks.json
+
+    # continue a download that was interrupted. Files already downloaded are always skipped
+    $ shbin dl bibo/dumps/ --resume
+
+    # a whole namespace (or any big directory) in a single request
+    $ shbin dl bibo/ --archive
     """
-    path = re.sub(rf"^https://github\.com/{repo.full_name}/(blob|tree)/{repo.default_branch}/", "", url_or_path)
-    path = path.rstrip("/")
+    from github import GithubException
+
+    from .chunks import MANIFEST_SUFFIX, CorruptedDownload, download_chunked, is_manifest, parse_manifest
+    from .journal import Journal
+    from .pack import download_pack, is_pack
+
+    trace.phase("lookup")
+    path, is_dir = parse_url_or_path(url_or_path, repo.full_name, repo.default_branch)
     try:
-        content = repo.get_contents(path)
+        if archive:
+            trace.phase("download")
+            if not download_archive(repo, path):
+                print("[red]x[/red] content not found")
+            return
+        try:
+            # a directory is listed at once, no need to ask for its contents first
+            content = [] if is_dir else cached_content(path, cache, store) or repo.get_contents(path)
+        except GithubException as e:
+            if e.status != 404 or is_manifest(path):
+                raise
+            # a file stored in parts is found by its manifest
+            path = f"{path}{MANIFEST_SUFFIX}"
+            content = repo.get_contents(path)
+        trace.phase("download")
+        operation = {"operation": "download", "repo": repo.full_name, "path": path, "cwd": os.getcwd()}
         if isinstance(content, list):
-            # FIXME currently this will flatten the tree:
-            # suposse dir/foo.py and dir/subdir/bar.py
-            # Then `$ shbin dl dir` will get foo.py and bar.py in the same dir.
-            for content_file in content:
-                download(content_file.path, repo, user)
+            with Journal(operation, resume) as journal:
+                found = download_directory(repo, path, jobs, cache, journal, store)
+            if not found:
+                print("[red]x[/red] content not found")
+            return
+        target = pathlib.Path(pathlib.Path(path).name)
+        if is_pack(target.name):
+            return download_pack(repo, content.sha, target.name, list_pack)
+        data = parse_manifest(content.decoded_content) if is_manifest(target.name) else None
+        if data is not None:
+            target = pathlib.Path(pathlib.Path(data["name"]).name)
+            with Journal(operation, resume) as journal, ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+                download_chunked(repo, data, target, pool, journal, store)
+        elif target.is_file() and file_blob_sha(target) == content.sha:
+            print(f"[green]✓[/green] {target} is up to date")
             return
+        elif store is not None and store.get(content.sha, target):
+            # downloaded before
+            pass
         else:
-            content = content.decoded_content
-    except GithubException:
+            if content.encoding == "none" or content.size > STREAM_THRESHOLD:
+                # the contents api doesn't include files over 1MB
+                download_blob(repo, content.sha, target)
+            else:
+                target.write_bytes(content.decoded_content)
+            if store is not None:
+                store.add_file(content.sha, target)
+    except GithubException as e:
+        if e.status != 404:
+            raise
         print("[red]x[/red] content not found")
+    except (CorruptedDownload, TruncatedTree) as e:
+        print(f"[red]x[/red] {e}")
     else:
-        target = pathlib.Path(path).name
-        pathlib.Path(target).write_bytes(content)
         print(f"[green]✓[/green] downloaded {target}")
 
 
-def main(argv=None) -> None:
+def cached_content(path, cache, store):
+    """
+    The sha and size of the file `path` if the tree `cache` knows it and its content is
+    in the blob `store`, so it doesn't need to be fetched. Otherwise None.
+    """
+    from .chunks import is_manifest
+
+    if cache is None or store is None or is_manifest(path):
+        return None
+    cache.refresh(posixpath.dirname(path))
+    entry = cache.get(path)
+    if entry is None or store.touch(entry["sha"]) is None:
+        return None
+    return SimpleNamespace(sha=entry["sha"], size=entry["size"], encoding="none")
+
+
+def browse(args, repo, namespace):
+    """
+    # list the files in your namespace, or in any directory
+    $ shbin ls
+    $ shbin ls notebooks/project
+
+    # or ask GitHub for their sizes and last commits (author, date and message)
+    $ shbin ls -l notebooks/project
+
+    # search file names and commit messages (and contents, with SHBIN_INDEX_CONTENT=1)
+    $ shbin search aws fulfillment
+    """
+    from rich.markup import escape
+
+    from .index import Index
+
+    prefix = namespace if args["<namespace>"] is None else args["<namespace>"]
+    if args["ls"] and args["--list"]:
+        return long_list(shards.repo_for(repo, prefix), prefix)
+
+    # a directory is in a single repo, but a search looks into all of them
+    rows = []
+    for repo in [shards.repo_for(repo, prefix)] if args["ls"] else shards.all_repos(repo):
+        index = Index(repo, jobs=get_jobs(args))
+        try:
+            if args["--sync"] or index.is_stale():
+                index.sync()
+            if args["ls"]:
+                rows += [(path, date) for path, _, date, _ in index.list(prefix)]
+            else:
+                rows += index.search(" ".join(args["<query>"]))
+        finally:
+            index.close()
+
+    if not rows:
+        print("🤷 [bold]nothing found[/bold]")
+    for path, date, *found in rows:
+        line = f"[dim]{(date or '')[:10]:10}[/dim]  {escape(path)}"
+        if found:
+            message, snippet = found
+            if message:
+                line += f"  [dim]{escape(message.splitlines()[0])}[/dim]"
+            if snippet and "\x02" in snippet:
+                snippet = escape(" ".join(snippet.split())).replace("\x02", "[bold yellow]").replace("\x03", "[/]")
+                line += "\n" + " " * 12 + snippet
+        print(line)
+
+
+def long_list(repo, path):
+    """
+    Print the entries of the directory `path` with their size and last commit, a page at a time.
+    """
+    from rich.markup import escape
+
+    from .listing import long_listing
+
+    found = False
+    for page in long_listing(repo, path):
+        found = True
+        for entry in page:
+            commit = entry["commit"] or {"date": "", "author": "", "message": ""}
+            size = trace.format_size(entry["size"]) if entry["size"] is not None else ""
+            name = f"{entry['name']}/" if entry["type"] == "tree" else entry["name"]
+            print(
+                f"[dim]{commit['date'][:10]:10}[/dim]  {size:>9}  {escape(commit['author'][:16]):16}  "
+                f"{escape(name)}  [dim]{escape(commit['message'])}[/dim]"
+            )
+    if not found:
+        print("🤷 [bold]nothing found[/bold]")
+
+
+def main(argv=None, use_agent=True) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    # a running agent saves us the startup, the client setup and opening connections
+    exit_code = agent.forward(argv) if use_agent else None
+    if exit_code is not None:
+        if exit_code:
+            raise SystemExit(exit_code)
+        return
+
     args = docopt(__doc__ + usage, argv, version=__version__)
+    # the cpu time spent so far is roughly how long python took to start and import shbin.
+    # Within the agent (use_agent is false there) it's the agent's, and there was no startup.
+    started = time.perf_counter() - time.process_time() if use_agent else None
+    trace.enable(args["--profile"], started=started)
+    try:
+        run(args)
+    finally:
+        trace.finish()
+
 
+def run(args):
     if args["auth"]:
         do_auth()
         return
 
+    if args["agent"]:
+        return agent.serve()
+
+    trace.phase("config")
     repo, user = get_repo_and_user()
 
-    # resolves namespace + target-dir (without ending slash)
-    # it also interpolates {user}
-    namespace = args.get("--namespace")
-    if namespace is None:
-        namespace = os.environ.get("SHBIN_NAMESPACE", "{user}")
-    namespace = namespace.format(user=user).rstrip("/")
-    if args["--target-dir"]:
-        namespace += f"/{args['--target-dir'].rstrip('/')}"
+    namespace = get_namespace(args.get("--namespace"), user, args["--target-dir"])
+
+    if args["ls"] or args["search"]:
+        trace.phase("index")
+        return browse(args, repo, namespace)
+
+    if args["gc"]:
+        return collect_garbage(args, repo, namespace)
+
+    # with several repos, the one holding the namespace, or what's downloaded
+    repo = shards.repo_for(repo, args["<url_or_path>"] if args["dl"] else namespace)
+
+    cache = TreeCache(repo) if cache_enabled() else None
+
+    if args["watch"]:
+        return watch(args, repo, namespace, cache)
 
     if args["dl"]:
-        return download(args["<url_or_path>"], repo, user)
+        from .store import BlobStore, max_size
+        from .store import is_enabled as store_enabled
+
+        store = BlobStore(max_size=max_size()) if store_enabled() else None
+        return download(
+            args["<url_or_path>"],
+            repo,
+            user,
+            get_jobs(args),
+            cache,
+            list_pack=args["--list"],
+            resume=args["--resume"],
+            store=store,
+            archive=args["--archive"],
+        )
 
-    elif args["--from-clipboard"] or args["<path>"] == ["-"]:
+    # a random name can't clash with a file in the repo: no need to look at the tree first
+    random_name = not args["--file-name"] and bool(
+        args["--from-clipboard"] or args["<path>"] == ["-"] or args["--pack"]
+    )
+
+    if args["--from-clipboard"] or args["<path>"] == ["-"]:
+        trace.phase("read")
+        fileobj = None
         if args["--from-clipboard"]:
             try:
                 content = pyclip.paste()
             except pyclip.ClipboardSetupException as e:
                 raise DocoptExit(str(e))
         else:
-            content = sys.stdin.buffer.read()
+            content, fileobj = read_stdin()
+
+        extension = original = None
+        image_quality = get_image_quality(args)
+        if image_quality is not None:
+            content, fileobj, original, extension = recompress_paste(content, fileobj, image_quality)
 
         if args["--file-name"]:
             file_name = f"{args['--file-name']}"
+            if extension != original:
+                # converted to another format
+                file_name = str(pathlib.PurePath(file_name).with_suffix(extension))
         else:
-            extension = get_extension(content)
-            # TODO try autodectect extension via pygment if .txt was guessed.
+            if extension is None:
+                trace.phase("sniff")
+                extension = get_extension(content)
             file_name = f"{secrets.token_urlsafe(8)}{extension}"
-        files = [FakePath(file_name, content=content)]
+        files = [FakePath(file_name, content=content, fileobj=fileobj)]
     else:
-        files = list(expand_paths(args["<path>"]))
-        if args["--file-name"]:
+        trace.phase("expand")
+        files = list(expand_paths(args["<path>"], args["--exclude"]))
+        if args["--pack"]:
+            from .pack import pack_files
+
+            trace.phase("pack")
+            # --file-name names the pack
+            files = [pack_files(files, args["--file-name"])] if files else []
+        elif args["--file-name"]:
             if len(files) > 1:
                 raise DocoptExit("--file-name can only be used with a single file")
 
             file_name = args["--file-name"]
-            content = files[0].read_bytes()
-            files = [FakePath(file_name, content=content)]
+            if files[0].stat().st_size > STREAM_THRESHOLD:
+                files = [FakePath(file_name, fileobj=files[0].open("rb"))]
+            else:
+                files = [FakePath(file_name, content=files[0].read_bytes())]
 
     message = args["--message"] or ""
 
-    for path in files:
-        result = create_or_update(repo, path, namespace, message, args["--new"])
-
-    if not files:
+    total = len(files)
+    unchanged = []
+    if files and cache and not random_name:
+        trace.phase("cache")
+        cache.refresh(namespace)
+        if not args["--new"]:
+            files, unchanged = skip_unchanged(files, namespace, cache)
+
+    if files:
+        from .batch import commit_files
+
+        trace.phase("upload")
+    if total > 1:
+        if files:
+            with upload_journal(files, repo, namespace, args["--resume"]) as journal:
+                commit_files(repo, files, namespace, message, args["--new"], get_jobs(args), cache, journal)
+        url = f"{repo.html_url}/tree/{repo.default_branch}/{namespace}".rstrip("/")
+    elif unchanged:
+        from .chunks import stored_name
+
+        file_name = f"{namespace}/{stored_name(unchanged[0].name, unchanged[0].stat().st_size)}".lstrip("/")
+        url = f"{repo.html_url}/blob/{repo.default_branch}/{file_name}"
+    elif files and files[0].stat().st_size > STREAM_THRESHOLD:
+        # too big for the contents api: it's streamed as a blob
+        with upload_journal(files, repo, namespace, args["--resume"]) as journal:
+            (file_name,) = commit_files(repo, files, namespace, message, args["--new"], cache=cache, journal=journal)
+        url = f"{repo.html_url}/blob/{repo.default_branch}/{file_name}"
+    elif files:
+        result = create_or_update(repo, files[0], namespace, message, args["--new"], cache)
+        url = result["content"].html_url
+
+    if not total:
         print("🤷 [bold]no file was uploaded[/bold]")
     else:
-        url = result["content"].html_url.rpartition("/")[0] if len(files) > 1 else result["content"].html_url
+        if unchanged:
+            print(f"{len(files)} uploaded, {len(unchanged)} unchanged", file=sys.stderr)
         if args["--url-link-to-pages"]:
             content = url.partition(f"{repo.default_branch}/")[-1]
             url = f"https://{repo.owner.login.lower()}.github.io/{repo.name}/{content}"
 
+        trace.phase("clipboard")
         emoji = "🔗"
         try:
             if os.environ.get("SHBIN_COPY_URL", "").strip().lower() not in ("0", "false", "no"):
-                pyclip.copy(str(url))
+                if not agent.copy_in_client(str(url)):
+                    pyclip.copy(str(url))
                 emoji += "📋"
         except pyclip.ClipboardSetupException:
             pass
         print(f"{emoji} {url}")
 
 
-def create_or_update(repo, path, namespace, message, force_new):
-    file_content = path.read_bytes()
-    file_name = f"{namespace}/{path.name}".lstrip("/")
+def watch(args, repo, namespace, cache):
+    """
+    Upload the given files, and those that change afterwards, until interrupted.
+
+    $ shbin watch reports/ -d reports
+    $ shbin watch "logs/*.log" --debounce=10
+    """
+    from .watch import Watch
+
     try:
-        result = repo.create_file(file_name, message, file_content)
-    except GithubException:
-        # file already exists
-        if force_new:
-            new_path = f"{path.stem}_{secrets.token_urlsafe(8)}{path.suffix}"
-            print(
-                f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Creating as {new_path}.",
-                file=sys.stderr,
+        debounce = float(args["--debounce"])
+    except ValueError:
+        debounce = -1
+    if debounce < 0:
+        raise DocoptExit(f"--debounce must be a number of seconds, got {args['--debounce']!r}")
+    watcher = Watch(repo, args["<path>"], namespace, args["--message"] or "", args["--exclude"], get_jobs(args), cache)
+    watcher.run(debounce)
+
+
+def collect_garbage(args, repo, namespace):
+    """
+    Delete the files of your namespace (or matching the given globs) that break the retention
+    policy, as a single commit. When several rules are given, a file must break them all.
+
+    # see what would be deleted
+    $ shbin gc --older-than=90 --dry-run
+    $ shbin gc "*/logs" --larger-than=10MB --exclude="*.keep"
+    $ shbin gc "**" --quota=1GB
+    """
+    from rich.markup import escape
+
+    from .batch import delete_files
+    from .gc import collect, select
+    from .index import Index
+    from .store import parse_size
+
+    try:
+        older_than = float(args["--older-than"]) if args["--older-than"] is not None else None
+    except ValueError:
+        older_than = -1
+    if older_than is not None and older_than < 0:
+        raise DocoptExit(f"--older-than must be a number of days, got {args['--older-than']!r}")
+    sizes = {}
+    for option in ("--larger-than", "--quota"):
+        try:
+            sizes[option] = parse_size(args[option]) if args[option] is not None else None
+        except ValueError as e:
+            raise DocoptExit(f"{option}: {e}")
+    if older_than is None and sizes["--larger-than"] is None and sizes["--quota"] is None:
+        raise DocoptExit("gc needs --older-than, --larger-than or --quota")
+
+    patterns = args["<glob>"] or [namespace or "**"]
+    total_files = total_size = 0
+    for repo in shards.all_repos(repo):
+        trace.phase("index")
+        index = Index(repo, jobs=get_jobs(args))
+        try:
+            files = collect(
+                index, patterns, args["--exclude"], need_dates=older_than is not None or sizes["--quota"] is not None
             )
-            result = repo.create_file(f"{namespace}/{new_path}".lstrip("/"), message, file_content)
+        finally:
+            index.close()
+        selected = select(files, older_than, sizes["--larger-than"], sizes["--quota"])
+        for f in selected:
+            print(f"[dim]{(f['date'] or '')[:10]:10}[/dim]  {trace.format_size(f['size']):>9}  {escape(f['path'])}")
+        if selected and not args["--dry-run"]:
+            trace.phase("delete")
+            paths = [path for f in selected for path in [f["path"], *f["parts"]]]
+            message = args["--message"] or f"shbin gc: delete {len(selected)} files"
+            delete_files(repo, paths, message, TreeCache(repo) if cache_enabled() else None)
+        total_files += len(selected)
+        total_size += sum(f["size"] for f in selected)
+
+    if not total_files:
+        print("🤷 [bold]nothing to delete[/bold]")
+    elif args["--dry-run"]:
+        print(f"{total_files} files, {trace.format_size(total_size)} would be reclaimed", file=sys.stderr)
+    else:
+        print(f"[green]✓[/green] deleted {total_files} files, {trace.format_size(total_size)}", file=sys.stderr)
+
+
+def upload_journal(files, repo, namespace, resume):
+    """
+    The journal of an upload of local files into `namespace`, or nothing for content that can't
+    be read again (e.g. stdin).
+    """
+    from .journal import Journal
+
+    if any(isinstance(path, FakePath) for path in files):
+        return contextlib.nullcontext()
+    operation = {"operation": "upload", "repo": repo.full_name, "namespace": namespace, "cwd": os.getcwd()}
+    return Journal(operation, resume)
+
+
+def skip_unchanged(files, namespace, cache):
+    """
+    Split `files` into those that need to be uploaded and those whose content is already
+    in the repo, comparing their git blob sha (or their manifest's, for files stored in parts)
+    with the cached tree.
+    """
+    from .chunks import stored_name, stored_sha
 
+    changed, unchanged = [], []
+    for path in files:
+        size = path.stat().st_size
+        cached = cache.get(f"{namespace}/{stored_name(path.name, size)}".lstrip("/"))
+        if cached and cached["sha"] == stored_sha(path, size):
+            unchanged.append(path)
         else:
-            # TODO upload all the files in a single commit
-            contents = repo.get_contents(file_name)
-            print(
-                f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Updating it.",
-                file=sys.stderr,
-            )
-            result = repo.update_file(file_name, message, file_content, contents.sha)
+            changed.append(path)
+    return changed, unchanged
+
+
+def create_or_update(repo, path, namespace, message, force_new, cache=None):
+    from github import GithubException
+
+    file_content = path.read_bytes()
+    file_name = f"{namespace}/{path.name}".lstrip("/")
+    # an up to date tree tells beforehand if the file exists, so we don't need to fail first
+    cached = cache.get(file_name) if cache else None
+    sha = cached["sha"] if cached else None
+    if cached is None:
+        try:
+            result = repo.create_file(file_name, message, file_content)
+        except GithubException as e:
+            # 422 means the file already exists. Anything else is a real error.
+            if e.status != 422:
+                raise
+        else:
+            return record(cache, result, len(file_content))
+
+    if force_new:
+        new_path = f"{path.stem}_{secrets.token_urlsafe(8)}{path.suffix}"
+        print(
+            f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Creating as {new_path}.",
+            file=sys.stderr,
+        )
+        result = repo.create_file(f"{namespace}/{new_path}".lstrip("/"), message, file_content)
+    else:
+        print(
+            f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Updating it.",
+            file=sys.stderr,
+        )
+        try:
+            result = repo.update_file(file_name, message, file_content, sha or repo.get_contents(file_name).sha)
+        except GithubException as e:
+            # 409 means the cached sha is stale
+            if sha is None or e.status != 409:
+                raise
+            result = repo.update_file(file_name, message, file_content, repo.get_contents(file_name).sha)
+    return record(cache, result, len(file_content))
+
+
+def record(cache, result, size):
+    """
+    Keep the tree cache up to date with a file written through the contents API.
+    """
+    if cache is not None:
+        commit, content = result["commit"], result["content"]
+        entry = {"sha": content.sha, "size": size, "mode": "100644"}
+        cache.record(commit.parents[0].sha, commit.sha, {content.path: entry})
     return result
 
 
@@ -0,0 +1,285 @@
+"""
+An opt-in background process that runs shbin commands on behalf of the CLI.
+
+`shbin agent` keeps python, its imports and a pool of open connections to GitHub (with the rate
+limit it learned) alive between commands. While it runs, `shbin` sends its arguments, working
+directory, SHBIN_* variables and standard input over a unix socket and prints the output the agent
+streams back, skipping all of that setup. When no agent answers, the command runs as usual.
+Each command still builds its client from the cached metadata and loads the tree cache from disk,
+which doesn't take requests. The clipboard stays the CLI's: pasting from it (-x) isn't sent to the
+agent, and the agent has the CLI copy the URL.
+
+Commands run one at a time, in the order they arrive.
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import traceback
+
+from .auth import CONFIG_PATH
+
+# commands the agent doesn't run for the CLI (watch would keep it busy)
+LOCAL_COMMANDS = {"auth", "agent", "watch", "-h", "--help", "--version"}
+
+# the client the command running in the agent came from, if any
+_client = None
+
+
+def runs_locally(argv):
+    """
+    Tell if `argv` has to run in the CLI's process: a local command, or reading the clipboard,
+    which is the CLI's display's (the agent only gets its SHBIN_* variables).
+    """
+    if LOCAL_COMMANDS & set(argv) or "--from-clipboard" in argv:
+        return True
+    # -x, alone or with other short options (e.g. -nx)
+    return any(re.fullmatch(r"-[a-wyz]*x\S*", arg) for arg in argv)
+
+
+def socket_path():
+    return os.environ.get("SHBIN_AGENT_SOCKET") or str(CONFIG_PATH.parent / "agent.sock")
+
+
+def is_enabled():
+    """
+    Using a running agent can be disabled with SHBIN_AGENT=0 (or "false" or "no").
+    """
+    return os.environ.get("SHBIN_AGENT", "").strip().lower() not in ("0", "false", "no")
+
+
+def connect(path):
+    """
+    Return a socket connected to the agent listening on `path`, or None if none is.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # a socket left behind by an agent that didn't stop cleanly
+        sock.close()
+        return None
+    return sock
+
+
+def forward(argv):
+    """
+    Run the command `argv` in the agent, if one is running. Returns its exit code, or None
+    if the command has to run in this process.
+    """
+    if not is_enabled() or not argv or runs_locally(argv):
+        return None
+    sock = connect(socket_path())
+    if sock is None:
+        return None
+
+    streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+    with sock:
+        uses_stdin = "-" in argv
+        header = {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": {key: value for key, value in os.environ.items() if key.startswith("SHBIN_")},
+            "stdin": uses_stdin,
+            "tty": sys.stdout.isatty(),
+        }
+        sock.sendall(json.dumps(header).encode() + b"\n")
+        if uses_stdin:
+            with sock.makefile("wb") as f:
+                shutil.copyfileobj(sys.stdin.buffer, f)
+        sock.shutdown(socket.SHUT_WR)
+
+        with sock.makefile("rb") as f:
+            for line in f:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                if "clipboard" in message:
+                    import pyclip
+
+                    with contextlib.suppress(pyclip.ClipboardSetupException):
+                        pyclip.copy(message["clipboard"])
+                    continue
+                streams[message["stream"]].write(message["data"])
+                streams[message["stream"]].flush()
+    # the command may have been half done, so it's not run again here
+    print("shbin agent stopped before the command finished", file=streams["stderr"])
+    return 1
+
+
+def copy_in_client(text):
+    """
+    Within the agent, have the client copy `text` to its clipboard (the agent's display may not
+    be the client's) and return True. Returns False when not running a command for a client.
+    """
+    if _client is None:
+        return False
+    with contextlib.suppress(OSError):
+        _client.sendall(json.dumps({"clipboard": text}).encode() + b"\n")
+    return True
+
+
+class Stream(io.TextIOBase):
+    """
+    A text stream that sends what's written to the client, as json lines.
+    """
+
+    def __init__(self, conn, name, tty):
+        self.conn = conn
+        self.name = name
+        self.tty = tty
+        self.closed_by_client = False
+
+    def write(self, data):
+        if data and not self.closed_by_client:
+            try:
+                self.conn.sendall(json.dumps({"stream": self.name, "data": data}).encode() + b"\n")
+            except OSError:
+                self.closed_by_client = True
+        return len(data)
+
+    def isatty(self):
+        return self.tty
+
+
+@contextlib.contextmanager
+def client_context(header, stdin):
+    """
+    Run as the client would: in its working directory, with its SHBIN_* variables and its input.
+    """
+    cwd, environ, sys_stdin = os.getcwd(), dict(os.environ), sys.stdin
+    for key in [key for key in os.environ if key.startswith("SHBIN_")]:
+        del os.environ[key]
+    os.environ.update(header["env"])
+    os.chdir(header["cwd"])
+    sys.stdin = io.TextIOWrapper(stdin)
+    try:
+        yield
+    finally:
+        sys.stdin = sys_stdin
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def run_command(argv):
+    """
+    Run shbin with `argv`. Returns the exit code.
+    """
+    from . import main
+
+    try:
+        main(argv, use_agent=False)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def handle(conn):
+    """
+    Run the command a client sent through `conn`, streaming its output back.
+    """
+    global _client
+    with conn.makefile("rb") as f, tempfile.TemporaryFile() as stdin:
+        header = json.loads(f.readline())
+        if header["stdin"]:
+            shutil.copyfileobj(f, stdin)
+            stdin.seek(0)
+        stdout, stderr = Stream(conn, "stdout", header["tty"]), Stream(conn, "stderr", header["tty"])
+        with client_context(header, stdin), contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            _client = conn
+            try:
+                code = run_command(header["argv"])
+            finally:
+                _client = None
+    with contextlib.suppress(OSError):
+        conn.sendall(json.dumps({"exit": code}).encode() + b"\n")
+
+
+def listen(path):
+    """
+    Return a socket listening on `path`, which only the current user can connect to.
+    """
+    sock = connect(path)
+    if sock is not None:
+        sock.close()
+        raise SystemExit(f"an agent is already running on {path}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen(16)
+    return server
+
+
+def loop(server):
+    """
+    Handle the commands sent to `server` until it's closed.
+    """
+    while True:
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            try:
+                handle(conn)
+            except Exception:
+                # a broken client (or one in a directory we can't enter) doesn't stop the agent
+                traceback.print_exc()
+
+
+def warm_up():
+    """
+    Set up the client and open a connection to GitHub before the first command needs them.
+    """
+    from rich import print
+
+    from . import get_repo_and_user, transport
+
+    try:
+        get_repo_and_user()
+        # doesn't count against the rate limit, and tells how much of it is left
+        transport.request("GET", f"{transport.API_URL}/rate_limit").close()
+    except (SystemExit, Exception) as e:
+        print(f"[bold yellow]warning:[/bold yellow] the agent couldn't warm up: {e}", file=sys.stderr)
+
+
+def serve():
+    """
+    Run the agent until interrupted.
+    """
+    from rich import print
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("shbin agent needs unix sockets, not available in this platform")
+    path = socket_path()
+    server = listen(path)
+    try:
+        warm_up()
+        print(f"[green]✓[/green] shbin agent listening on {path}. Stop it with Ctrl+C.")
+        loop(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
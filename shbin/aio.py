@@ -0,0 +1,458 @@
+"""
+An asyncio API, to paste from bots and async services without blocking their event loop.
+
+    from shbin import aio
+
+    async with aio.Client() as client:
+        url = await client.upload(b"some log", file_name="error.log")
+        content = await client.download("messi/error.log")
+
+A client keeps a single pool of connections, so many pastes can be in flight at once on the
+same loop. The module level `upload()` and `download()` share a client per event loop.
+
+It needs httpx: `pip install shbin[async]`.
+"""
+
+import asyncio
+import base64
+import os
+import pathlib
+import posixpath
+import secrets
+import sys
+import time
+import weakref
+from urllib.parse import quote
+
+import httpx
+from github import GithubException
+from rich import print
+
+from . import FakePath, get_extension, get_namespace, parse_url_or_path, shards, trace
+from .auth import load_config
+from .batch import INLINE_MAX_SIZE, INLINE_MAX_TOTAL, MAX_ATTEMPTS, InlineBudget, as_inline_text
+from .blobs import CHUNK_SIZE, STREAM_THRESHOLD, Base64Body
+from .fetch import TruncatedTree
+from .transport import API_URL, DEFAULT_JOBS, MAX_RETRIES, MAX_WAIT, RETRY_STATUS, backoff, limiter, throttle_delay
+
+TIMEOUT = httpx.Timeout(60.0, connect=15.0)
+
+
+async def in_thread(func, *args):
+    """
+    Run the blocking `func` (e.g. reading a file) in the default executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class AsyncBase64Body:
+    """
+    A `Base64Body` for the async client. The file is read in a thread, chunk by chunk.
+    """
+
+    def __init__(self, fileobj, size):
+        self.body = Base64Body(fileobj, size)
+
+    def __len__(self):
+        return len(self.body)
+
+    async def __aiter__(self):
+        chunks = iter(self.body)
+        while (chunk := await in_thread(next, chunks, None)) is not None:
+            yield chunk
+
+
+class Client:
+    """
+    An async shbin client. `token` and `repo` default to the ones the command line uses.
+    `repo` can list several repos, comma separated: each file goes to the one holding its namespace.
+
+    An `httpx.AsyncClient` can be given to share its connections. Otherwise the client
+    creates its own, closed with `aclose()` or at the end of an `async with` block.
+    """
+
+    def __init__(self, token=None, repo=None, jobs=DEFAULT_JOBS, http=None):
+        config = load_config()
+        self.token = token or os.getenv("SHBIN_GITHUB_TOKEN", config.get("token"))
+        self.repo = repo or os.getenv("SHBIN_REPO", config.get("repo"))
+        if not self.token or not self.repo:
+            raise ValueError("Missing the token or repo: set SHBIN_GITHUB_TOKEN and SHBIN_REPO or run `shbin auth`")
+        self.jobs = jobs
+        self.http = http or httpx.AsyncClient(
+            timeout=TIMEOUT, limits=httpx.Limits(max_connections=4 * jobs, max_keepalive_connections=4 * jobs)
+        )
+        self.repos = shards.parse(self.repo)
+        self._own_http = http is None
+        # the metadata requests, by url, shared by concurrent calls
+        self._fetched = {}
+        # created on first use, as it must belong to the running loop
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._own_http:
+            await self.http.aclose()
+
+    async def request(self, method, url, stream=False, **kwargs):
+        """
+        Send a request to the api, paced and retried as `transport.send` does.
+        Errors are raised as `GithubException`, like PyGithub does.
+
+        With `stream=True` the body isn't read: the response must be closed with `aclose()`.
+        """
+        if url.startswith("/"):
+            url = f"{API_URL}{url}"
+        headers = {
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github+json",
+            **kwargs.pop("headers", {}),
+        }
+        for attempt in range(MAX_RETRIES + 1):
+            delay = limiter.delay()
+            if delay > 1:
+                print(
+                    f"[bold yellow]warning:[/bold yellow] waiting {delay:.0f}s for GitHub's rate limit", file=sys.stderr
+                )
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                # a body is sent from the start on every attempt
+                start = time.perf_counter()
+                request = self.http.build_request(method, url, headers=headers, **kwargs)
+                response = await self.http.send(request, stream=stream)
+            except httpx.TransportError as e:
+                trace.request(method, url, type(e).__name__, 0, 0, time.perf_counter() - start)
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(backoff(attempt))
+                continue
+
+            if trace.is_enabled():
+                received = response.headers.get("Content-Length") if stream else len(response.content)
+                sent = int(request.headers.get("Content-Length") or 0)
+                elapsed = time.perf_counter() - start
+                trace.request(method, url, response.status_code, sent, int(received or 0), elapsed, response.headers)
+            limiter.update(response.headers)
+            if response.status_code in (403, 429):
+                await response.aread()
+            throttled = throttle_delay(response)
+            if throttled is not None and throttled <= MAX_WAIT and attempt < MAX_RETRIES:
+                # everybody waits, not only this request
+                limiter.block(max(throttled, backoff(attempt)))
+            elif response.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+                await asyncio.sleep(backoff(attempt))
+            else:
+                break
+            await response.aclose()
+
+        if response.status_code >= 400:
+            await response.aread()
+            try:
+                data = response.json()
+            except ValueError:
+                data = response.text
+            raise GithubException(response.status_code, data, dict(response.headers))
+        return response
+
+    async def fetch_once(self, url):
+        """
+        Return the json at `url`, requested once per client: concurrent calls share the request.
+        """
+        if url not in self._fetched:
+            self._fetched[url] = asyncio.ensure_future(self.request("GET", url))
+        try:
+            return (await self._fetched[url]).json()
+        except Exception:
+            # asked again next time
+            self._fetched.pop(url, None)
+            raise
+
+    async def user(self):
+        return (await self.fetch_once("/user"))["login"]
+
+    async def metadata(self, url_or_path=""):
+        """
+        Return the repo holding `url_or_path` (a path, or a github url) and the user's login.
+        """
+        name = shards.name_for(self.repos, url_or_path)
+        repo, user = await asyncio.gather(self.fetch_once(f"/repos/{name}"), self.user())
+        return repo, user
+
+    async def limited(self, coro):
+        """
+        Await `coro` with no more than `jobs` of them in flight.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.jobs)
+        async with self._slots:
+            return await coro
+
+    async def upload(self, files, namespace=None, message="", force_new=False, file_name=None):
+        """
+        Upload `files` and return the url to see them.
+
+        `files` is either the content to paste (bytes) or a path or list of paths.
+        A content is named `file_name`, or gets a random name with a guessed extension.
+        Paths are uploaded with their own name, unless a single one is renamed with `file_name`.
+        """
+        namespace = get_namespace(namespace, await self.user())
+        repo, _ = await self.metadata(namespace)
+        html_url, branch = repo["html_url"], repo["default_branch"]
+
+        opened = []
+        if isinstance(files, bytes):
+            name = file_name or f"{secrets.token_urlsafe(8)}{get_extension(files)}"
+            files = [FakePath(name, content=files)]
+        else:
+            files = [pathlib.Path(files)] if isinstance(files, (str, os.PathLike)) else [pathlib.Path(f) for f in files]
+            if file_name:
+                if len(files) > 1:
+                    raise ValueError("file_name can only be used with a single file")
+                if files[0].stat().st_size > STREAM_THRESHOLD:
+                    opened.append(files[0].open("rb"))
+                    files = [FakePath(file_name, fileobj=opened[0])]
+                else:
+                    files = [FakePath(file_name, content=await in_thread(files[0].read_bytes))]
+        try:
+            if len(files) > 1:
+                await self.commit_files(repo, files, namespace, message, force_new)
+                return f"{html_url}/tree/{branch}/{namespace}".rstrip("/")
+            if files[0].stat().st_size > STREAM_THRESHOLD:
+                # too big for the contents api: it's streamed as a blob
+                (path,) = await self.commit_files(repo, files, namespace, message, force_new)
+            else:
+                path = await self.create_or_update(repo, files[0], namespace, message, force_new)
+            return f"{html_url}/blob/{branch}/{path}"
+        finally:
+            for f in opened:
+                f.close()
+
+    async def create_or_update(self, repo, path, namespace, message, force_new):
+        """
+        Write a single file through the contents API. Returns its path in the repo.
+        """
+        content = await in_thread(path.read_bytes)
+        body = {"message": message, "content": base64.b64encode(content).decode("ascii")}
+        file_name = f"{namespace}/{path.name}".lstrip("/")
+        url = f"{repo['url']}/contents/{quote(file_name)}"
+        try:
+            await self.request("PUT", url, json=body)
+            return file_name
+        except GithubException as e:
+            # 422 means the file already exists. Anything else is a real error.
+            if e.status != 422:
+                raise
+
+        if force_new:
+            new_path = f"{path.stem}_{secrets.token_urlsafe(8)}{path.suffix}"
+            print(
+                f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Creating as {new_path}.",
+                file=sys.stderr,
+            )
+            file_name = f"{namespace}/{new_path}".lstrip("/")
+            await self.request("PUT", f"{repo['url']}/contents/{quote(file_name)}", json=body)
+            return file_name
+
+        print(f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Updating it.", file=sys.stderr)
+        current = await self.request("GET", url, params={"ref": repo["default_branch"]})
+        await self.request("PUT", url, json={**body, "sha": current.json()["sha"]})
+        return file_name
+
+    async def commit_files(self, repo, files, namespace, message, force_new=False):
+        """
+        Upload `files` into `namespace` as a single commit, like `batch.commit_files`.
+        Returns the list of paths written in the repo.
+        """
+        git = f"{repo['url']}/git"
+        ref = f"refs/heads/{repo['default_branch']}"
+        head = (await self.request("GET", f"{git}/{ref}")).json()["object"]["sha"]
+        parent = (await self.request("GET", f"{git}/commits/{head}")).json()
+
+        file_names = [f"{namespace}/{path.name}".lstrip("/") for path in files]
+        # existing files are renamed with `force_new`, and updated with a warning otherwise
+        existing = await self.existing_files(repo, parent["tree"]["sha"], namespace, file_names)
+
+        paths = []
+        for path, file_name in zip(files, file_names):
+            if file_name in existing and not force_new:
+                print(f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Updating it.", file=sys.stderr)
+            elif file_name in existing:
+                new_path = f"{path.stem}_{secrets.token_urlsafe(8)}{path.suffix}"
+                print(
+                    f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Creating as {new_path}.",
+                    file=sys.stderr,
+                )
+                file_name = f"{namespace}/{new_path}".lstrip("/")
+            paths.append(file_name)
+
+        budget = InlineBudget(INLINE_MAX_TOTAL)
+        elements = await asyncio.gather(
+            *(self.limited(self.tree_element(git, path, file_name, budget)) for path, file_name in zip(files, paths))
+        )
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            tree = await self.request(
+                "POST", f"{git}/trees", json={"base_tree": parent["tree"]["sha"], "tree": elements}
+            )
+            commit = await self.request(
+                "POST",
+                f"{git}/commits",
+                json={"message": message, "tree": tree.json()["sha"], "parents": [parent["sha"]]},
+            )
+            try:
+                await self.request("PATCH", f"{git}/{ref}", json={"sha": commit.json()["sha"]})
+            except GithubException as e:
+                # 422 means it's not a fast-forward anymore: someone pushed meanwhile.
+                if e.status != 422 or attempt == MAX_ATTEMPTS:
+                    raise
+                head = (await self.request("GET", f"{git}/{ref}")).json()["object"]["sha"]
+                parent = (await self.request("GET", f"{git}/commits/{head}")).json()
+            else:
+                break
+        return paths
+
+    async def existing_files(self, repo, root, namespace, file_names):
+        """
+        Return which of `file_names` exist in the tree `root`, like `batch.existing_files`.
+        """
+        trees = f"{repo['url']}/git/trees"
+        sha = await self.tree_sha(repo, namespace, root)
+        if sha is None:
+            return set()
+        tree = (await self.request("GET", f"{trees}/{sha}", params={"recursive": "1"})).json()
+        prefix = f"{namespace}/".lstrip("/")
+        listed = {f"{prefix}{element['path']}" for element in tree["tree"]}
+        if tree.get("truncated"):
+            listed = set()
+            for directory in {posixpath.dirname(file_name) for file_name in file_names}:
+                sha = await self.tree_sha(repo, directory, root)
+                if sha is not None:
+                    entries = (await self.request("GET", f"{trees}/{sha}")).json()["tree"]
+                    listed.update(posixpath.join(directory, element["path"]) for element in entries)
+        return listed & set(file_names)
+
+    async def tree_element(self, git, path, file_name, budget):
+        """
+        Return the tree element for `path`, creating a blob if it can't go inline.
+        """
+        element = {"path": file_name, "mode": "100644", "type": "blob"}
+        size = path.stat().st_size
+        if size > STREAM_THRESHOLD:
+            with path.open("rb") as f:
+                body = AsyncBase64Body(f, size)
+                response = await self.request(
+                    "POST",
+                    f"{git}/blobs",
+                    content=body,
+                    headers={"Content-Type": "application/json", "Content-Length": str(len(body))},
+                )
+            return {**element, "sha": response.json()["sha"]}
+
+        content = await in_thread(path.read_bytes)
+        text = as_inline_text(content) if len(content) <= INLINE_MAX_SIZE else None
+        if text is not None and budget.take(len(content)):
+            return {**element, "content": text}
+        body = {"content": base64.b64encode(content).decode("ascii"), "encoding": "base64"}
+        response = await self.request("POST", f"{git}/blobs", json=body)
+        return {**element, "sha": response.json()["sha"]}
+
+    async def download(self, url_or_path, target=None):
+        """
+        Download a file, or a directory if `url_or_path` ends with a slash or is a tree url.
+
+        A file is returned as bytes, unless a `target` path is given to write it into.
+        A directory is written into `target` (by default a local directory with its name),
+        keeping its structure, and the list of written files is returned.
+        """
+        repo, _ = await self.metadata(url_or_path)
+        path, is_dir = parse_url_or_path(url_or_path, repo["full_name"], repo["default_branch"])
+        if is_dir:
+            root = pathlib.Path(target or pathlib.PurePosixPath(path).name)
+            blobs = await self.list_blobs(repo, path)
+            return await asyncio.gather(
+                *(
+                    self.limited(self.fetch(f"{repo['url']}/git/blobs/{sha}", root.joinpath(*relative.split("/"))))
+                    for relative, sha in blobs
+                )
+            )
+        # the raw media type serves files up to 100 MB
+        return await self.fetch(f"{repo['url']}/contents/{quote(path)}", target, {"ref": repo["default_branch"]})
+
+    async def fetch(self, url, target=None, params=None):
+        """
+        Return the raw content at `url` or, if a `target` is given, stream it into that path.
+        """
+        headers = {"Accept": "application/vnd.github.raw"}
+        if target is None:
+            return (await self.request("GET", url, params=params, headers=headers)).content
+
+        target = pathlib.Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(f"{target.name}.part")
+        response = await self.request("GET", url, stream=True, params=params, headers=headers)
+        try:
+            with open(partial, "wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await in_thread(f.write, chunk)
+        finally:
+            await response.aclose()
+        os.replace(partial, target)
+        return target
+
+    async def tree_sha(self, repo, path, root=None):
+        """
+        Return the sha of the tree at `path`, like `fetch.tree_sha` does.
+        """
+        sha = root or repo["default_branch"]
+        for name in filter(None, path.split("/")):
+            tree = (await self.request("GET", f"{repo['url']}/git/trees/{sha}")).json()["tree"]
+            sha = next((e["sha"] for e in tree if e["path"] == name and e["type"] == "tree"), None)
+            if sha is None:
+                return None
+        return sha
+
+    async def list_blobs(self, repo, path):
+        """
+        Return the files under the directory `path` as (relative path, blob sha) pairs,
+        like `fetch.list_blobs` does.
+        """
+        trees = f"{repo['url']}/git/trees"
+        sha = await self.tree_sha(repo, path)
+        if sha is None:
+            return []
+        tree = (await self.request("GET", f"{trees}/{sha}", params={"recursive": "1"})).json()
+        if tree.get("truncated"):
+            raise TruncatedTree(f"{path or 'the repository'} has too many files to be listed")
+        return [(e["path"], e["sha"]) for e in tree["tree"] if e["type"] == "blob"]
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Return the client shared by the module level functions in the running loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = Client()
+    return _clients[loop]
+
+
+async def upload(files, namespace=None, message="", force_new=False, file_name=None):
+    """
+    `Client.upload` through the shared client.
+    """
+    return await get_client().upload(files, namespace, message, force_new, file_name)
+
+
+async def download(url_or_path, target=None):
+    """
+    `Client.download` through the shared client.
+    """
+    return await get_client().download(url_or_path, target)
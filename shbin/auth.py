@@ -6,12 +6,10 @@ import json
 import sys
 import time
 import webbrowser
-import requests
 
 import pyclip
 from platformdirs import user_config_path
 from rich import print
-from rich.prompt import Prompt
 
 GITHUB_CLIENT_ID = "Ov23liYdj3oj4CUOqEds"
 GITHUB_SCOPES = ["read:user", "repo"]
@@ -50,6 +48,8 @@ def device_flow_auth(client_id, scopes):
     Performs a minimal device-flow to get an OAuth token from GitHub.
     Returns the token, or None if it fails/times out.
     """
+    import requests
+
     # 1) Request the device code
     auth_url = "https://github.com/login/device/code"
     data = {
@@ -114,6 +114,8 @@ def device_flow_auth(client_id, scopes):
 
 
 def do_auth():
+    from rich.prompt import Prompt
+
     token = device_flow_auth(GITHUB_CLIENT_ID, GITHUB_SCOPES)
     if not token:
         sys.exit("[red]x[/red]No token acquired. Exiting.")
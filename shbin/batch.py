@@ -0,0 +1,253 @@
+"""
+Uploads several files in a single commit through the Git Data API.
+"""
+
+import base64
+import posixpath
+import secrets
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from github import GithubException, InputGitTreeElement
+from rich import print
+
+from . import transport
+from .blobs import STREAM_THRESHOLD, upload_blob
+from .cache import git_blob_sha
+from .fetch import tree_sha
+from .chunks import (
+    CHUNKED_THRESHOLD,
+    MANIFEST_SUFFIX,
+    manifest,
+    manifest_content,
+    part_ranges,
+    stored_name,
+    upload_part,
+)
+from .journal import file_key
+from .transport import DEFAULT_JOBS
+
+# small text files travel inline in the tree request, so they don't need a blob request of their own.
+INLINE_MAX_SIZE = 64 * 1024
+INLINE_MAX_TOTAL = 1024 * 1024
+
+# how many times we rebuild the commit if the branch moved while we were uploading
+MAX_ATTEMPTS = 3
+
+
+class InlineBudget:
+    """
+    Thread safe counter of the bytes we still can send inline in the tree request.
+    """
+
+    def __init__(self, total):
+        self.left = total
+        self._lock = threading.Lock()
+
+    def take(self, size):
+        with self._lock:
+            if size > self.left:
+                return False
+            self.left -= size
+            return True
+
+
+def commit_files(repo, files, namespace, message, force_new=False, jobs=DEFAULT_JOBS, cache=None, journal=None):
+    """
+    Upload `files` into `namespace` as a single commit on the default branch.
+
+    The amount of requests is roughly constant: get the branch and its head commit,
+    one blob per binary or big file, then a tree, a commit and the ref update.
+    Blobs are read, encoded and sent by a pool of `jobs` threads.
+    Existing files are updated, or created with a random suffix with `force_new`. The tree `cache`,
+    if given and up to date, tells which files exist (otherwise the namespace's tree is listed)
+    and is updated with the commit.
+    With a `journal`, blobs uploaded by a previous, interrupted, run of the same upload are reused.
+    Returns the list of paths written in the repo.
+    """
+    ref = repo.get_git_ref(f"heads/{repo.default_branch}")
+    parent = repo.get_git_commit(ref.object.sha)
+
+    sizes = [path.stat().st_size for path in files]
+    # a file too big for a blob is stored in parts, described by a manifest
+    suffixes = [MANIFEST_SUFFIX if size > CHUNKED_THRESHOLD else "" for size in sizes]
+    file_names = [f"{namespace}/{stored_name(path.name, size)}".lstrip("/") for path, size in zip(files, sizes)]
+    # existing files are renamed with `force_new`, and updated with a warning otherwise
+    if cache is not None and all(cache.covers(file_name) for file_name in file_names):
+        existing = {file_name for file_name in file_names if cache.get(file_name)}
+    else:
+        existing = existing_files(repo, parent.tree.sha, namespace, file_names)
+
+    paths = []
+    for path, file_name, suffix in zip(files, file_names, suffixes):
+        if file_name in existing and not force_new:
+            print(f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Updating it.", file=sys.stderr)
+        elif file_name in existing:
+            new_path = f"{path.stem}_{secrets.token_urlsafe(8)}{path.suffix}"
+            print(
+                f"[bold yellow]warning:[/bold yellow] {path.name} already exists. Creating as {new_path}.",
+                file=sys.stderr,
+            )
+            file_name = f"{namespace}/{new_path}{suffix}".lstrip("/")
+        paths.append(file_name)
+
+    # every part is a task of its own, so the parts of a file are uploaded concurrently too
+    budget = InlineBudget(INLINE_MAX_TOTAL)
+    tasks = []
+    for path, file_name, size in zip(files, paths, sizes):
+        if size > CHUNKED_THRESHOLD:
+            tasks.extend(
+                partial(journaled, journal, path, offset, length, upload_part, repo, path, offset, length)
+                for offset, length in part_ranges(size)
+            )
+        else:
+            tasks.append(partial(tree_element, repo, path, file_name, budget, journal))
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = iter(list(pool.map(lambda task: task(), tasks)))
+
+    elements, entries = [], {}
+    for file_name, size in zip(paths, sizes):
+        if size > CHUNKED_THRESHOLD:
+            parts = [(next(results), length) for _, length in part_ranges(size)]
+            for element, path, entry in chunked_elements(file_name, size, parts):
+                elements.append(element)
+                entries[path] = entry
+        else:
+            element, entries[file_name] = next(results)
+            elements.append(element)
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        tree = repo.create_git_tree(elements, parent.tree)
+        commit = repo.create_git_commit(message, tree, [parent])
+        try:
+            ref.edit(commit.sha)
+        except GithubException as e:
+            # 422 means it's not a fast-forward anymore: someone pushed meanwhile.
+            if e.status != 422 or attempt == MAX_ATTEMPTS:
+                raise
+            ref = repo.get_git_ref(f"heads/{repo.default_branch}")
+            parent = repo.get_git_commit(ref.object.sha)
+        else:
+            break
+    if cache is not None:
+        cache.record(parent.sha, commit.sha, entries)
+    return paths
+
+
+def existing_files(repo, root, namespace, file_names):
+    """
+    Return which of `file_names` exist in the tree `root`, listing only the subtree of `namespace`.
+    If it has too many files for GitHub to list them all, the directory of each file is listed instead.
+    """
+    sha = tree_sha(repo, namespace, root)
+    if sha is None:
+        return set()
+    tree = repo.get_git_tree(sha, recursive=True)
+    prefix = f"{namespace}/".lstrip("/")
+    listed = {f"{prefix}{element.path}" for element in tree.tree}
+    if tree.truncated:
+        listed = set()
+        for directory in {posixpath.dirname(file_name) for file_name in file_names}:
+            sha = tree_sha(repo, directory, root)
+            if sha is not None:
+                listed.update(posixpath.join(directory, element.path) for element in repo.get_git_tree(sha).tree)
+    return listed & set(file_names)
+
+
+def delete_files(repo, paths, message, cache=None):
+    """
+    Delete `paths` from the default branch as a single commit: a tree without them,
+    a commit and the ref update, whatever the amount of files.
+    Returns the sha of the commit, or None if there was nothing to delete.
+    """
+    if not paths:
+        return None
+    git = f"{repo.url}/git"
+    # an entry with a null sha removes the path. It's sent as is: old PyGithub releases refuse it.
+    tree = [{"path": path, "mode": "100644", "type": "blob", "sha": None} for path in paths]
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        parent = transport.request("GET", f"{git}/ref/heads/{repo.default_branch}").json()["object"]["sha"]
+        base_tree = transport.request("GET", f"{git}/commits/{parent}").json()["tree"]["sha"]
+        new_tree = transport.request("POST", f"{git}/trees", json={"base_tree": base_tree, "tree": tree}).json()
+        body = {"message": message, "tree": new_tree["sha"], "parents": [parent]}
+        commit = transport.request("POST", f"{git}/commits", json=body).json()["sha"]
+        try:
+            transport.request("PATCH", f"{git}/refs/heads/{repo.default_branch}", json={"sha": commit})
+        except GithubException as e:
+            # 422 means it's not a fast-forward anymore: someone pushed meanwhile.
+            if e.status != 422 or attempt == MAX_ATTEMPTS:
+                raise
+        else:
+            break
+    if cache is not None:
+        cache.record(parent, commit, dict.fromkeys(paths))
+    return commit
+
+
+def journaled(journal, path, offset, size, task, *args):
+    """
+    Run `task(*args)` to upload `size` bytes of `path` from `offset`, unless the `journal`
+    (if any) has the sha they were uploaded as already.
+    """
+    if journal is None:
+        return task(*args)
+    return journal.run(file_key(path, offset, size), task, *args)
+
+
+def tree_element(repo, path, file_name, budget, journal=None):
+    """
+    Read `path` and return the tree element for it, creating a blob if it can't go inline,
+    along with its entry for the tree cache. Big files are streamed, so they are never
+    fully loaded in memory.
+    """
+    size = path.stat().st_size
+    if size > STREAM_THRESHOLD:
+        sha = journaled(journal, path, 0, size, stream_blob, repo, path, size)
+        element = InputGitTreeElement(file_name, "100644", "blob", sha=sha)
+        return element, {"sha": sha, "size": size, "mode": "100644"}
+
+    content = path.read_bytes()
+    entry = {"sha": git_blob_sha(content), "size": len(content), "mode": "100644"}
+    text = as_inline_text(content) if len(content) <= INLINE_MAX_SIZE else None
+    if text is not None and budget.take(len(content)):
+        return InputGitTreeElement(file_name, "100644", "blob", content=text), entry
+    # a blob with this content is already in the repo: no need to create it again
+    sha = entry["sha"] if journal is not None and journal.get(entry["sha"]) else None
+    if sha is None:
+        sha = repo.create_git_blob(base64.b64encode(content).decode("ascii"), "base64").sha
+        if journal is not None:
+            journal.record(sha)
+    return InputGitTreeElement(file_name, "100644", "blob", sha=sha), entry
+
+
+def stream_blob(repo, path, size):
+    with path.open("rb") as f:
+        return upload_blob(repo, f, size)
+
+
+def chunked_elements(manifest_path, size, parts):
+    """
+    Yield (tree element, path, cache entry) for the parts of a chunked file and its manifest,
+    given the parts as (blob sha, size) pairs.
+    """
+    directory, name = posixpath.split(manifest_path[: -len(MANIFEST_SUFFIX)])
+    data = manifest(name, size, parts)
+    for part in data["parts"]:
+        path = posixpath.join(directory, part["path"])
+        element = InputGitTreeElement(path, "100644", "blob", sha=part["sha"])
+        yield element, path, {"sha": part["sha"], "size": part["size"], "mode": "100644"}
+    content = manifest_content(name, size, parts)
+    entry = {"sha": git_blob_sha(content.encode()), "size": len(content), "mode": "100644"}
+    yield InputGitTreeElement(manifest_path, "100644", "blob", content=content), manifest_path, entry
+
+
+def as_inline_text(content):
+    """
+    Return `content` as str if it can be sent inline in a tree, or None if it needs a blob.
+    """
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
@@ -0,0 +1,75 @@
+"""
+Streams big blobs from and to GitHub with bounded memory.
+
+PyGithub needs the whole content in memory (plus its base64 copy) and the contents API
+doesn't serve files over 1 MB, so big files go through the blobs API in chunks.
+"""
+
+import base64
+import os
+
+from . import transport
+
+# files bigger than this are streamed instead of loaded in memory
+STREAM_THRESHOLD = 1024 * 1024
+
+# a multiple of 3, so every chunk is encoded without base64 padding
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+class Base64Body:
+    """
+    An iterable JSON body for the blobs API that base64 encodes `fileobj` chunk by chunk.
+    It knows its length beforehand, so the request is sent with a Content-Length.
+    """
+
+    head = b'{"encoding": "base64", "content": "'
+    tail = b'"}'
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.size = size
+
+    def __len__(self):
+        return len(self.head) + 4 * ((self.size + 2) // 3) + len(self.tail)
+
+    def __iter__(self):
+        # from the start, so the request can be retried
+        self.fileobj.seek(0)
+        yield self.head
+        while chunk := self.fileobj.read(CHUNK_SIZE):
+            yield base64.b64encode(chunk)
+        yield self.tail
+
+
+def upload_blob(repo, fileobj, size):
+    """
+    Create a blob with the content of `fileobj` (`size` bytes long) and return its sha.
+    """
+    response = transport.request(
+        "POST",
+        f"{repo.url}/git/blobs",
+        data=Base64Body(fileobj, size),
+        headers={"Content-Type": "application/json", "Accept": "application/vnd.github+json"},
+    )
+    return response.json()["sha"]
+
+
+def download_blob(repo, sha, target):
+    """
+    Write the content of the blob `sha` into the path `target`, chunk by chunk.
+
+    The content is written in a temporary file next to `target`, which is renamed once complete.
+    """
+    partial = target.with_name(f"{target.name}.part")
+    with transport.request(
+        "GET",
+        f"{repo.url}/git/blobs/{sha}",
+        headers={"Accept": "application/vnd.github.raw"},
+        stream=True,
+    ) as response:
+        with open(partial, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+    os.replace(partial, target)
+    return target
@@ -0,0 +1,198 @@
+"""
+A local cache of the repository tree: which files exist under a namespace, with their blob sha,
+size and mode. It lets us decide locally whether a file has to be created, updated or renamed.
+
+The cache is validated with a conditional request on the branch ref: while nobody pushes,
+GitHub answers 304 Not Modified, which doesn't count against the rate limit.
+"""
+
+import hashlib
+import json
+import os
+
+from . import transport
+from .auth import CONFIG_PATH
+
+CACHE_DIR = CONFIG_PATH.parent / "cache"
+
+
+def is_enabled():
+    """
+    The cache can be disabled with SHBIN_CACHE=0 (or "false" or "no").
+    """
+    return os.environ.get("SHBIN_CACHE", "").strip().lower() not in ("0", "false", "no")
+
+
+def git_blob_sha(content):
+    """
+    The id git gives to a blob with `content`, the same GitHub reports for it.
+    """
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def file_blob_sha(path, chunk_size=1024 * 1024):
+    """
+    Like `git_blob_sha`, for the file at `path`, reading it in chunks.
+    """
+    with path.open("rb") as f:
+        digest = hashlib.sha1(b"blob %d\0" % path.stat().st_size)
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TreeCache:
+    """
+    The tree of some prefixes (namespaces or directories) of the repo's default branch,
+    persisted as json in CACHE_DIR.
+    """
+
+    def __init__(self, repo, path=None):
+        self.repo = repo
+        self.path = path or CACHE_DIR / f"{repo.full_name.replace('/', '@')}.json"
+        try:
+            self.data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault("trees", {})
+
+    @property
+    def head(self):
+        return self.data.get("head")
+
+    def api(self, path, **kwargs):
+        return transport.request("GET", f"{self.repo.url}/git/{path}", **kwargs)
+
+    def refresh(self, prefix=""):
+        """
+        Make sure the entries under `prefix` are those of the branch head.
+
+        When the branch didn't move, this costs a single request answered with 304.
+        Otherwise only the trees that changed on the way down to `prefix` are fetched.
+        """
+        prefix = prefix.strip("/")
+        etag = self.data.get("etag")
+        response = self.api(
+            f"ref/heads/{self.repo.default_branch}",
+            headers={"If-None-Match": etag} if etag else {},
+        )
+        modified = response.status_code != 304
+        if modified:
+            self.data["etag"] = response.headers.get("ETag")
+            self.data["head"] = response.json()["object"]["sha"]
+
+        cached = self.data["trees"].get(prefix)
+        if cached and cached["commit"] == self.head:
+            if modified:
+                self.save()
+            return
+
+        # the trees endpoint resolves the head commit to its root tree
+        sha = self.resolve(prefix) if prefix else self.head
+        if sha is None:
+            # the prefix doesn't exist (yet)
+            entries = {}
+        elif cached and cached["sha"] == sha:
+            entries = cached["entries"]
+        else:
+            tree = self.api(f"trees/{sha}", params={"recursive": "1"}).json()
+            sha = tree["sha"]
+            if tree.get("truncated"):
+                # we can't tell which files are missing. Better not cache anything.
+                self.data["trees"].pop(prefix, None)
+                self.save()
+                return
+            entries = {
+                e["path"]: {"sha": e["sha"], "size": e.get("size", 0), "mode": e["mode"]}
+                for e in tree["tree"]
+                if e["type"] == "blob"
+            }
+        self.data["trees"][prefix] = {"commit": self.head, "sha": sha, "entries": entries}
+        self.save()
+
+    def resolve(self, prefix):
+        """
+        Return the sha of the tree at `prefix` in the head commit, or None if it doesn't exist.
+        """
+        sha = self.head
+        for name in prefix.split("/"):
+            tree = self.api(f"trees/{sha}").json()["tree"]
+            sha = next((e["sha"] for e in tree if e["path"] == name and e["type"] == "tree"), None)
+            if sha is None:
+                return None
+        return sha
+
+    def fresh_prefix(self, path):
+        """
+        Return the longest up to date prefix containing `path`, or None.
+        """
+        candidates = [
+            prefix
+            for prefix, tree in self.data["trees"].items()
+            if tree["commit"] == self.head and (not prefix or path.startswith(f"{prefix}/"))
+        ]
+        return max(candidates, key=len, default=None)
+
+    def covers(self, path):
+        """
+        Whether we know for sure if `path` exists or not.
+        """
+        return self.fresh_prefix(path) is not None
+
+    def get(self, path):
+        """
+        Return the entry ({"sha", "size", "mode"}) of the file `path`, or None if it isn't known.
+        """
+        prefix = self.fresh_prefix(path)
+        if prefix is None:
+            return None
+        return self.data["trees"][prefix]["entries"].get(path[len(prefix) :].lstrip("/"))
+
+    def entries(self, prefix):
+        """
+        Return (relative path, entry) pairs of the files under the directory `prefix`,
+        or None if it isn't known.
+        """
+        prefix = prefix.strip("/")
+        cached = self.fresh_prefix(f"{prefix}/")
+        if cached is None:
+            return None
+        start = prefix[len(cached) :].lstrip("/")
+        start = f"{start}/" if start else ""
+        return [
+            (path[len(start) :], entry)
+            for path, entry in self.data["trees"][cached]["entries"].items()
+            if path.startswith(start)
+        ]
+
+    def record(self, parent, commit, entries):
+        """
+        Update the cache with a commit of our own, so the next refresh doesn't need to fetch trees.
+
+        `entries` maps each path written in `commit` to its entry, or to None if it was deleted.
+        If `parent` isn't the head we know, somebody else pushed in between and the cache will
+        be refreshed the usual way.
+        """
+        if parent != self.head:
+            return
+        for prefix, tree in self.data["trees"].items():
+            if tree["commit"] != parent:
+                continue
+            tree["commit"] = commit
+            # the sha of the tree changed, but we don't know it
+            tree["sha"] = None
+            for path, entry in entries.items():
+                if not prefix or path.startswith(f"{prefix}/"):
+                    relative = path[len(prefix) :].lstrip("/")
+                    if entry is None:
+                        tree["entries"].pop(relative, None)
+                    else:
+                        tree["entries"][relative] = entry
+        self.data["head"] = commit
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        partial.write_text(json.dumps(self.data))
+        os.replace(partial, self.path)
@@ -0,0 +1,235 @@
+"""
+Stores files too big for a single GitHub blob as fixed-size parts plus a small json manifest.
+
+    dump.hprof.chunks.json      the manifest: name, size and the sha and size of each part, in order
+    dump.hprof.chunks/00000     the parts
+    dump.hprof.chunks/00001
+    ...
+
+Parts are uploaded and downloaded concurrently, reading and writing the file at their offset.
+A downloaded part is verified against its git blob sha.
+"""
+
+import hashlib
+import json
+import os
+from itertools import accumulate
+
+from . import transport
+from .blobs import CHUNK_SIZE
+from .cache import file_blob_sha, git_blob_sha
+
+# GitHub rejects blobs over 100 MB, and warns over 50 MB
+CHUNKED_THRESHOLD = 50 * 1024 * 1024
+PART_SIZE = 16 * 1024 * 1024
+
+MANIFEST_SUFFIX = ".chunks.json"
+FORMAT = "shbin-chunks"
+
+
+class CorruptedDownload(Exception):
+    pass
+
+
+class FileSlice:
+    """
+    A read only file object over `size` bytes of the file `f` from `offset`.
+
+    It reads with `os.pread`, so several slices can read the same file descriptor concurrently.
+    """
+
+    def __init__(self, f, offset, size):
+        self.fd = f.fileno()
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size=-1):
+        left = self.size - self.position
+        size = left if size < 0 else min(size, left)
+        data = os.pread(self.fd, size, self.offset + self.position)
+        self.position += len(data)
+        return data
+
+
+def is_manifest(name):
+    return name.endswith(MANIFEST_SUFFIX)
+
+
+def part_ranges(size, part_size=None):
+    """
+    Return the (offset, size) of each part of a file of `size` bytes.
+    """
+    part_size = part_size or PART_SIZE
+    return [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+
+
+def upload_part(repo, path, offset, size):
+    """
+    Upload `size` bytes of `path` from `offset` as a blob. Returns its sha.
+    """
+    from .blobs import upload_blob
+
+    with path.open("rb") as f:
+        return upload_blob(repo, FileSlice(f, offset, size), size)
+
+
+def manifest(name, size, parts):
+    """
+    Return the manifest for the file `name` of `size` bytes, given its parts as (sha, size) pairs.
+    """
+    return {
+        "format": FORMAT,
+        "version": 1,
+        "name": name,
+        "size": size,
+        "parts": [
+            {"path": f"{name}.chunks/{index:05d}", "sha": sha, "size": part_size}
+            for index, (sha, part_size) in enumerate(parts)
+        ],
+    }
+
+
+def manifest_content(name, size, parts):
+    return json.dumps(manifest(name, size, parts), indent=2)
+
+
+def stored_name(name, size):
+    """
+    The name a file of `size` bytes is stored as in the repo: its manifest's, if it's stored in parts.
+    """
+    return f"{name}{MANIFEST_SUFFIX}" if size > CHUNKED_THRESHOLD else name
+
+
+def stored_sha(path, size):
+    """
+    The blob sha of what uploading the file `path` of `size` bytes writes as `stored_name`,
+    computed locally. For a file stored in parts, that's its manifest: it's rebuilt from the
+    sha of each part, so an unchanged file is known without uploading any of them.
+    """
+    if size <= CHUNKED_THRESHOLD:
+        return file_blob_sha(path)
+    parts = []
+    with path.open("rb") as f:
+        for offset, part_size in part_ranges(size):
+            digest = hashlib.sha1(b"blob %d\0" % part_size)
+            source = FileSlice(f, offset, part_size)
+            while chunk := source.read(CHUNK_SIZE):
+                digest.update(chunk)
+            parts.append((digest.hexdigest(), part_size))
+    return git_blob_sha(manifest_content(path.name, size, parts).encode())
+
+
+def parse_manifest(content):
+    """
+    Return the manifest in `content`, or None if it isn't one.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) and data.get("format") == FORMAT else None
+
+
+def download_part(repo, sha, size, f, offset):
+    """
+    Write the blob `sha` into the file `f` at `offset`, verifying its size and sha.
+    """
+    digest = hashlib.sha1(b"blob %d\0" % size)
+    written = 0
+    with transport.request(
+        "GET",
+        f"{repo.url}/git/blobs/{sha}",
+        headers={"Accept": "application/vnd.github.raw"},
+        stream=True,
+    ) as response:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            digest.update(chunk)
+            os.pwrite(f.fileno(), chunk, offset + written)
+            written += len(chunk)
+    if written != size or digest.hexdigest() != sha:
+        raise CorruptedDownload(f"part {sha} doesn't match the manifest")
+
+
+def copy_part(source, f, offset):
+    """
+    Write the content of the file object `source` into the file `f` at `offset`.
+    """
+    while chunk := source.read(CHUNK_SIZE):
+        os.pwrite(f.fileno(), chunk, offset)
+        offset += len(chunk)
+
+
+def join_parts(data, directory, target):
+    """
+    Reassemble the file described by the manifest `data` into `target`, from its parts
+    already in the local `directory` (e.g. extracted from an archive), verifying them.
+    """
+    if sum(part["size"] for part in data["parts"]) != data["size"]:
+        raise CorruptedDownload(f"the parts of {data['name']} don't add up to its size")
+    partial = target.with_name(f"{target.name}.part")
+    try:
+        with open(partial, "wb") as f:
+            for part in data["parts"]:
+                path = os.path.realpath(directory / part["path"])
+                if not path.startswith(os.path.realpath(directory) + os.sep) or not os.path.isfile(path):
+                    raise CorruptedDownload(f"part {part['path']} is missing")
+                with open(path, "rb") as source:
+                    digest = hashlib.sha1(b"blob %d\0" % part["size"])
+                    while chunk := source.read(CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                if digest.hexdigest() != part["sha"]:
+                    raise CorruptedDownload(f"part {part['sha']} doesn't match the manifest")
+    except BaseException:
+        os.unlink(partial)
+        raise
+    os.replace(partial, target)
+    return target
+
+
+def download_chunked(repo, data, target, pool, journal=None, store=None):
+    """
+    Download the parts listed in the manifest `data` concurrently with `pool`,
+    and reassemble them into the path `target`.
+
+    With a `journal`, an interrupted download leaves its partial file behind, and the parts
+    already written into it by a previous run are not downloaded again.
+    Parts in the blob `store` are copied from it, and those downloaded are added to it.
+    """
+    if sum(part["size"] for part in data["parts"]) != data["size"]:
+        raise CorruptedDownload(f"the parts of {data['name']} don't add up to its size")
+    partial = target.with_name(f"{target.name}.part")
+    resumed = journal is not None and partial.exists() and partial.stat().st_size == data["size"]
+    offsets = list(accumulate((part["size"] for part in data["parts"]), initial=0))
+    keys = [f"{os.path.abspath(partial)}:{offset}" for offset in offsets]
+    try:
+        with open(partial, "r+b" if resumed else "w+b") as f:
+            if not resumed:
+                f.truncate(data["size"])
+
+            def fetch(part, offset, key):
+                if resumed and journal.get(key) == part["sha"]:
+                    return
+                cached = store.open(part["sha"]) if store is not None else None
+                if cached is not None:
+                    with cached:
+                        copy_part(cached, f, offset)
+                else:
+                    download_part(repo, part["sha"], part["size"], f, offset)
+                    if store is not None:
+                        store.add(part["sha"], FileSlice(f, offset, part["size"]), part["size"])
+                if journal is not None:
+                    journal.record(key, part["sha"])
+
+            list(pool.map(fetch, data["parts"], offsets, keys))
+    except BaseException as e:
+        # a corrupted part isn't fixed by downloading it again, so there's nothing to resume
+        if journal is None or isinstance(e, CorruptedDownload):
+            os.unlink(partial)
+        raise
+    os.replace(partial, target)
+    return target
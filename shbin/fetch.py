@@ -0,0 +1,145 @@
+"""
+Downloads whole directories with a single tree listing and concurrent blob requests,
+or as a single archive of the branch.
+"""
+
+import os
+import pathlib
+import posixpath
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+
+from . import transport
+from .blobs import download_blob
+from .cache import file_blob_sha
+from .chunks import MANIFEST_SUFFIX, download_chunked, is_manifest, join_parts, parse_manifest
+from .transport import DEFAULT_JOBS
+
+
+class TruncatedTree(Exception):
+    pass
+
+
+def list_blobs(repo, path, cache=None):
+    """
+    Return the files under the directory `path` as (relative path, blob sha) pairs.
+
+    If given, the tree `cache` is refreshed and used. Otherwise the tree of `path` is found
+    walking down from the root of the branch, a level per request, and listed recursively.
+    Raises `TruncatedTree` if it has too many files for GitHub to list them all.
+    """
+    if cache is not None:
+        cache.refresh(path)
+        entries = cache.entries(path)
+        if entries is not None:
+            return [(relative, entry["sha"]) for relative, entry in entries]
+
+    sha = tree_sha(repo, path)
+    if sha is None:
+        return []
+    tree = repo.get_git_tree(sha, recursive=True)
+    if tree.truncated:
+        raise TruncatedTree(f"{path or 'the repository'} has too many files to be listed. Download it with --archive")
+    return [(e.path, e.sha) for e in tree.tree if e.type == "blob"]
+
+
+def tree_sha(repo, path, root=None):
+    """
+    Return the sha (or the branch name, for the root) of the tree at `path` in the default branch,
+    or under the tree `root` if given, or None if there's no such directory.
+    """
+    sha = root or repo.default_branch
+    for name in filter(None, path.split("/")):
+        sha = next((e.sha for e in repo.get_git_tree(sha).tree if e.path == name and e.type == "tree"), None)
+        if sha is None:
+            return None
+    return sha
+
+
+def download_directory(repo, path, jobs=DEFAULT_JOBS, cache=None, journal=None, store=None):
+    """
+    Download the directory `path` into a local directory with the same name,
+    keeping its structure. Returns the list of written files.
+
+    Files that are already there with the same content (by their git blob sha) are skipped.
+    A `journal` lets files stored in parts resume from what an interrupted run downloaded.
+    Blobs in the `store` are copied from it instead of downloaded, and the others are added to it.
+    """
+    root = pathlib.Path(pathlib.PurePosixPath(path).name)
+    blobs = list_blobs(repo, path, cache)
+    # the parts of a file stored in parts are fetched through its manifest
+    listed = {relative for relative, _ in blobs}
+    blobs = [(relative, sha) for relative, sha in blobs if f"{posixpath.dirname(relative)}.json" not in listed]
+
+    def fetch(item):
+        relative, sha = item
+        target = root.joinpath(*relative.split("/"))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.is_file() and file_blob_sha(target) == sha:
+            print(f"[green]✓[/green] {target} is up to date")
+            return target
+        if store is None or not store.get(sha, target):
+            download_blob(repo, sha, target)
+            if store is not None:
+                store.add_file(sha, target)
+        print(f"[green]✓[/green] downloaded {target}")
+        return target
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        targets = list(pool.map(fetch, blobs))
+        for i, target in enumerate(targets):
+            data = parse_manifest(target.read_bytes()) if is_manifest(target.name) else None
+            if data is not None:
+                targets[i] = target.with_name(pathlib.Path(data["name"]).name)
+                # the manifest is removed once the file is reassembled, so it's remembered here
+                key = f"{os.path.abspath(targets[i])}:{blobs[i][1]}"
+                stat = targets[i].stat() if journal is not None and targets[i].is_file() else None
+                if stat is None or journal.get(key) != [stat.st_mtime_ns, stat.st_size]:
+                    download_chunked(repo, data, targets[i], pool, journal, store)
+                    if journal is not None:
+                        stat = targets[i].stat()
+                        journal.record(key, [stat.st_mtime_ns, stat.st_size])
+                target.unlink()
+                print(f"[green]✓[/green] downloaded {targets[i]}")
+        return targets
+
+
+def download_archive(repo, path):
+    """
+    Download the directory `path` into a local directory with the same name, extracting it
+    from a tarball of the whole branch while it's downloaded. Returns how many files were written.
+
+    It's a single request whatever the amount of files, and neither the archive nor its
+    content are held in memory. But the archive has the whole branch: the files out of `path`
+    are downloaded too, and skipped.
+    """
+    from .pack import unpack
+
+    root = pathlib.Path(pathlib.PurePosixPath(path).name or repo.name)
+    prefix = f"{path}/" if path else ""
+
+    def rename(name):
+        # the archive has everything under a "<owner>-<repo>-<sha>/" directory
+        _, _, name = name.partition("/")
+        return name[len(prefix) :] if name.startswith(prefix) and name != prefix else None
+
+    with transport.request("GET", f"{repo.url}/tarball/{repo.default_branch}", stream=True) as response:
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as tar:
+            count = unpack(tar, root, rename)
+
+    # files stored in parts are reassembled from the parts extracted next to their manifest
+    for manifest_path in list(root.rglob(f"*{MANIFEST_SUFFIX}")):
+        data = parse_manifest(manifest_path.read_bytes())
+        if data is None:
+            continue
+        target = manifest_path.with_name(pathlib.Path(data["name"]).name)
+        join_parts(data, manifest_path.parent, target)
+        shutil.rmtree(manifest_path.with_name(f"{target.name}.chunks"))
+        manifest_path.unlink()
+        count -= len(data["parts"])
+    if count:
+        print(f"[green]✓[/green] extracted {count} files into {root}")
+    return count
@@ -0,0 +1,101 @@
+"""
+Deletes the files that break a retention policy (older than some days, bigger than some size,
+or beyond a quota per namespace) as a single commit, whatever their amount.
+
+The files, their sizes and the date of their last commit come from the local index. The few
+files it doesn't know the date of (changed before the commits it read) are asked for with
+GraphQL, a query per PAGE_SIZE files.
+"""
+
+import datetime
+import posixpath
+import re
+
+from . import listing
+from .chunks import MANIFEST_SUFFIX
+from .shards import namespace_of
+from .walk import translate
+
+
+def matcher(patterns):
+    """
+    Return a function telling if a path matches any of the gitignore-like `patterns`.
+    A pattern matching a directory matches everything under it.
+    """
+    regexes = [re.compile(f"{translate(pattern.strip('/'))}(?:/.*)?") for pattern in patterns]
+    return lambda path: any(regex.fullmatch(path) for regex in regexes)
+
+
+def group_chunks(rows):
+    """
+    Return the files of `rows` ((path, size, date) tuples) as {"path", "size", "date", "parts"}
+    dicts. The parts of a chunked file are folded into its manifest: they're deleted with it,
+    and its size is the whole file's.
+    """
+    files = {path: {"path": path, "size": size or 0, "date": date, "parts": []} for path, size, date in rows}
+    for path in list(files):
+        directory = posixpath.dirname(path)
+        if not directory.endswith(".chunks"):
+            continue
+        manifest = files.get(f"{directory[: -len('.chunks')]}{MANIFEST_SUFFIX}")
+        if manifest is not None:
+            manifest["size"] += files.pop(path)["size"]
+            manifest["parts"].append(path)
+    return list(files.values())
+
+
+def select(files, older_than=None, larger_than=None, quota=None, now=None):
+    """
+    Return the files, among `files`, that break all the given rules:
+
+    - `older_than`: their last commit is more than this many days old. Files with an unknown
+      date are kept.
+    - `larger_than`: they're bigger than this many bytes.
+    - `quota`: they don't fit, with the newer files of their namespace, in this many bytes.
+    """
+    selected = list(files)
+    if older_than is not None:
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        # GitHub dates are ISO 8601 in UTC, so they compare as strings
+        limit = (now - datetime.timedelta(days=older_than)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        selected = [f for f in selected if f["date"] is not None and f["date"] < limit]
+    if larger_than is not None:
+        selected = [f for f in selected if f["size"] > larger_than]
+    if quota is not None:
+        over = set()
+        used = {}
+        for f in sorted(files, key=lambda f: f["date"] or "", reverse=True):
+            namespace = namespace_of(f["path"])
+            used[namespace] = used.get(namespace, 0) + f["size"]
+            if used[namespace] > quota:
+                over.add(f["path"])
+        selected = [f for f in selected if f["path"] in over]
+    return selected
+
+
+def collect(index, patterns, exclude=(), need_dates=False):
+    """
+    Return the files of the `index` matching `patterns` and not `exclude`, as `group_chunks` does.
+    The index is synced first. With `need_dates`, the missing dates are asked for and kept in the index.
+    """
+    index.sync()
+    rows = index.list()
+    if any(size is None for _, size, _, _ in rows):
+        # files changed by recent commits: the tree tells their sizes
+        with index.db:
+            index.snapshot(index.get_meta("head"))
+        rows = index.list()
+
+    included, excluded = matcher(patterns), matcher(exclude)
+    files = [f for f in group_chunks(row[:3] for row in rows) if included(f["path"]) and not excluded(f["path"])]
+
+    undated = [f for f in files if f["date"] is None] if need_dates else []
+    for start in range(0, len(undated), listing.PAGE_SIZE):
+        page = undated[start : start + listing.PAGE_SIZE]
+        commits = listing.last_commits(index.repo, [f["path"] for f in page])
+        with index.db:
+            for f, commit in zip(page, commits):
+                if commit is not None:
+                    f["date"] = commit["date"]
+                    index.set_last_commit(f["path"], commit["date"], commit["message"])
+    return files
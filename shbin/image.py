@@ -0,0 +1,68 @@
+"""
+Recompresses pasted images (screenshots are often big, barely compressed PNGs) before they're
+uploaded, if Pillow is installed and --image-quality (or SHBIN_IMAGE_QUALITY) asks for it:
+
+- "lossless": a PNG is compressed again, as hard as Pillow can. Its pixels don't change.
+- a quality from 1 to 100: a PNG or JPEG is converted to WebP (or to AVIF, with "avif:<quality>").
+
+The result is kept only if it's smaller.
+"""
+
+import io
+import re
+import sys
+
+from rich import print
+
+# bigger images are uploaded as they are: they need to be decoded in memory
+MAX_SIZE = 64 * 1024 * 1024
+
+RECOMPRESSED = (".png", ".jpg")
+
+
+def parse_quality(value):
+    """
+    Parse a quality setting into (format, quality): ("png", None) for "lossless", ("webp", 80)
+    for "80", ("avif", 60) for "avif:60". Raises ValueError if it's not valid.
+    """
+    setting = value.strip().lower()
+    if setting == "lossless":
+        return "png", None
+    match = re.fullmatch(r"(?:(webp|avif):)?(\d+)", setting)
+    if not match or not 1 <= int(match.group(2)) <= 100:
+        raise ValueError(
+            f'the image quality must be "lossless", a number from 1 to 100 or "avif:<number>", got {value!r}'
+        )
+    return match.group(1) or "webp", int(match.group(2))
+
+
+def recompress(content, extension, image_format, quality):
+    """
+    Return `content` (an image with `extension`) and its extension, recompressed as `image_format`
+    with `quality` if that makes it smaller. Otherwise they're returned as they are.
+    """
+    if extension not in RECOMPRESSED or (image_format == "png" and extension != ".png") or len(content) > MAX_SIZE:
+        return content, extension
+    try:
+        from PIL import Image
+    except ImportError as e:
+        print(
+            f"[bold yellow]warning:[/bold yellow] install Pillow (pip install shbin[image]) to recompress images. {e}",
+            file=sys.stderr,
+        )
+        return content, extension
+
+    output = io.BytesIO()
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if image_format == "png":
+                image.save(output, "PNG", optimize=True)
+            else:
+                image.save(output, image_format.upper(), quality=quality)
+    except (OSError, ValueError, KeyError, Image.DecompressionBombError) as e:
+        # not really an image, or a format this Pillow can't write (e.g. AVIF before 11.2)
+        print(f"[bold yellow]warning:[/bold yellow] the image was not recompressed: {e}", file=sys.stderr)
+        return content, extension
+    if output.tell() >= len(content):
+        return content, extension
+    return output.getvalue(), f".{image_format}"
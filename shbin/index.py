@@ -0,0 +1,304 @@
+"""
+A local SQLite index of the files in the repo, to list and search them without asking GitHub.
+
+It's synced incrementally: the commits since the last indexed one tell which files were added,
+changed or removed, and bring the messages we search on. Only the first sync (or one after
+a force push) lists the whole tree.
+"""
+
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import transport
+from .cache import CACHE_DIR
+from .transport import DEFAULT_JOBS
+
+# how long the index is used without syncing it
+INDEX_TTL = 10 * 60
+
+# commits read for their messages when the whole tree is indexed
+INITIAL_COMMITS = 100
+
+# how many commits the compare api lists. Further behind, the whole tree is listed again.
+MAX_COMMITS = 250
+
+# how many files GitHub lists for a single commit. A commit with more needs the tree listing.
+MAX_COMMIT_FILES = 300
+
+# text files up to this size get their content indexed, if enabled with SHBIN_INDEX_CONTENT
+CONTENT_MAX_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    sha TEXT NOT NULL,
+    size INTEGER,
+    commit_sha TEXT,
+    message TEXT,
+    date TEXT,
+    content TEXT,
+    content_sha TEXT
+);
+"""
+
+# the full text index reads the columns of `files`, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    path, message, content, content='files', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO search(rowid, path, message, content) VALUES (new.id, new.path, new.message, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO search(search, rowid, path, message, content)
+    VALUES ('delete', old.id, old.path, old.message, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE ON files BEGIN
+    INSERT INTO search(search, rowid, path, message, content)
+    VALUES ('delete', old.id, old.path, old.message, old.content);
+    INSERT INTO search(rowid, path, message, content) VALUES (new.id, new.path, new.message, new.content);
+END;
+"""
+
+UPSERT = """
+INSERT INTO files (path, sha, size, commit_sha, message, date) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    size = CASE WHEN sha = excluded.sha THEN coalesce(excluded.size, size) ELSE excluded.size END,
+    sha = excluded.sha,
+    commit_sha = coalesce(excluded.commit_sha, commit_sha),
+    message = coalesce(excluded.message, message),
+    date = coalesce(excluded.date, date)
+"""
+
+
+def content_enabled():
+    """
+    Indexing the content of text files is enabled with SHBIN_INDEX_CONTENT=1 (or "true" or "yes").
+    """
+    return os.environ.get("SHBIN_INDEX_CONTENT", "").strip().lower() in ("1", "true", "yes")
+
+
+class Index:
+    """
+    The files of the repo's default branch with their last commit, persisted in CACHE_DIR.
+    """
+
+    def __init__(self, repo, path=None, jobs=DEFAULT_JOBS):
+        self.repo = repo
+        self.jobs = jobs
+        self.path = path or CACHE_DIR / f"{repo.full_name.replace('/', '@')}.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # sqlite built without fts5: searches fall back to LIKE
+            self.fts = False
+
+    def close(self):
+        self.db.close()
+
+    def api(self, path, **kwargs):
+        return transport.request("GET", f"{self.repo.url}/{path}", **kwargs)
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_stale(self):
+        return time.time() - float(self.get_meta("checked_at") or 0) > INDEX_TTL
+
+    def sync(self):
+        """
+        Bring the index up to the head of the branch.
+
+        While nobody pushes, this is a single conditional request answered with 304.
+        """
+        etag = self.get_meta("etag")
+        response = self.api(
+            f"git/ref/heads/{self.repo.default_branch}", headers={"If-None-Match": etag} if etag else {}
+        )
+        if response.status_code != 304:
+            head = response.json()["object"]["sha"]
+            last = self.get_meta("head")
+            if head != last:
+                with self.db:
+                    commits = self.commits_between(last, head) if last else None
+                    if commits is None:
+                        self.snapshot(head)
+                        self.apply(self.commit_details(self.recent_commits(head)), messages_only=True)
+                    elif not self.apply(self.commit_details(commits)):
+                        # a commit listed partially: the tree tells the files we missed
+                        self.snapshot(head)
+                    self.set_meta("head", head)
+            self.set_meta("etag", response.headers.get("ETag"))
+        if content_enabled():
+            self.index_contents()
+        with self.db:
+            self.set_meta("checked_at", str(time.time()))
+
+    def commits_between(self, base, head):
+        """
+        Return the shas of the commits after `base` up to `head`, oldest first.
+        None if they can't be listed (too many, or `base` isn't an ancestor after a force push).
+        """
+        from github import GithubException
+
+        try:
+            compare = self.api(f"compare/{base}...{head}", params={"per_page": MAX_COMMITS}).json()
+        except GithubException as e:
+            if e.status != 404:
+                raise
+            return None
+        if compare["status"] != "ahead" or compare["total_commits"] > len(compare["commits"]):
+            return None
+        return [commit["sha"] for commit in compare["commits"]]
+
+    def recent_commits(self, head):
+        commits = self.api("commits", params={"sha": head, "per_page": INITIAL_COMMITS}).json()
+        return [commit["sha"] for commit in reversed(commits)]
+
+    def commit_details(self, shas):
+        """
+        Fetch the commits `shas` (with their changed files) concurrently, keeping their order.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            return list(pool.map(lambda sha: self.api(f"commits/{sha}").json(), shas))
+
+    def apply(self, commits, messages_only=False):
+        """
+        Apply the changes of `commits`, oldest first. With `messages_only`, only update the
+        message of files already indexed. Returns False if some commit didn't list all its files.
+        """
+        complete = True
+        for commit in commits:
+            message, date = commit["commit"]["message"], commit["commit"]["author"]["date"]
+            complete &= len(commit["files"]) < MAX_COMMIT_FILES
+            for f in commit["files"]:
+                if messages_only:
+                    self.db.execute(
+                        "UPDATE files SET commit_sha = ?, message = ?, date = ? WHERE path = ? AND sha = ?",
+                        (commit["sha"], message, date, f["filename"], f.get("sha")),
+                    )
+                elif f["status"] == "removed":
+                    self.db.execute("DELETE FROM files WHERE path = ?", (f["filename"],))
+                else:
+                    if f["status"] == "renamed":
+                        self.db.execute("DELETE FROM files WHERE path = ?", (f["previous_filename"],))
+                    self.db.execute(UPSERT, (f["filename"], f["sha"], None, commit["sha"], message, date))
+        return complete
+
+    def snapshot(self, head):
+        """
+        Reconcile the index with the whole tree of `head`.
+
+        The tree is listed in a single request, unless GitHub truncates it. Then each
+        top level directory is listed on its own.
+        """
+        tree = self.api(f"git/trees/{head}", params={"recursive": "1"}).json()
+        if tree.get("truncated"):
+            top = self.api(f"git/trees/{head}").json()["tree"]
+            entries = [e for e in top if e["type"] == "blob"]
+            subtrees = [e for e in top if e["type"] == "tree"]
+
+            def list_subtree(subtree):
+                listed = self.api(f"git/trees/{subtree['sha']}", params={"recursive": "1"}).json()["tree"]
+                return [{**e, "path": f"{subtree['path']}/{e['path']}"} for e in listed]
+
+            with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+                for listed in pool.map(list_subtree, subtrees):
+                    entries.extend(listed)
+        else:
+            entries = tree["tree"]
+
+        blobs = {e["path"]: e for e in entries if e["type"] == "blob"}
+        indexed = dict(self.db.execute("SELECT path, sha FROM files"))
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in indexed if path not in blobs])
+        # a changed file loses its last commit until one touching it is applied
+        self.db.executemany(
+            "UPDATE files SET commit_sha = NULL, message = NULL, date = NULL WHERE path = ?",
+            [(path,) for path, sha in indexed.items() if path in blobs and blobs[path]["sha"] != sha],
+        )
+        self.db.executemany(UPSERT, [(path, e["sha"], e.get("size"), None, None, None) for path, e in blobs.items()])
+
+    def set_last_commit(self, path, date, message):
+        """
+        Set the date and message of the last commit of `path`, learnt elsewhere.
+        """
+        self.db.execute("UPDATE files SET date = ?, message = ? WHERE path = ?", (date, message, path))
+
+    def index_contents(self):
+        """
+        Download and index the content of the small text files that changed since they were indexed.
+        """
+        pending = self.db.execute(
+            "SELECT path, sha FROM files WHERE content_sha IS NOT sha AND coalesce(size, 0) <= ?",
+            (CONTENT_MAX_SIZE,),
+        ).fetchall()
+
+        def fetch(item):
+            path, sha = item
+            response = self.api(f"git/blobs/{sha}", headers={"Accept": "application/vnd.github.raw"}, stream=True)
+            with response:
+                content = b""
+                for chunk in response.iter_content(CONTENT_MAX_SIZE):
+                    content += chunk
+                    if len(content) > CONTENT_MAX_SIZE:
+                        return path, sha, None
+            try:
+                return path, sha, content.decode("utf-8")
+            except UnicodeDecodeError:
+                return path, sha, None
+
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool, self.db:
+            for path, sha, content in pool.map(fetch, pending):
+                self.db.execute(
+                    "UPDATE files SET content = ?, content_sha = ? WHERE path = ? AND sha = ?",
+                    (content, sha, path, sha),
+                )
+
+    def list(self, prefix=""):
+        """
+        Return the files under the directory `prefix` as (path, size, date, message) rows, sorted by path.
+        """
+        prefix = prefix.strip("/")
+        if not prefix:
+            return self.db.execute("SELECT path, size, date, message FROM files ORDER BY path").fetchall()
+        # "0" follows "/", so this is a range over the path index
+        return self.db.execute(
+            "SELECT path, size, date, message FROM files WHERE path > ? AND path < ? ORDER BY path",
+            (f"{prefix}/", f"{prefix}0"),
+        ).fetchall()
+
+    def search(self, query, limit=50):
+        """
+        Return the files whose path, last commit message or content match every word of `query`,
+        as (path, date, message, snippet) rows, best matches first. The snippet marks the matches
+        in the content between \\x02 and \\x03.
+        """
+        words = query.split()
+        if not words:
+            return []
+        if self.fts:
+            # each word is a prefix, quoted so the query syntax doesn't get in the way
+            match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+            return self.db.execute(
+                "SELECT files.path, files.date, files.message, snippet(search, 2, char(2), char(3), '…', 12) "
+                "FROM search JOIN files ON files.id = search.rowid "
+                "WHERE search MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        condition = " AND ".join(["(path LIKE ? OR message LIKE ? OR content LIKE ?)"] * len(words))
+        return self.db.execute(
+            f"SELECT path, date, message, NULL FROM files WHERE {condition} ORDER BY date DESC LIMIT ?",
+            [f"%{word}%" for word in words for _ in range(3)] + [limit],
+        ).fetchall()
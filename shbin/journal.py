@@ -0,0 +1,105 @@
+"""
+A local journal of what a long transfer already did (the blobs uploaded, the parts downloaded),
+so rerunning it with --resume continues from there instead of starting over.
+
+Each operation (e.g. an upload into a namespace, or the download of a directory, from the current
+directory) has its journal: a json lines file that's appended to as every step is done, and
+removed once the operation succeeds.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from rich import print
+
+from .auth import CONFIG_PATH
+
+JOURNAL_DIR = CONFIG_PATH.parent / "journal"
+
+
+class Journal:
+    """
+    The steps done by `operation` (a dict describing it), as a mapping of keys to results.
+
+    Unless `resume` is true, the steps done by a previous run of the same operation are discarded.
+    """
+
+    def __init__(self, operation, resume=False, directory=None):
+        key = hashlib.sha1(json.dumps(operation, sort_keys=True, default=str).encode()).hexdigest()
+        directory = directory or JOURNAL_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{key}.jsonl"
+        self.done = {}
+        if resume:
+            self.done = self.load(self.path)
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path):
+        done = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        step = json.loads(line)
+                    except ValueError:
+                        # the last line may be half written
+                        continue
+                    done[step["key"]] = step["value"]
+        except OSError:
+            pass
+        return done
+
+    def get(self, key):
+        return self.done.get(key)
+
+    def record(self, key, value=True):
+        """
+        Record that the step `key` is done, with its result `value`.
+        """
+        with self._lock:
+            self.done[key] = value
+            self._file.write(json.dumps({"key": key, "value": value}) + "\n")
+            # it must survive the process being killed right after
+            self._file.flush()
+
+    def run(self, key, task, *args):
+        """
+        Return the result of `task(*args)` as recorded for `key`, running it if it wasn't yet.
+        """
+        value = self.get(key)
+        if value is None:
+            value = task(*args)
+            self.record(key, value)
+        return value
+
+    def close(self, completed):
+        self._file.close()
+        if completed:
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(completed=exc_type is None)
+        if exc_type is not None and self.done:
+            print(
+                f"[bold yellow]interrupted:[/bold yellow] {len(self.done)} steps were done. "
+                "Run the same command with --resume to continue from there.",
+                file=sys.stderr,
+            )
+
+
+def file_key(path, offset=0, size=None):
+    """
+    A key for the `size` bytes at `offset` of the local file `path`, as it is now: if the file
+    is modified, its key changes.
+    """
+    stat = os.stat(path)
+    size = stat.st_size if size is None else size
+    return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}:{offset}:{size}"
@@ -0,0 +1,131 @@
+"""
+Lists a directory live from GitHub, with the size of each entry and its last commit (author, date
+and message), through the GraphQL API.
+
+A first query brings the entries of the directory and their sizes. Their last commits are then
+asked for in pages of PAGE_SIZE entries, a query each, so a listing costs a handful of requests
+whatever the amount of files and each page can be shown as soon as it arrives.
+"""
+
+import posixpath
+
+from . import transport
+
+PAGE_SIZE = 50
+
+ENTRIES_QUERY = """
+query($owner: String!, $name: String!, $expression: String!) {
+  repository(owner: $owner, name: $name) {
+    object(expression: $expression) {
+      ... on Tree {
+        entries { name type object { ... on Blob { byteSize } } }
+      }
+    }
+  }
+}
+"""
+
+HISTORY_FIELDS = "nodes { committedDate messageHeadline author { name user { login } } }"
+
+
+def graphql_url():
+    """
+    The GraphQL endpoint next to the REST API: api.github.com/graphql, or <host>/api/graphql
+    for GitHub Enterprise.
+    """
+    url = transport.API_URL
+    return f"{url[: -len('/v3')]}/graphql" if url.endswith("/api/v3") else f"{url}/graphql"
+
+
+def query(text, variables):
+    """
+    Run the GraphQL query `text`. Returns its data. Errors are raised as `GithubException`,
+    as GitHub answers them with a 200.
+    """
+    from github import GithubException
+
+    response = transport.request("POST", graphql_url(), json={"query": text, "variables": variables})
+    result = response.json()
+    if result.get("errors"):
+        raise GithubException(response.status_code, result, dict(response.headers))
+    return result["data"]
+
+
+def history_query(count):
+    """
+    A query for the last commit touching each of `count` paths, given as $p0, $p1...
+    """
+    arguments = "".join(f", $p{i}: String!" for i in range(count))
+    fields = "\n".join(f"p{i}: history(first: 1, path: $p{i}) {{ {HISTORY_FIELDS} }}" for i in range(count))
+    return f"""
+query($owner: String!, $name: String!, $ref: String!{arguments}) {{
+  repository(owner: $owner, name: $name) {{
+    ref(qualifiedName: $ref) {{
+      target {{
+        ... on Commit {{
+          {fields}
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+
+def entries(repo, path):
+    """
+    Return the entries of the directory `path` as {"name", "path", "type", "size"} dicts, directories
+    first, or None if there's no such directory.
+    """
+    owner, name = repo.full_name.split("/")
+    variables = {"owner": owner, "name": name, "expression": f"{repo.default_branch}:{path}"}
+    tree = query(ENTRIES_QUERY, variables)["repository"]["object"]
+    if not tree or "entries" not in tree:
+        return None
+    found = [
+        {
+            "name": entry["name"],
+            "path": posixpath.join(path, entry["name"]),
+            "type": entry["type"],
+            "size": (entry["object"] or {}).get("byteSize"),
+        }
+        for entry in tree["entries"]
+    ]
+    return sorted(found, key=lambda entry: (entry["type"] != "tree", entry["name"]))
+
+
+def long_listing(repo, path, page_size=None):
+    """
+    Yield the entries of the directory `path`, page by page, each entry with its last "commit"
+    ({"date", "author", "message"}, or None). Yields nothing if there's no such directory.
+    """
+    page_size = page_size or PAGE_SIZE
+    found = entries(repo, path.strip("/"))
+    if not found:
+        return
+    for start in range(0, len(found), page_size):
+        page = found[start : start + page_size]
+        for entry, commit in zip(page, last_commits(repo, [entry["path"] for entry in page])):
+            entry["commit"] = commit
+        yield page
+
+
+def last_commits(repo, paths):
+    """
+    Return the last commit ({"date", "author", "message"}, or None) touching each of `paths`,
+    in a single query.
+    """
+    owner, name = repo.full_name.split("/")
+    variables = {"owner": owner, "name": name, "ref": f"refs/heads/{repo.default_branch}"}
+    variables.update({f"p{i}": path for i, path in enumerate(paths)})
+    target = query(history_query(len(paths)), variables)["repository"]["ref"]["target"]
+    return [commit_info(target[f"p{i}"]["nodes"][0]) if target[f"p{i}"]["nodes"] else None for i in range(len(paths))]
+
+
+def commit_info(node):
+    author = node["author"] or {}
+    return {
+        "date": node["committedDate"],
+        "author": (author.get("user") or {}).get("login") or author.get("name") or "",
+        "message": node["messageHeadline"],
+    }
@@ -0,0 +1,141 @@
+"""
+Packs many files into a single compressed tarball, uploaded as one blob, and unpacks it back.
+
+Packs are compressed with zstd if zstandard is installed, gzip otherwise, and both ways are
+streamed: a file is read (or written) at a time, whatever the amount of files.
+"""
+
+import os
+import pathlib
+import secrets
+import tarfile
+import tempfile
+import time
+
+from rich import print
+from rich.markup import escape
+
+from . import transport
+
+# the suffix tells `shbin dl` it's a pack
+PACK_SUFFIXES = (".pack.tar.zst", ".pack.tar.gz")
+
+
+def has_zstd():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def is_pack(name):
+    return name.endswith(PACK_SUFFIXES)
+
+
+def pack_name(file_name=None):
+    """
+    The name of a new pack, based on `file_name` if given.
+    """
+    suffix = PACK_SUFFIXES[0] if has_zstd() else PACK_SUFFIXES[1]
+    if file_name is None:
+        return f"{secrets.token_urlsafe(8)}{suffix}"
+    return file_name if is_pack(file_name) else f"{file_name}{suffix}"
+
+
+def pack(files, fileobj, name):
+    """
+    Write `files` into `fileobj` as the compressed tarball `name`. Each file is stored
+    under the name it would have been uploaded with.
+    """
+    if name.endswith(".zst"):
+        import zstandard
+
+        with zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                add_files(tar, files)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="w|gz") as tar:
+            add_files(tar, files)
+
+
+def add_files(tar, files):
+    for path in files:
+        stat = path.stat()
+        info = tarfile.TarInfo(path.name)
+        info.size = stat.st_size
+        info.mtime = getattr(stat, "st_mtime", time.time())
+        info.mode = 0o644
+        with path.open("rb") as f:
+            tar.addfile(info, f)
+
+
+def pack_files(files, file_name=None):
+    """
+    Pack `files` into a temporary file. Returns it as a path to upload.
+    """
+    from . import FakePath
+
+    name = pack_name(file_name)
+    fileobj = tempfile.TemporaryFile(prefix="shbin-")
+    pack(files, fileobj, name)
+    return FakePath(name, fileobj=fileobj)
+
+
+def open_pack(fileobj, name):
+    """
+    Open the pack `name` for reading from the stream `fileobj`, member by member.
+    """
+    if name.endswith(".zst"):
+        import zstandard
+
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(fileobj), mode="r|")
+    return tarfile.open(fileobj=fileobj, mode="r|gz")
+
+
+def unpack(tar, target, rename=None):
+    """
+    Extract the files of `tar` under the directory `target`. Returns how many were extracted.
+
+    With `rename`, each member is extracted as `rename(name)`, or skipped if that's None.
+    Directories are created as needed. Other members that aren't regular files, or would land
+    out of `target`, are skipped.
+    """
+    count = 0
+    root = os.path.realpath(target)
+    for member in tar:
+        name = rename(member.name) if rename else member.name
+        if name is None or member.isdir():
+            continue
+        destination = os.path.realpath(os.path.join(root, name))
+        if not member.isfile() or not destination.startswith(root + os.sep):
+            print(f"[bold yellow]warning:[/bold yellow] skipping {escape(member.name)}")
+            continue
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with tar.extractfile(member) as source, open(destination, "wb") as f:
+            while chunk := source.read(1024 * 1024):
+                f.write(chunk)
+        count += 1
+    return count
+
+
+def download_pack(repo, sha, name, list_only=False):
+    """
+    Stream the pack blob `sha` and extract it into a local directory named like the pack,
+    or with `list_only`, print its files instead.
+    """
+    with transport.request(
+        "GET",
+        f"{repo.url}/git/blobs/{sha}",
+        headers={"Accept": "application/vnd.github.raw"},
+        stream=True,
+    ) as response:
+        response.raw.decode_content = True
+        with open_pack(response.raw, name) as tar:
+            if list_only:
+                for member in tar:
+                    print(f"{member.size:>12}  {escape(member.name)}")
+                return
+            target = pathlib.Path(next(name[: -len(suffix)] for suffix in PACK_SUFFIXES if name.endswith(suffix)))
+            count = unpack(tar, target)
+    print(f"[green]✓[/green] extracted {count} files into {target}")
@@ -0,0 +1,70 @@
+"""
+Spreads the pastes over several backing repos (shards), so each one stays small and fast, and
+requests spread over their rate limits.
+
+SHBIN_REPO (or the repo in the config) can list several repos, comma separated. The files of a
+namespace (the first directory of their path, usually the user) all live in the same repo,
+chosen with rendezvous hashing: the same namespace always goes to the same repo, and adding
+a repo only moves the namespaces that go to the new one.
+"""
+
+import hashlib
+import re
+
+# the repos set up for this command, by their name in the config
+_repos = {}
+
+
+def parse(value):
+    """
+    Return the repo names in `value`: a comma separated string, or a list.
+    """
+    names = value if isinstance(value, list) else (value or "").split(",")
+    return [name.strip() for name in names if name.strip()]
+
+
+def namespace_of(path):
+    return path.strip("/").split("/", 1)[0]
+
+
+def choose(names, path):
+    """
+    The name of the repo, among `names`, that holds `path`.
+    """
+    key = namespace_of(path)
+    return max(names, key=lambda name: hashlib.sha1(f"{name.lower()}\0{key}".encode()).digest())
+
+
+def name_for(names, url_or_path):
+    """
+    The name, among `names`, of the repo holding `url_or_path`: a path, or a github url of one of them.
+    """
+    url = re.match(r"^https://github\.com/([^/]+/[^/]+)/", url_or_path)
+    if url:
+        return next((name for name in names if name.lower() == url.group(1).lower()), names[0])
+    return choose(names, url_or_path)
+
+
+def register(repos):
+    """
+    Set the repos of this command, as {name: Repository}.
+    """
+    _repos.clear()
+    _repos.update(repos)
+
+
+def all_repos(default):
+    return list(_repos.values()) or [default]
+
+
+def repo_for(default, url_or_path):
+    """
+    The repo holding `url_or_path` (a path or a github url), or `default` if there's a single one.
+    """
+    if len(_repos) <= 1:
+        return default
+    url = re.match(r"^https://github\.com/([^/]+/[^/]+)/", url_or_path)
+    if url:
+        by_name = {repo.full_name.lower(): repo for repo in _repos.values()}
+        return by_name.get(url.group(1).lower(), default)
+    return _repos[choose(list(_repos), url_or_path)]
@@ -0,0 +1,161 @@
+"""
+Guesses the extension of a paste looking at its first bytes only, so it takes the same
+time for a short snippet than for a screenshot or a huge dump.
+
+Common formats are recognized by their signature or structure, text by a few pygments
+lexers. libmagic is consulted only when those fail, so it's optional.
+"""
+
+import csv
+import json
+import re
+from mimetypes import guess_extension
+
+from rich import print
+
+# how much of the content is looked at
+SNIFF_SIZE = 8 * 1024
+
+# (offset, magic bytes, extension)
+SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (8, b"WEBP", ".webp"),
+    (0, b"%PDF-", ".pdf"),
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"PK\x05\x06", ".zip"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"\xfd7zXZ\x00", ".xz"),
+    (0, b"\x28\xb5\x2f\xfd", ".zst"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"SQLite format 3\x00", ".sqlite"),
+]
+
+# (pattern, extension) for text formats pygments doesn't tell apart well
+TEXT_SIGNATURES = [
+    # nbformat writes the keys sorted, so "cells" comes first
+    (re.compile(r'\{\s*"cells"\s*:'), ".ipynb"),
+    (re.compile(r"<!doctype html|<html[\s>]", re.IGNORECASE), ".html"),
+    (re.compile(r"<svg[\s>]"), ".svg"),
+    (re.compile(r"<\?xml"), ".xml"),
+]
+
+# the start of a json object or array, for contents too long to parse in full
+JSON_START = re.compile(r'(\{\s*["}]|\[\s*(["{\[\]\d-]|true|false|null))')
+
+# the lexers we ask, in order of preference. Loading all of them takes too long.
+LEXERS = ["python", "bash", "diff", "html", "xml", "php", "perl", "ruby"]
+
+# lower scores are mere hints (e.g. a C lexer finding an #include)
+MIN_LEXER_SCORE = 0.3
+
+# lines of a paste checked to tell if it's a csv
+CSV_LINES = 20
+
+
+def get_extension(content):
+    """
+    Return the extension for `content` (e.g. ".png"), or "" if it can't be guessed.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    head = content[:SNIFF_SIZE]
+    for offset, signature, extension in SIGNATURES:
+        if head.startswith(signature, offset):
+            return extension
+
+    complete = len(content) <= SNIFF_SIZE
+    text = as_text(head, complete)
+    if text is None:
+        return from_libmagic(head, warn=True) or ""
+    return text_extension(text, complete) or from_libmagic(head) or ".txt"
+
+
+def as_text(head, complete):
+    """
+    Return `head` decoded, or None if it doesn't look like text.
+    """
+    if b"\0" in head:
+        return None
+    try:
+        return head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # the head may cut a multibyte character
+        if complete or e.start < len(head) - 3:
+            return None
+        return head[: e.start].decode("utf-8")
+
+
+def text_extension(text, complete):
+    stripped = text.lstrip()
+    for pattern, extension in TEXT_SIGNATURES:
+        if pattern.match(stripped):
+            return extension
+    if is_json(stripped, complete):
+        return ".json"
+    return csv_extension(text, complete) or lexer_extension(text)
+
+
+def is_json(text, complete):
+    if not complete:
+        return bool(JSON_START.match(text))
+    if text[:1] not in ("{", "["):
+        return False
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def csv_extension(text, complete):
+    """
+    Return ".csv" or ".tsv" if the first lines have the same amount of delimited fields.
+    """
+    lines = text.splitlines()
+    if not complete:
+        # the last line may be cut
+        lines = lines[:-1]
+    lines = [line for line in lines[:CSV_LINES] if line.strip()]
+    if len(lines) < 2:
+        return None
+    for delimiter, extension in ((",", ".csv"), ("\t", ".tsv"), (";", ".csv")):
+        widths = {len(row) for row in csv.reader(lines, delimiter=delimiter)}
+        if len(widths) == 1 and widths.pop() > 1:
+            return extension
+    return None
+
+
+def lexer_extension(text):
+    """
+    Return the extension of the pygments lexer most confident about `text`, if any is.
+    """
+    try:
+        from pygments.lexers import find_lexer_class_by_name
+    except ImportError:
+        return None
+
+    best, best_score = None, MIN_LEXER_SCORE
+    for name in LEXERS:
+        lexer = find_lexer_class_by_name(name)
+        score = lexer.analyse_text(text)
+        if score > best_score or (best is None and score == best_score):
+            best, best_score = lexer, score
+    if best is None or not best.filenames:
+        return None
+    return best.filenames[0].lstrip("*")
+
+
+def from_libmagic(head, warn=False):
+    try:
+        import magic
+    except ImportError as e:
+        if warn:
+            print(
+                "[bold yellow]warning:[/bold yellow] check the README to correctly install python-magic. "
+                f"Import Error: {e}"
+            )
+        return None
+    return guess_extension(magic.from_buffer(head, mime=True))
@@ -0,0 +1,146 @@
+"""
+A local store of the content of downloaded blobs, keyed by their sha, next to the tree cache.
+
+A blob never changes, so once the tree cache tells the sha of a file (with a conditional request,
+answered with 304 while nobody pushes), a file downloaded before is copied from here instead of
+downloaded again. The store is bounded in size (SHBIN_CACHE_SIZE, 1GB by default): the blobs used
+least recently are removed first.
+"""
+
+import contextlib
+import os
+import re
+import shutil
+import threading
+
+from .cache import CACHE_DIR
+from .cache import is_enabled as cache_enabled
+
+DEFAULT_MAX_SIZE = 1024**3
+
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value):
+    """
+    Parse a size like "500MB", "2G" or "1048576" into bytes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * UNITS[unit.upper()])
+
+
+def max_size():
+    """
+    How big the store can grow, from SHBIN_CACHE_SIZE. 0 disables it.
+    """
+    value = os.environ.get("SHBIN_CACHE_SIZE", "").strip()
+    try:
+        return parse_size(value) if value else DEFAULT_MAX_SIZE
+    except ValueError:
+        return DEFAULT_MAX_SIZE
+
+
+def is_enabled():
+    return cache_enabled() and max_size() > 0
+
+
+class BlobStore:
+    """
+    Blobs stored as files named by their sha. Using a blob touches its modification time,
+    which tells the least recently used ones.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path or CACHE_DIR / "blobs"
+        self.max_size = DEFAULT_MAX_SIZE if max_size is None else max_size
+        # the size of the store, computed when first needed
+        self.size = None
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha):
+        return self.path / sha[:2] / sha[2:]
+
+    def touch(self, sha):
+        """
+        Mark the blob `sha` as just used. Returns its path, or None if it isn't stored.
+        """
+        path = self.blob_path(sha)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, sha, target):
+        """
+        Copy the blob `sha` into the path `target`. Returns whether it was stored.
+        """
+        path = self.touch(sha)
+        if path is None:
+            return False
+        partial = target.with_name(f"{target.name}.part")
+        try:
+            shutil.copyfile(path, partial)
+        except FileNotFoundError:
+            # evicted meanwhile
+            return False
+        os.replace(partial, target)
+        return True
+
+    def open(self, sha):
+        """
+        Return the blob `sha` opened for reading, or None if it isn't stored.
+        """
+        path = self.touch(sha)
+        try:
+            return open(path, "rb") if path else None
+        except FileNotFoundError:
+            return None
+
+    def add(self, sha, fileobj, size):
+        """
+        Store the `size` bytes read from `fileobj` as the blob `sha`, making room for it.
+        """
+        if size > self.max_size or self.touch(sha):
+            return
+        path = self.blob_path(sha)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(partial, path)
+        with self._lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self.blobs())
+            else:
+                self.size += size
+            if self.size > self.max_size:
+                self.evict()
+
+    def add_file(self, sha, path):
+        with open(path, "rb") as f:
+            self.add(sha, f, os.fstat(f.fileno()).st_size)
+
+    def blobs(self):
+        """
+        Yield (last used, path, size) for each stored blob.
+        """
+        for directory in self.path.glob("??"):
+            for path in directory.iterdir():
+                with contextlib.suppress(FileNotFoundError):
+                    stat = path.stat()
+                    yield stat.st_mtime_ns, path, stat.st_size
+
+    def evict(self):
+        """
+        Remove the least recently used blobs until the store fits in its max size.
+        """
+        for _, path, size in sorted(self.blobs()):
+            if self.size <= self.max_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+                self.size -= size
@@ -0,0 +1,168 @@
+"""
+Optional instrumentation: how long each phase of a command takes, and every request sent to GitHub
+with its status, size, latency and the rate limit left.
+
+`--profile` prints a summary when the command ends. SHBIN_TRACE=<path> appends every phase and
+request to that file as json lines, to follow shbin from a wrapper. When neither is used,
+tracing costs a function call that does nothing.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+_tracer = None
+
+
+class Tracer:
+    """
+    Records the phases of a command, one after the other, and the requests sent meanwhile,
+    from any thread.
+    """
+
+    def __init__(self, path=None, summary=False, started=None):
+        self.started = started or time.perf_counter()
+        self.summary = summary
+        self.phases = []
+        self.requests = []
+        # what happened before tracing was enabled
+        self.current = ("startup", self.started)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def emit(self, event):
+        if self._file is not None:
+            self._file.write(json.dumps(event) + "\n")
+
+    def phase(self, name):
+        """
+        End the current phase, if any, and start `name`.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if self.current is not None:
+                current, start = self.current
+                self.phases.append((current, now - start))
+                self.emit({"type": "phase", "name": current, "start": start - self.started, "elapsed": now - start})
+            self.current = (name, now) if name else None
+
+    def request(self, method, url, status, sent, received, elapsed, headers=None):
+        remaining = (headers or {}).get("X-RateLimit-Remaining")
+        record = {
+            "type": "request",
+            "method": method,
+            "endpoint": endpoint(url),
+            "url": url,
+            "status": status,
+            "sent": sent,
+            "received": received,
+            "elapsed": elapsed,
+            "remaining": int(remaining) if remaining is not None else None,
+            "phase": self.current[0] if self.current else None,
+        }
+        with self._lock:
+            self.requests.append(record)
+            self.emit(record)
+
+    def close(self):
+        self.phase(None)
+        total = time.perf_counter() - self.started
+        with self._lock:
+            self.emit({"type": "summary", "elapsed": total, "requests": len(self.requests)})
+            if self._file is not None:
+                self._file.close()
+        if self.summary:
+            self.print_summary(total)
+
+    def print_summary(self, total):
+        from rich.console import Console
+        from rich.table import Table
+
+        phases = Table(title="phases", title_justify="left")
+        phases.add_column("phase")
+        phases.add_column("time", justify="right")
+        phases.add_column("%", justify="right")
+        for name, elapsed in self.phases:
+            phases.add_row(name, f"{elapsed * 1000:.0f} ms", f"{100 * elapsed / total:.0f}")
+        phases.add_row("[bold]total[/bold]", f"[bold]{total * 1000:.0f} ms[/bold]", "")
+
+        requests = Table(title="requests", title_justify="left")
+        for column in ("request", "calls", "status", "sent", "received", "time", "avg", "remaining"):
+            requests.add_column(column, justify="left" if column in ("request", "status") else "right")
+        groups = {}
+        for record in self.requests:
+            groups.setdefault(f"{record['method']} {record['endpoint']}", []).append(record)
+        for name, records in groups.items():
+            elapsed = sum(record["elapsed"] for record in records)
+            statuses = Counter(str(record["status"]) for record in records)
+            remaining = [record["remaining"] for record in records if record["remaining"] is not None]
+            requests.add_row(
+                name,
+                str(len(records)),
+                " ".join(status if count == 1 else f"{status}×{count}" for status, count in sorted(statuses.items())),
+                format_size(sum(record["sent"] for record in records)),
+                format_size(sum(record["received"] for record in records)),
+                f"{elapsed * 1000:.0f} ms",
+                f"{elapsed * 1000 / len(records):.0f} ms",
+                str(min(remaining)) if remaining else "",
+            )
+
+        console = Console(file=sys.stderr)
+        console.print(phases)
+        if self.requests:
+            console.print(requests)
+
+
+def endpoint(url):
+    """
+    The endpoint of `url`, without what changes from call to call (e.g. "/repos/:repo/git/blobs/:sha").
+    """
+    path = urlsplit(url).path
+    path = re.sub(r"^.*?/repos/[^/]+/[^/]+", "/repos/:repo", path)
+    path = re.sub(r"/contents/.+", "/contents/:path", path)
+    path = re.sub(r"/git/(refs?)/.+", r"/git/\1/:ref", path)
+    return re.sub(r"\b[0-9a-f]{40}\b", ":sha", path)
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def enable(profile=False, started=None):
+    """
+    Start tracing if asked with `profile` or SHBIN_TRACE. `started` is when the command started.
+    """
+    global _tracer
+    path = os.environ.get("SHBIN_TRACE") or None
+    if profile or path:
+        _tracer = Tracer(path, summary=profile, started=started)
+    return _tracer
+
+
+def finish():
+    global _tracer
+    if _tracer is not None:
+        tracer, _tracer = _tracer, None
+        tracer.close()
+
+
+def phase(name):
+    if _tracer is not None:
+        _tracer.phase(name)
+
+
+def request(method, url, status, sent, received, elapsed, headers=None):
+    if _tracer is not None:
+        _tracer.request(method, url, status, sent, received, elapsed, headers)
+
+
+def is_enabled():
+    return _tracer is not None
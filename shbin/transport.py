@@ -0,0 +1,275 @@
+"""
+The transport every request to GitHub goes through: a single pooled HTTP session
+that paces requests according to the rate limit and retries the failed ones.
+
+PyGithub keeps one connection object per client and stores the request being sent on it,
+so a client can't be used from several threads at once. Installing our connection classes
+gives each request its own lightweight connection object over a common pool of keep-alive
+connections, which makes concurrent calls safe.
+
+requests and PyGithub are imported when first needed, as importing them takes a
+noticeable part of the run time of a short command.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+from rich import print
+
+from . import trace
+
+# SHBIN_API_URL points shbin to another server, e.g. GitHub Enterprise or the benchmarks' fake one
+API_URL = os.environ.get("SHBIN_API_URL", "https://api.github.com").rstrip("/")
+
+# default amount of concurrent requests. Can be changed with --jobs or SHBIN_JOBS
+DEFAULT_JOBS = 8
+
+# retries of throttled requests, server errors and network failures
+MAX_RETRIES = 5
+BACKOFF_BASE = 1
+RETRY_STATUS = {500, 502, 503, 504}
+
+# GitHub asks to wait at least a minute after hitting a secondary rate limit
+SECONDARY_RATE_LIMIT_WAIT = 60
+
+# with less remaining requests than this, they are spread until the rate limit resets
+PACE_BELOW = 50
+
+# we'd rather fail than wait longer than this
+MAX_WAIT = 15 * 60
+
+_session = None
+# connections the session keeps alive, per host: a few per concurrent request
+_pool_size = 4 * DEFAULT_JOBS
+_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Tracks the rate limit GitHub reports in every response, shared by all the threads.
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.reset = 0.0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """
+        How long the next request should wait.
+        """
+        with self._lock:
+            now = time.time()
+            delay = self.blocked_until - now
+            if self.remaining is not None and self.remaining < PACE_BELOW and self.reset > now:
+                delay = max(delay, (self.reset - now) / (self.remaining + 1))
+        return delay if 0 < delay <= MAX_WAIT else 0
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 1:
+            print(f"[bold yellow]warning:[/bold yellow] waiting {delay:.0f}s for GitHub's rate limit", file=sys.stderr)
+        if delay:
+            time.sleep(delay)
+
+    def update(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset = float(reset)
+
+    def block(self, seconds):
+        """
+        Hold every request for `seconds`.
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+
+limiter = RateLimiter()
+
+
+def get_session():
+    """
+    Return the process wide `requests.Session`, creating it on first use.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from github.Requester import Requester
+
+            _session = requests.Session()
+            # having a session auth disables the fallback to .netrc, as PyGithub does.
+            _session.auth = Requester.noopAuth
+            mount_adapter(_session, _pool_size)
+        return _session
+
+
+def mount_adapter(session, pool_size):
+    import requests
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def reserve(jobs):
+    """
+    Make the session keep enough connections alive for `jobs` concurrent requests. With a
+    smaller pool, the connections beyond it would be closed after each request.
+    """
+    global _pool_size
+    session = get_session()
+    with _lock:
+        if 4 * jobs > _pool_size:
+            _pool_size = 4 * jobs
+            mount_adapter(session, _pool_size)
+
+
+def backoff(attempt):
+    """
+    Exponential backoff with jitter, so concurrent retries don't hit at once.
+    """
+    return BACKOFF_BASE * 2**attempt * random.uniform(0.5, 1.5)
+
+
+def throttle_delay(response):
+    """
+    If `response` means we were rate limited, return how long to wait before retrying.
+    Otherwise (e.g. a 403 for lack of permissions) return None.
+    """
+    if response.status_code not in (403, 429):
+        return None
+    if "Retry-After" in response.headers:
+        return float(response.headers["Retry-After"])
+    if response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers:
+        return max(float(response.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+    if response.status_code == 429 or "secondary rate limit" in response.text.lower():
+        return SECONDARY_RATE_LIMIT_WAIT
+    return None
+
+
+def send(method, url, **kwargs):
+    """
+    Send a request through the shared session, waiting if the rate limit is close to be
+    exhausted. Throttled requests, server errors and network failures are retried.
+    """
+    import requests
+
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            trace.request(method, url, type(e).__name__, 0, 0, time.perf_counter() - start)
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff(attempt))
+            continue
+
+        if trace.is_enabled():
+            # a streamed body isn't read yet: only its announced length is known
+            received = len(response.content) if not kwargs.get("stream") else response.headers.get("Content-Length")
+            trace.request(
+                method,
+                url,
+                response.status_code,
+                int(response.request.headers.get("Content-Length") or 0),
+                int(received or 0),
+                time.perf_counter() - start,
+                response.headers,
+            )
+        limiter.update(response.headers)
+        throttled = throttle_delay(response)
+        if throttled is not None and throttled <= MAX_WAIT and attempt < MAX_RETRIES:
+            # everybody waits, not only this request
+            limiter.block(max(throttled, backoff(attempt)))
+        elif response.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+            time.sleep(backoff(attempt))
+        else:
+            return response
+        response.close()
+
+
+class Connection:
+    """
+    Mimics the httplib-like connection PyGithub expects, over the shared session.
+    """
+
+    protocol = "https"
+
+    def __init__(self, host, port=None, timeout=None, **kwargs):
+        self.host = host
+        self.port = port or (443 if self.protocol == "https" else 80)
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+
+    def request(self, verb, url, input, headers, stream=False):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+        self.stream = stream
+
+    def getresponse(self):
+        from github.Requester import RequestsResponse
+
+        response = send(
+            self.verb,
+            f"{self.protocol}://{self.host}:{self.port}{self.url}",
+            headers=self.headers,
+            data=self.input,
+            timeout=self.timeout,
+            verify=self.verify,
+            stream=self.stream,
+            allow_redirects=False,
+        )
+        return RequestsResponse(response)
+
+    def close(self):
+        # the pool outlives every single request
+        pass
+
+
+class HTTPConnection(Connection):
+    protocol = "http"
+
+
+def install(token=None):
+    """
+    Route every PyGithub request through the shared session.
+    The `token` authenticates the requests we send by ourselves via `request()`.
+    """
+    from github.Requester import Requester
+
+    Requester.injectConnectionClasses(HTTPConnection, Connection)
+    if token:
+        get_session().headers["Authorization"] = f"token {token}"
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request out of PyGithub (e.g. to stream a body).
+    Errors are raised as `GithubException`, as PyGithub does.
+    """
+    from github import GithubException
+
+    response = send(method, url, **kwargs)
+    if response.status_code >= 400:
+        try:
+            data = response.json()
+        except ValueError:
+            data = response.text
+        response.close()
+        raise GithubException(response.status_code, data, dict(response.headers))
+    return response
@@ -0,0 +1,271 @@
+"""
+Expands the paths and glob patterns given in the command line into the files to upload.
+
+Directories are walked with `os.scandir`, pruning the ignored ones (by .gitignore, .shbinignore,
+--exclude, or being a VCS directory, node_modules or a virtualenv) without descending into them.
+"""
+
+import os
+import pathlib
+import posixpath
+import re
+
+IGNORE_FILES = (".gitignore", ".shbinignore")
+
+# never worth uploading, whatever the ignore files say
+ALWAYS_IGNORED = {
+    ".git",
+    ".hg",
+    ".svn",
+    "node_modules",
+    "__pycache__",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+}
+
+GLOB_MAGIC = re.compile(r"[*?[]")
+
+
+def translate(pattern):
+    """
+    Translate a gitignore-like glob into a regex for relative posix paths.
+    `*` doesn't cross directories, `**` does.
+    """
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end].replace("\\", "\\\\")
+            regex.append(f"[^{chars[1:]}]" if chars[0] in "!^" else f"[{chars}]")
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(regex)
+
+
+def parse_rules(lines, base=""):
+    """
+    Parse the lines of an ignore file in the directory `base` into (regex, negate, dir_only) rules.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        line = line.lstrip("!")
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        # a pattern with a slash is relative to the ignore file. Otherwise it matches at any depth.
+        regex = translate(line.lstrip("/")) if "/" in line else f"(?:.*/)?{translate(line)}"
+        if base:
+            regex = f"{re.escape(base)}/{regex}"
+        yield re.compile(regex), negate, dir_only
+
+
+class Ignore:
+    """
+    The ignore rules for the paths under `root`, loaded directory by directory as they're walked.
+    Paths are given relative to `root`.
+    """
+
+    def __init__(self, root, exclude=()):
+        self.root = root
+        self.rules = []
+        self.loaded = set()
+        # --exclude patterns apply last, so they can't be negated
+        self.exclude = list(parse_rules(exclude))
+
+    def load(self, directory):
+        if directory in self.loaded:
+            return
+        self.loaded.add(directory)
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(self.root, directory, name)) as f:
+                    self.rules.extend(parse_rules(f, directory))
+            except OSError:
+                pass
+
+    def excluded(self, path):
+        return any(regex.fullmatch(path) for regex, _, _ in self.exclude)
+
+    def ignored(self, path, is_dir=False):
+        ignored = False
+        for regex, negate, dir_only in self.rules + self.exclude:
+            if (is_dir or not dir_only) and regex.fullmatch(path):
+                ignored = not negate
+        return ignored
+
+
+class DirectoryFile:
+    """
+    A file found walking a directory given as input. It's uploaded under its path relative to
+    the directory's parent (e.g. "dir/sub/file.py"), so the directory keeps its structure.
+    """
+
+    def __init__(self, path, name):
+        self.path = pathlib.Path(path)
+        self.name = name
+        self.stem, self.suffix = posixpath.splitext(name)
+
+    def read_bytes(self):
+        return self.path.read_bytes()
+
+    def open(self, mode="rb"):
+        return self.path.open(mode)
+
+    def stat(self):
+        return self.path.stat()
+
+    def __fspath__(self):
+        return str(self.path)
+
+    def __str__(self):
+        return str(self.path)
+
+
+def expand_paths(path_or_patterns, exclude=(), directories=None):
+    """
+    Yield the files for the given paths, directories (walked recursively) and glob patterns,
+    each file once.
+
+    If given, the set `directories` gets the directories looked into: where new files matching
+    would appear (or, for what doesn't exist yet, the nearest existing directory above).
+    """
+    ignores = {}
+    seen = set()
+    for path_or_pattern in path_or_patterns:
+        path_or_pattern = str(path_or_pattern)
+        for path in expand(path_or_pattern, exclude, ignores, directories):
+            real = os.path.realpath(path)
+            if real not in seen:
+                seen.add(real)
+                yield path
+
+
+def expand(path_or_pattern, exclude, ignores, directories=None):
+    root, base = split_root(path_or_pattern)
+    if root not in ignores:
+        ignores[root] = Ignore(root, exclude)
+    ignore = ignores[root]
+    if base:
+        # the ignore files above the walked directory count too
+        parts = base.split("/")
+        for i in range(len(parts)):
+            ignore.load("/".join(parts[:i]))
+
+    if directories is not None and not os.path.isdir(path_or_pattern):
+        start = literal_start(path_or_pattern)
+        while not os.path.isdir(start):
+            start = os.path.dirname(start) or "."
+        directories.add(start)
+
+    if os.path.isdir(path_or_pattern):
+        name = os.path.basename(os.path.abspath(path_or_pattern))
+        for path, relative in walk(ignore, base, scanned=directories):
+            yield DirectoryFile(path, f"{name}/{relative}")
+    elif os.path.exists(path_or_pattern) or os.path.isabs(path_or_pattern):
+        # an absolute path is taken as given, even if it's a pattern
+        if not ignore.excluded(base):
+            yield pathlib.Path(path_or_pattern)
+    elif GLOB_MAGIC.search(path_or_pattern):
+        yield from glob(path_or_pattern, ignore, directories)
+
+
+def literal_start(path_or_pattern):
+    """
+    Return the directory a pattern starts with, before its first glob (the parent, for a path).
+    """
+    parts = posixpath.normpath(path_or_pattern.replace(os.sep, "/")).split("/")
+    literal = next((i for i, part in enumerate(parts) if GLOB_MAGIC.search(part)), len(parts) - 1)
+    return "/".join(parts[:literal]) or ("/" if parts[0] == "" else ".")
+
+
+def split_root(path_or_pattern):
+    """
+    Return the directory the ignore rules are relative to and the path (or pattern) relative to it:
+    the current directory for what's under it, the given directory (or the file's parent) otherwise.
+    """
+    path = posixpath.normpath(path_or_pattern.replace(os.sep, "/"))
+    if not os.path.isabs(path) and not path.startswith("../") and path != "..":
+        return ".", "" if path == "." else path
+    if os.path.isdir(path):
+        return path, ""
+    # the literal directory the path or pattern starts with
+    parts = path.split("/")
+    literal = next((i for i, part in enumerate(parts) if GLOB_MAGIC.search(part)), len(parts) - 1)
+    return "/".join(parts[:literal]) or "/", "/".join(parts[literal:])
+
+
+def walk(ignore, top="", depth=None, parts=None, scanned=None):
+    """
+    Yield (path, relative path) for the files under the directory `top`, relative to `ignore.root`.
+
+    Ignored directories aren't walked. `depth` limits how deep the walk goes and `parts`,
+    a regex per level, which directories are worth walking into. The directories walked are
+    added to the `scanned` set, if given.
+    """
+    stack = [(top, 0)]
+    while stack:
+        directory, level = stack.pop()
+        ignore.load(directory)
+        try:
+            with os.scandir(os.path.join(ignore.root, directory)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        if scanned is not None:
+            scanned.add(os.path.join(ignore.root, directory))
+        subdirs = []
+        for entry in entries:
+            path = f"{directory}/{entry.name}" if directory else entry.name
+            # symlinks to directories aren't followed, as they could make a loop
+            if entry.is_dir(follow_symlinks=False):
+                if (
+                    (depth is None or level + 1 < depth)
+                    and (parts is None or parts[level].fullmatch(entry.name))
+                    and entry.name not in ALWAYS_IGNORED
+                    and not os.path.exists(os.path.join(entry.path, "pyvenv.cfg"))
+                    and not ignore.ignored(path, is_dir=True)
+                ):
+                    subdirs.append((path, level + 1))
+            elif entry.is_file() and entry.name != ".shbinignore" and not ignore.ignored(path):
+                yield entry.path if ignore.root != "." else path, path[len(top) :].lstrip("/")
+        stack.extend(reversed(subdirs))
+
+
+def glob(pattern, ignore, directories=None):
+    """
+    Yield the files matching the glob `pattern`, walking from its literal start.
+    """
+    root, base = split_root(pattern)
+    parts = base.split("/")
+    literal = next(i for i, part in enumerate(parts) if GLOB_MAGIC.search(part))
+    top = "/".join(parts[:literal])
+    rest = parts[literal:]
+    regex = re.compile(translate("/".join(rest)))
+    if any("**" in part for part in rest):
+        depth = level_regexes = None
+    else:
+        depth = len(rest)
+        level_regexes = [re.compile(translate(part)) for part in rest]
+    for path, relative in walk(ignore, top, depth, level_regexes, directories):
+        if regex.fullmatch(relative):
+            yield pathlib.Path(path)
@@ -0,0 +1,199 @@
+"""
+Keeps the repo in sync with local files as they change: `shbin watch reports/ -d reports`.
+
+Changes are noticed with inotify on Linux, or by polling the modification time and size of the
+files elsewhere. A burst of changes (e.g. a job writing hundreds of files) is waited out and
+uploaded as a single commit, with only the files whose content isn't in the repo yet.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+from rich import print
+
+from .transport import DEFAULT_JOBS
+from .walk import expand_paths
+
+# how long the files must stay untouched before a burst of changes is uploaded
+DEBOUNCE = 2.0
+
+# but a burst that never ends is uploaded every so often anyway
+MAX_DELAY = 30.0
+
+# how often files are checked when polling
+POLL_INTERVAL = 1.0
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class Inotify:
+    """
+    Tells when something changes in the watched directories, through the Linux inotify api.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched = set()
+
+    def watch(self, directories):
+        for directory in set(directories) - self.watched:
+            # it may be gone already
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) >= 0:
+                self.watched.add(directory)
+
+    def wait(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (forever if None) for changes. Returns whether there were.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # which files changed doesn't matter: their stats tell
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """
+    Tells when the modification time or size of the files changes, checking them periodically.
+    """
+
+    def __init__(self, scan, interval=POLL_INTERVAL):
+        self.scan = scan
+        self.interval = interval
+        self.stats = None
+
+    def watch(self, directories):
+        pass
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+            stats = {key: stat for key, (_, stat) in self.scan().items()}
+            changed, self.stats = self.stats is not None and stats != self.stats, stats
+            if changed:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        pass
+
+
+def file_stat(path):
+    """
+    What tells a file changed: its modification time and size.
+    """
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watch:
+    """
+    Uploads the files under `paths` (paths, directories or glob patterns, as the upload command
+    takes them) to `namespace` whenever they change.
+    """
+
+    def __init__(self, repo, paths, namespace, message="", exclude=(), jobs=DEFAULT_JOBS, cache=None):
+        self.repo = repo
+        self.paths = paths
+        self.namespace = namespace
+        self.message = message
+        self.exclude = exclude
+        self.jobs = jobs
+        self.cache = cache
+        # the stats of the files when they were last uploaded (or found unchanged)
+        self.synced = {}
+        # the directories the last scan looked into
+        self.scanned = set()
+
+    def scan(self):
+        """
+        Return the files to watch now as {path: (file, stats)}.
+        """
+        files = {}
+        self.scanned = set()
+        for path in expand_paths(self.paths, self.exclude, self.scanned):
+            try:
+                files[str(path)] = (path, file_stat(path))
+            except OSError:
+                # removed meanwhile
+                pass
+        return files
+
+    def directories(self):
+        """
+        The directories to watch: those the last scan looked into. A directory created in one
+        of them is watched after the scan its creation triggers.
+        """
+        return {os.path.abspath(directory) for directory in self.scanned}
+
+    def sync(self):
+        """
+        Upload the files changed since the last sync, as a single commit. Returns the uploaded
+        files and all those found.
+        """
+        from . import skip_unchanged
+        from .batch import commit_files
+
+        files = self.scan()
+        changed = [path for key, (path, stat) in files.items() if self.synced.get(key) != stat]
+        uploaded = changed
+        if changed and self.cache is not None:
+            self.cache.refresh(self.namespace)
+            uploaded, _ = skip_unchanged(changed, self.namespace, self.cache)
+        if uploaded:
+            commit_files(self.repo, uploaded, self.namespace, self.message, jobs=self.jobs, cache=self.cache)
+            print(f"[green]✓[/green] {len(uploaded)} uploaded, {len(changed) - len(uploaded)} unchanged")
+        for path in changed:
+            self.synced[str(path)] = files[str(path)][1]
+        return uploaded, files
+
+    def run(self, debounce=DEBOUNCE, max_delay=MAX_DELAY, watcher=None):
+        """
+        Sync now and every time the files change, until interrupted.
+        """
+        if watcher is None:
+            try:
+                watcher = Inotify()
+            except (OSError, AttributeError):
+                # not on Linux
+                watcher = Poller(self.scan)
+        print(f"👀 watching for changes ({type(watcher).__name__.lower()}). Stop with Ctrl+C.", file=sys.stderr)
+        try:
+            while True:
+                self.sync()
+                watcher.watch(self.directories())
+                watcher.wait()
+                # wait until the burst is over, or for too long
+                started = time.monotonic()
+                while time.monotonic() - started < max_delay and watcher.wait(debounce):
+                    pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
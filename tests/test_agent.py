@@ -0,0 +1,114 @@
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+from shbin import agent
+
+
+@pytest.fixture
+def running_agent(tmp_path, monkeypatch):
+    """
+    An agent serving from a thread, running `shbin.run` as patched by each test.
+    """
+    path = str(tmp_path / "agent.sock")
+    monkeypatch.setenv("SHBIN_AGENT_SOCKET", path)
+    monkeypatch.setenv("SHBIN_CACHE", "0")
+    server = agent.listen(path)
+    thread = threading.Thread(target=agent.loop, args=(server,), daemon=True)
+    thread.start()
+    yield path
+    server.close()
+    thread.join(5)
+
+
+def test_no_agent(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHBIN_AGENT_SOCKET", str(tmp_path / "agent.sock"))
+    assert agent.forward(["a.txt"]) is None
+    # a socket nobody listens to
+    agent.listen(str(tmp_path / "agent.sock")).close()
+    assert agent.forward(["a.txt"]) is None
+
+
+def test_local_commands_and_opt_out(running_agent, monkeypatch):
+    assert agent.forward(["auth"]) is None
+    assert agent.forward(["a.txt", "--help"]) is None
+    monkeypatch.setenv("SHBIN_AGENT", "0")
+    assert agent.forward(["a.txt"]) is None
+
+
+@pytest.mark.parametrize("argv", [["-x"], ["--from-clipboard"], ["-nx", "-m", "msg"], ["-x", "-f", "a.png"]])
+def test_reading_the_clipboard_runs_locally(running_agent, argv):
+    assert agent.forward(argv) is None
+
+
+def test_the_client_copies_the_url(running_agent, monkeypatch, capsys):
+    copied = []
+    monkeypatch.setattr("pyclip.copy", copied.append)
+    monkeypatch.setattr("shbin.run", lambda args: print(agent.copy_in_client("https://the-url")))
+
+    assert agent.forward(["a.txt"]) == 0
+    assert copied == ["https://the-url"]
+    assert capsys.readouterr().out == "True\n"
+    # not within the agent
+    assert agent.copy_in_client("https://the-url") is False
+
+
+def test_forward_runs_in_the_client_context(running_agent, tmp_path, monkeypatch, capsys):
+    calls = []
+
+    def run(args):
+        calls.append((args["<path>"], os.getcwd(), os.environ.get("SHBIN_NAMESPACE")))
+        print("🔗 https://github.com/messi/pastebin/blob/main/a.txt")
+        print("a warning", file=sys.stderr)
+
+    monkeypatch.setattr("shbin.run", run)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SHBIN_NAMESPACE", "other")
+
+    assert agent.forward(["a.txt"]) == 0
+
+    assert calls == [(["a.txt"], str(tmp_path), "other")]
+    out, err = capsys.readouterr()
+    assert out == "🔗 https://github.com/messi/pastebin/blob/main/a.txt\n"
+    assert err == "a warning\n"
+
+
+def test_forward_stdin_and_exit_code(running_agent, monkeypatch, capsys):
+    def run(args):
+        print(sys.stdin.buffer.read().decode())
+        raise SystemExit(3)
+
+    monkeypatch.setattr("shbin.run", run)
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(b"from stdin")))
+
+    assert agent.forward(["-"]) == 3
+    assert capsys.readouterr().out == "from stdin\n"
+
+
+def test_errors_are_reported_to_the_client(running_agent, monkeypatch, capsys):
+    def run(args):
+        raise ValueError("boom")
+
+    monkeypatch.setattr("shbin.run", run)
+
+    assert agent.forward(["a.txt"]) == 1
+    assert "ValueError: boom" in capsys.readouterr().err
+    # the agent is still serving
+    assert agent.forward(["--jobs=0", "a.txt"]) == 1
+
+
+def test_main_uses_the_agent(running_agent, monkeypatch):
+    from shbin import main
+
+    monkeypatch.setattr("shbin.run", lambda args: sys.exit(2))
+    with pytest.raises(SystemExit) as e:
+        main(["a.txt"])
+    assert e.value.code == 2
+
+
+def test_only_one_agent(running_agent):
+    with pytest.raises(SystemExit, match="already running"):
+        agent.listen(running_agent)
@@ -0,0 +1,252 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from github import GithubException  # noqa: E402
+
+from shbin import aio, shards  # noqa: E402
+
+REPO = "https://api.github.com/repos/messi/pastebin"
+
+
+def removeprefix(text, prefix):
+    # str.removeprefix needs python 3.9
+    return text[len(prefix) :] if text.startswith(prefix) else text
+
+
+class FakeGitHub:
+    """
+    An in memory GitHub serving the endpoints the async client uses. `calls` records the requests.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.blobs = {}
+        self.truncated = False
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def __call__(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            await request.aread()
+            return self.handle(request)
+        finally:
+            self.in_flight -= 1
+
+    def handle(self, request):
+        method, url = request.method, str(request.url).split("?")[0]
+        self.calls.append((method, removeprefix(url, REPO)))
+        body = json.loads(request.content) if request.content else None
+        if url == REPO:
+            data = {
+                "url": REPO,
+                "html_url": "https://github.com/messi/pastebin",
+                "full_name": "messi/pastebin",
+                "default_branch": "main",
+            }
+            return httpx.Response(200, json=data)
+        if url.endswith("/user"):
+            return httpx.Response(200, json={"login": "messi"})
+        path = removeprefix(url, f"{REPO}/")
+        if path.startswith("contents/"):
+            name = removeprefix(path, "contents/")
+            if method == "PUT":
+                if name in self.files and body.get("sha") != f"sha-{name}":
+                    return httpx.Response(422, json={"message": "sha wasn't supplied"})
+                self.files[name] = base64.b64decode(body["content"])
+                return httpx.Response(201, json={})
+            if name not in self.files:
+                return httpx.Response(404, json={"message": "Not Found"})
+            if request.headers["Accept"] == "application/vnd.github.raw":
+                return httpx.Response(200, content=self.files[name])
+            return httpx.Response(200, json={"sha": f"sha-{name}"})
+        if path == "git/refs/heads/main" and method == "GET":
+            return httpx.Response(200, json={"object": {"sha": "c1"}})
+        if path == "git/commits/c1":
+            return httpx.Response(200, json={"sha": "c1", "tree": {"sha": "t1"}})
+        if path.startswith("git/trees/"):
+            return self.tree(path[len("git/trees/") :], "recursive" in request.url.params)
+        if path == "git/blobs" and method == "POST":
+            sha = f"blob{len(self.blobs)}"
+            self.blobs[sha] = base64.b64decode(body["content"])
+            return httpx.Response(201, json={"sha": sha})
+        if path.startswith("git/blobs/"):
+            name = removeprefix(path, "git/blobs/sha-")
+            return httpx.Response(200, content=self.files[name])
+        if path == "git/trees" or path == "git/commits":
+            return httpx.Response(201, json={"sha": "new"})
+        if path == "git/refs/heads/main":
+            return httpx.Response(200, json={})
+        return httpx.Response(500)
+
+    def tree(self, sha, recursive):
+        """
+        The tree of the branch ("main", or "t1" as the tree of its head commit), or of a directory:
+        "tree-messi:dir" for messi/dir.
+        """
+        prefix = "" if sha in ("main", "t1") else f"{sha[len('tree-') :].replace(':', '/')}/"
+        entries = {}
+        for name in self.files:
+            if not name.startswith(prefix):
+                continue
+            relative = name[len(prefix) :]
+            directory, _, rest = relative.partition("/")
+            if rest and not recursive:
+                tree_sha = f"tree-{prefix}{directory}".replace("/", ":")
+                entries[directory] = {"path": directory, "type": "tree", "sha": tree_sha}
+            else:
+                entries[relative] = {"path": relative, "type": "blob", "sha": f"sha-{name}"}
+        return httpx.Response(200, json={"sha": sha, "tree": list(entries.values()), "truncated": self.truncated})
+
+
+@pytest.fixture
+def github():
+    return FakeGitHub()
+
+
+def run(github, coro_fn, jobs=8):
+    async def main():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(github))
+        async with aio.Client("token", "messi/pastebin", jobs=jobs, http=http) as client:
+            return await coro_fn(client)
+
+    return asyncio.run(main())
+
+
+def test_upload_content(github):
+    url = run(github, lambda client: client.upload(b"hello", file_name="hello.txt"))
+    assert url == "https://github.com/messi/pastebin/blob/main/messi/hello.txt"
+    assert github.files == {"messi/hello.txt": b"hello"}
+
+
+def test_upload_updates_existing(github):
+    github.files["messi/hello.txt"] = b"old"
+    run(github, lambda client: client.upload(b"new", file_name="hello.txt"))
+    assert github.files == {"messi/hello.txt": b"new"}
+
+
+def test_upload_new_name_if_exists(github):
+    github.files["messi/hello.txt"] = b"old"
+    url = run(github, lambda client: client.upload(b"new", file_name="hello.txt", force_new=True))
+    assert github.files["messi/hello.txt"] == b"old"
+    (new,) = set(github.files) - {"messi/hello.txt"}
+    assert url.endswith(new) and github.files[new] == b"new"
+
+
+def test_upload_several_files_in_one_commit(github, tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.bin").write_bytes(b"\xff")
+    url = run(github, lambda client: client.upload([tmp_path / "a.txt", tmp_path / "b.bin"], namespace="x/"))
+    assert url == "https://github.com/messi/pastebin/tree/main/x"
+    assert list(github.blobs.values()) == [b"\xff"]
+    assert [call for call in github.calls if call[0] != "GET"] == [
+        ("POST", "/git/blobs"),
+        ("POST", "/git/trees"),
+        ("POST", "/git/commits"),
+        ("PATCH", "/git/refs/heads/main"),
+    ]
+
+
+@pytest.mark.parametrize("truncated", [False, True])
+def test_upload_several_files_over_existing_ones(github, tmp_path, capsys, truncated):
+    github.files["x/a.txt"] = b"old"
+    github.truncated = truncated
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    run(github, lambda client: client.upload([tmp_path / "a.txt", tmp_path / "b.txt"], namespace="x/"))
+    err = capsys.readouterr().err
+    assert "a.txt already exists. Updating it." in err
+    assert "b.txt already exists" not in err
+
+
+def test_upload_big_file_is_streamed(github, tmp_path, monkeypatch):
+    monkeypatch.setattr("shbin.aio.STREAM_THRESHOLD", 10)
+    (tmp_path / "big.log").write_bytes(b"x" * 100)
+    url = run(github, lambda client: client.upload(tmp_path / "big.log"))
+    assert url == "https://github.com/messi/pastebin/blob/main/messi/big.log"
+    assert list(github.blobs.values()) == [b"x" * 100]
+
+
+def test_many_pastes_in_flight(github):
+    async def paste_many(client):
+        return await asyncio.gather(*(client.upload(b"x", file_name=f"{i}.txt") for i in range(20)))
+
+    urls = run(github, paste_many)
+    assert len(set(urls)) == 20
+    assert github.max_in_flight > 1
+    # the metadata is requested once
+    assert github.calls.count(("GET", "")) == 1
+
+
+def test_metadata_of_the_repo_holding_the_namespace():
+    names = ["messi/pastebin", "messi/pastebin-2", "messi/pastebin-3"]
+    requested = []
+
+    def handler(request):
+        requested.append(request.url.path)
+        if request.url.path == "/user":
+            return httpx.Response(200, json={"login": "messi"})
+        return httpx.Response(200, json={"full_name": request.url.path[len("/repos/") :]})
+
+    async def main():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with aio.Client("token", ", ".join(names), http=http) as client:
+            return [
+                await client.metadata("messi/a.txt"),
+                await client.metadata("dibu/"),
+                await client.metadata("https://github.com/messi/pastebin-3/blob/main/x/a.txt"),
+            ]
+
+    found = asyncio.run(main())
+
+    assert found == [
+        ({"full_name": shards.choose(names, "messi")}, "messi"),
+        ({"full_name": shards.choose(names, "dibu")}, "messi"),
+        ({"full_name": "messi/pastebin-3"}, "messi"),
+    ]
+    # each once
+    assert requested.count("/user") == 1
+    assert len(requested) == len(set(requested))
+
+
+def test_download_file(github, tmp_path):
+    github.files["messi/hello.txt"] = b"hello"
+    assert run(github, lambda client: client.download("messi/hello.txt")) == b"hello"
+    target = run(github, lambda client: client.download("messi/hello.txt", tmp_path / "hello.txt"))
+    assert target.read_bytes() == b"hello"
+
+
+def test_download_not_found(github):
+    with pytest.raises(GithubException) as e:
+        run(github, lambda client: client.download("messi/nope.txt"))
+    assert e.value.status == 404
+
+
+def test_download_directory(github, tmp_path):
+    github.files.update({"messi/dir/a.txt": b"a", "messi/dir/sub/b.txt": b"b", "messi/other.txt": b"o"})
+    written = run(github, lambda client: client.download("messi/dir/", tmp_path / "dir"), jobs=2)
+    assert sorted(p.relative_to(tmp_path).as_posix() for p in written) == ["dir/a.txt", "dir/sub/b.txt"]
+    assert (tmp_path / "dir/sub/b.txt").read_bytes() == b"b"
+    assert github.max_in_flight <= 2
+
+
+def test_download_directory_too_big(github, tmp_path):
+    github.files["messi/dir/a.txt"] = b"a"
+    github.truncated = True
+    with pytest.raises(aio.TruncatedTree):
+        run(github, lambda client: client.download("messi/dir/", tmp_path / "dir"))
+
+
+def test_missing_credentials(monkeypatch):
+    monkeypatch.delenv("SHBIN_GITHUB_TOKEN", raising=False)
+    monkeypatch.delenv("SHBIN_REPO", raising=False)
+    monkeypatch.setattr("shbin.aio.load_config", lambda: {})
+    with pytest.raises(ValueError):
+        aio.Client()
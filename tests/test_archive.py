@@ -0,0 +1,105 @@
+import io
+import json
+import tarfile
+from unittest.mock import MagicMock
+
+import pytest
+
+from shbin import download
+from shbin.cache import git_blob_sha
+from shbin.fetch import download_archive
+
+
+def tarball(files):
+    fileobj = io.BytesIO()
+    with tarfile.open(fileobj=fileobj, mode="w:gz") as tar:
+        directory = tarfile.TarInfo("messi-pastebin-abc1234")
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"messi-pastebin-abc1234/{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    fileobj.seek(0)
+    return fileobj
+
+
+@pytest.fixture
+def repo():
+    return MagicMock(
+        full_name="messi/pastebin", name="pastebin", default_branch="main", url="https://api/repos/messi/pastebin"
+    )
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    requests = []
+
+    def serve(files):
+        def request(method, url, **kwargs):
+            requests.append((method, url))
+            response = MagicMock(raw=tarball(files))
+            response.__enter__.return_value = response
+            return response
+
+        monkeypatch.setattr("shbin.fetch.transport.request", request)
+        return requests
+
+    return serve
+
+
+def test_extracts_only_the_directory(tmp_path, monkeypatch, repo, serve, capsys):
+    monkeypatch.chdir(tmp_path)
+    requests = serve(
+        {
+            "messi/a.txt": b"a",
+            "messi/sub/b.txt": b"b",
+            "messier/c.txt": b"c",
+            "other/d.txt": b"d",
+        }
+    )
+
+    assert download_archive(repo, "messi") == 2
+
+    assert requests == [("GET", "https://api/repos/messi/pastebin/tarball/main")]
+    assert sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob("*") if path.is_file()) == [
+        "messi/a.txt",
+        "messi/sub/b.txt",
+    ]
+    assert "extracted 2 files into messi" in capsys.readouterr().out
+
+
+def test_chunked_files_are_reassembled(tmp_path, monkeypatch, repo, serve):
+    monkeypatch.chdir(tmp_path)
+    manifest = {
+        "format": "shbin-chunks",
+        "version": 1,
+        "name": "dump.bin",
+        "size": 6,
+        "parts": [
+            {"path": "dump.bin.chunks/00000", "sha": git_blob_sha(b"0123"), "size": 4},
+            {"path": "dump.bin.chunks/00001", "sha": git_blob_sha(b"45"), "size": 2},
+        ],
+    }
+    serve(
+        {
+            "messi/dump.bin.chunks.json": json.dumps(manifest).encode(),
+            "messi/dump.bin.chunks/00000": b"0123",
+            "messi/dump.bin.chunks/00001": b"45",
+        }
+    )
+
+    assert download_archive(repo, "messi") == 1
+
+    assert [path.name for path in (tmp_path / "messi").iterdir()] == ["dump.bin"]
+    assert (tmp_path / "messi" / "dump.bin").read_bytes() == b"012345"
+
+
+def test_download_with_archive(tmp_path, monkeypatch, repo, serve, capsys):
+    monkeypatch.chdir(tmp_path)
+    serve({"other/a.txt": b"a"})
+
+    download("messi/", repo, "messi", archive=True)
+
+    repo.get_contents.assert_not_called()
+    assert "content not found" in capsys.readouterr().out
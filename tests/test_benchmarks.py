@@ -0,0 +1,37 @@
+from benchmarks.bench import KB, Scenario, regressions, run_scenario, write_files
+from benchmarks.fake_github import FakeGitHub
+
+
+def test_upload_and_download_against_the_fake_server():
+    scenario = Scenario(
+        "roundtrip",
+        "upload and download a directory",
+        lambda w: write_files(w / "files", 3, KB),
+        [["dl", "bench/files/"]],
+        seed=[["files"]],
+    )
+
+    result = run_scenario(scenario)
+
+    assert result["endpoints"] == {"GET git/refs": 1, "GET git/trees": 3, "GET git/blobs": 3}
+    assert result["calls"] == 7
+    assert result["bytes_received"] > 3 * KB
+    assert result["peak_rss"] > 0
+
+
+def test_fake_server_throttles():
+    import requests
+
+    with FakeGitHub(throttle_every=2) as server:
+        assert requests.get(f"{server.url}/user").json() == {"login": "bench"}
+        throttled = requests.get(f"{server.url}/user")
+        assert throttled.status_code == 403
+        assert throttled.headers["Retry-After"] == "1"
+        assert requests.get(f"{server.url}/nope").status_code == 404
+        assert server.stats()["throttled"] == 1
+
+
+def test_regressions():
+    baseline = [{"scenario": "a", "calls": 5, "bytes_sent": 100}, {"scenario": "b", "calls": 5, "bytes_sent": 100}]
+    results = [{"scenario": "a", "calls": 6, "bytes_sent": 90}, {"scenario": "b", "calls": 4, "bytes_sent": 100}]
+    assert regressions(results, baseline) == ["a: calls went from 5 to 6"]
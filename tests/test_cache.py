@@ -0,0 +1,164 @@
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from github import GithubException
+
+from shbin import create_or_update
+from shbin.cache import TreeCache, git_blob_sha
+
+
+class Response:
+    def __init__(self, data=None, status_code=200, headers=None):
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    A fake GitHub for the git data endpoints the cache uses. `api.calls` records the requested paths.
+    """
+    api = Mock(calls=[], head="c1", etag='"e1"')
+    api.trees = {
+        "c1": {"sha": "root", "tree": [{"path": "messi", "type": "tree", "sha": "t-messi", "mode": "040000"}]},
+        "t-messi": {
+            "sha": "t-messi",
+            "truncated": False,
+            "tree": [
+                {"path": "hello.py", "type": "blob", "sha": "s1", "size": 5, "mode": "100644"},
+                {"path": "sub", "type": "tree", "sha": "t-sub", "mode": "040000"},
+                {"path": "sub/bye.py", "type": "blob", "sha": "s2", "size": 3, "mode": "100644"},
+            ],
+        },
+    }
+
+    def request(method, url, headers=None, params=None):
+        path = url.split("/git/")[1]
+        api.calls.append(path)
+        if path.startswith("ref/"):
+            if (headers or {}).get("If-None-Match") == api.etag:
+                return Response(status_code=304)
+            return Response({"object": {"sha": api.head}}, headers={"ETag": api.etag})
+        return Response(api.trees[path.split("/")[1]])
+
+    monkeypatch.setattr("shbin.cache.transport.request", request)
+    return api
+
+
+@pytest.fixture
+def repo():
+    return Mock(full_name="messi/pastebin", url="https://api/repos/messi/pastebin", default_branch="main")
+
+
+@pytest.fixture
+def cache(tmp_path, repo):
+    return TreeCache(repo, tmp_path / "cache.json")
+
+
+def test_git_blob_sha():
+    # $ echo -n hello | git hash-object --stdin
+    assert git_blob_sha(b"hello") == "b6fc4c620b67d95f953a5c1c1230aaab5db5a1b0"
+
+
+def test_refresh_and_lookup(cache, api):
+    cache.refresh("messi")
+    assert api.calls == ["ref/heads/main", "trees/c1", "trees/t-messi"]
+    assert cache.get("messi/hello.py") == {"sha": "s1", "size": 5, "mode": "100644"}
+    assert cache.get("messi/nope.py") is None
+    assert cache.covers("messi/nope.py")
+    assert not cache.covers("other/nope.py")
+    assert cache.entries("messi/sub") == [("bye.py", {"sha": "s2", "size": 3, "mode": "100644"})]
+
+
+def test_refresh_not_modified_is_a_single_request(cache, api, repo, tmp_path):
+    cache.refresh("messi")
+    api.calls.clear()
+
+    # a new process reads it from disk
+    cache = TreeCache(repo, tmp_path / "cache.json")
+    cache.refresh("messi")
+    assert api.calls == ["ref/heads/main"]
+    assert cache.get("messi/sub/bye.py")["sha"] == "s2"
+
+
+def test_refresh_when_the_namespace_didnt_change(cache, api):
+    cache.refresh("messi")
+    api.calls.clear()
+    api.head, api.etag = "c2", '"e2"'
+    api.trees["c2"] = api.trees["c1"]
+
+    cache.refresh("messi")
+    # the namespace tree has the same sha: no need to fetch it again
+    assert api.calls == ["ref/heads/main", "trees/c2"]
+    assert cache.covers("messi/hello.py")
+
+
+def test_refresh_missing_namespace(cache, api):
+    cache.refresh("messi/new")
+    assert cache.covers("messi/new/file.py")
+    assert cache.get("messi/new/file.py") is None
+
+
+def test_record_own_commit(cache, api):
+    cache.refresh("messi")
+    cache.record("c1", "c2", {"messi/new.py": {"sha": "s3", "size": 1, "mode": "100644"}})
+    assert cache.head == "c2"
+    assert cache.get("messi/new.py")["sha"] == "s3"
+
+    # the ref changed, but we know its head already
+    api.calls.clear()
+    api.head, api.etag = "c2", '"e2"'
+    cache.refresh("messi")
+    assert api.calls == ["ref/heads/main"]
+
+
+def test_record_deleted_files(cache, api):
+    cache.refresh("messi")
+    assert cache.get("messi/hello.py")
+    cache.record("c1", "c2", {"messi/hello.py": None})
+    assert cache.get("messi/hello.py") is None
+    assert cache.covers("messi/hello.py")
+
+
+def test_record_ignores_concurrent_commits(cache, api):
+    cache.refresh("messi")
+    cache.record("c0", "c2", {"messi/new.py": {"sha": "s3", "size": 1, "mode": "100644"}})
+    assert cache.head == "c1"
+    assert cache.get("messi/new.py") is None
+
+
+def test_update_with_cache_needs_a_single_request(cache, api, tmp_path, capsys):
+    cache.refresh("messi")
+    repo = MagicMock()
+    file = tmp_path / "hello.py"
+    file.write_bytes(b"hello")
+    create_or_update(repo, file, "messi", "", False, cache)
+    repo.create_file.assert_not_called()
+    repo.get_contents.assert_not_called()
+    repo.update_file.assert_called_once_with("messi/hello.py", "", b"hello", "s1")
+    assert "hello.py already exists. Updating it." in capsys.readouterr().err
+
+
+def test_update_with_stale_cache(cache, api, tmp_path):
+    cache.refresh("messi")
+    repo = MagicMock()
+    repo.update_file.side_effect = [GithubException(409, data="", headers=None), MagicMock()]
+    repo.get_contents.return_value.sha = "s1-new"
+    file = tmp_path / "hello.py"
+    file.write_bytes(b"hello")
+    create_or_update(repo, file, "messi", "", False, cache)
+    repo.update_file.assert_called_with("messi/hello.py", "", b"hello", "s1-new")
+
+
+def test_force_new_with_cache_renames_directly(cache, api, tmp_path, mocker):
+    cache.refresh("messi")
+    repo = MagicMock()
+    mocker.patch("shbin.secrets.token_urlsafe", return_value="abc")
+    file = tmp_path / "hello.py"
+    file.write_bytes(b"hello")
+    create_or_update(repo, file, "messi", "", True, cache)
+    repo.create_file.assert_called_once_with("messi/hello_abc.py", "", b"hello")
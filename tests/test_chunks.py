@@ -0,0 +1,162 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from github import GithubException
+
+from shbin import download, skip_unchanged
+from shbin.batch import commit_files
+from shbin.cache import git_blob_sha
+from shbin.chunks import CorruptedDownload, FileSlice, download_chunked, parse_manifest, part_ranges
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(monkeypatch, tmp_path_factory):
+    monkeypatch.setattr("shbin.journal.JOURNAL_DIR", tmp_path_factory.mktemp("journal"))
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setattr("shbin.batch.CHUNKED_THRESHOLD", 10)
+    monkeypatch.setattr("shbin.chunks.CHUNKED_THRESHOLD", 10)
+    monkeypatch.setattr("shbin.chunks.PART_SIZE", 4)
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    """
+    A fake blob store: uploads are kept by sha, and downloads served from it.
+    """
+    store = {}
+
+    def upload_blob(repo, fileobj, size):
+        fileobj.seek(0)
+        content = fileobj.read()
+        assert len(content) == size
+        store[git_blob_sha(content)] = content
+        return git_blob_sha(content)
+
+    def request(method, url, **kwargs):
+        content = store[url.rsplit("/", 1)[1]]
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.iter_content.side_effect = lambda size: [content[i : i + size] for i in range(0, len(content), size)]
+        return response
+
+    monkeypatch.setattr("shbin.blobs.upload_blob", upload_blob)
+    monkeypatch.setattr("shbin.chunks.transport.request", request)
+    return store
+
+
+@pytest.fixture
+def repo():
+    return MagicMock(full_name="messi/pastebin", default_branch="main", url="https://api/repos/messi/pastebin")
+
+
+def test_part_ranges():
+    assert part_ranges(10, 4) == [(0, 4), (4, 4), (8, 2)]
+    assert part_ranges(8, 4) == [(0, 4), (4, 4)]
+
+
+def test_file_slice(tmp_path):
+    (tmp_path / "f").write_bytes(b"0123456789")
+    with open(tmp_path / "f", "rb") as f:
+        part = FileSlice(f, 3, 5)
+        assert part.read(2) == b"34"
+        assert part.read() == b"567"
+        assert part.read() == b""
+        part.seek(0)
+        assert part.read(100) == b"34567"
+
+
+def test_upload_and_download_in_parts(tmp_path, monkeypatch, repo, blobs, small_parts, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dump.bin").write_bytes(b"0123456789abcdefg")
+    (tmp_path / "small.txt").write_text("small")
+
+    paths = commit_files(repo, [tmp_path / "dump.bin", tmp_path / "small.txt"], "messi", "msg")
+
+    assert paths == ["messi/dump.bin.chunks.json", "messi/small.txt"]
+    (elements, _), _ = repo.create_git_tree.call_args
+    identities = {e._identity["path"]: e._identity for e in elements}
+    assert list(identities) == [
+        "messi/dump.bin.chunks/00000",
+        "messi/dump.bin.chunks/00001",
+        "messi/dump.bin.chunks/00002",
+        "messi/dump.bin.chunks/00003",
+        "messi/dump.bin.chunks/00004",
+        "messi/dump.bin.chunks.json",
+        "messi/small.txt",
+    ]
+    assert identities["messi/dump.bin.chunks/00000"]["sha"] == git_blob_sha(b"0123")
+    manifest = parse_manifest(identities["messi/dump.bin.chunks.json"]["content"])
+    assert manifest["name"] == "dump.bin"
+    assert manifest["size"] == 17
+    assert [part["size"] for part in manifest["parts"]] == [4, 4, 4, 4, 1]
+
+    (tmp_path / "dump.bin").unlink()
+    # the file is found by its name too
+    repo.get_contents.side_effect = [
+        GithubException(404, {}, {}),
+        MagicMock(decoded_content=json.dumps(manifest).encode()),
+    ]
+    download("messi/dump.bin", repo, "messi", jobs=3)
+
+    assert repo.get_contents.call_args.args == ("messi/dump.bin.chunks.json",)
+    assert (tmp_path / "dump.bin").read_bytes() == b"0123456789abcdefg"
+    assert not (tmp_path / "dump.bin.part").exists()
+    assert "downloaded dump.bin" in capsys.readouterr().out
+
+
+def test_unchanged_file_in_parts_is_not_uploaded_again(tmp_path, repo, blobs, small_parts):
+    (tmp_path / "dump.bin").write_bytes(b"0123456789abcdefg")
+    cache = MagicMock()
+    commit_files(repo, [tmp_path / "dump.bin"], "messi", "msg", cache=cache)
+    (_, _, entries), _ = cache.record.call_args
+    cache.get.side_effect = entries.get
+
+    # the manifest is rebuilt locally, without uploading the parts
+    blobs.clear()
+    assert skip_unchanged([tmp_path / "dump.bin"], "messi", cache) == ([], [tmp_path / "dump.bin"])
+    assert blobs == {}
+
+    (tmp_path / "dump.bin").write_bytes(b"0123456789abcdefX")
+    assert skip_unchanged([tmp_path / "dump.bin"], "messi", cache) == ([tmp_path / "dump.bin"], [])
+
+
+def test_corrupted_part_is_not_saved(tmp_path, monkeypatch, repo, blobs, capsys):
+    monkeypatch.chdir(tmp_path)
+    blobs[git_blob_sha(b"0123")] = b"0123"
+    blobs[git_blob_sha(b"4567")] = b"4568"
+    manifest = {
+        "format": "shbin-chunks",
+        "version": 1,
+        "name": "../dump.bin",
+        "size": 8,
+        "parts": [
+            {"path": "dump.bin.chunks/00000", "sha": git_blob_sha(b"0123"), "size": 4},
+            {"path": "dump.bin.chunks/00001", "sha": git_blob_sha(b"4567"), "size": 4},
+        ],
+    }
+    repo.get_contents.return_value = MagicMock(decoded_content=json.dumps(manifest).encode())
+
+    download("messi/dump.bin.chunks.json", repo, "messi")
+
+    assert "doesn't match the manifest" in capsys.readouterr().out
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_chunked_checks_the_size(tmp_path, repo, blobs):
+    blobs[git_blob_sha(b"0123")] = b"0123"
+    manifest = {"name": "f", "size": 5, "parts": [{"sha": git_blob_sha(b"0123"), "size": 4}]}
+    pool = MagicMock(map=lambda f, *iterables: list(map(f, *iterables)))
+
+    with pytest.raises(CorruptedDownload):
+        download_chunked(repo, manifest, tmp_path / "f", pool)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parse_manifest():
+    assert parse_manifest(b'{"format": "shbin-chunks", "parts": []}') == {"format": "shbin-chunks", "parts": []}
+    assert parse_manifest(b'{"cells": []}') is None
+    assert parse_manifest(b"x") is None
@@ -1,6 +1,7 @@
-from unittest.mock import Mock, create_autospec, patch
+from unittest.mock import MagicMock, Mock, call, create_autospec, patch
 import io
 import os
+import pathlib
 
 import pytest
 from docopt import DocoptExit
@@ -8,7 +9,10 @@ from github import GithubException
 from github.Repository import Repository
 from pyclip import ClipboardSetupException as RealClipboardSetupException
 
-from shbin import __version__, __doc__, main
+import shbin
+from shbin import __version__, __doc__, get_repo_and_user, main
+from shbin.blobs import STREAM_THRESHOLD
+from shbin.cache import git_blob_sha
 
 PNG_1x1 = (
     b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00"
@@ -54,6 +58,21 @@ def pyclip(monkeypatch):
     return clip
 
 
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch, tmp_path_factory):
+    # the tree cache is tested on its own
+    monkeypatch.setenv("SHBIN_CACHE", "0")
+    monkeypatch.setattr("shbin.journal.JOURNAL_DIR", tmp_path_factory.mktemp("journal"))
+    # as the agent, that may be running in this machine
+    monkeypatch.setenv("SHBIN_AGENT", "0")
+
+
+@pytest.fixture(autouse=True)
+def no_shards(monkeypatch):
+    # the repos registered by a test don't leak into the next ones
+    monkeypatch.setattr("shbin.shards._repos", {})
+
+
 @pytest.fixture
 def stdin(monkeypatch):
     def patch(data):
@@ -206,9 +225,121 @@ def test_upload_glob(tmp_path, monkeypatch, patched_repo_and_user, repo):
 
     main(["*.md", "-m", "hello and bye"])
 
-    assert repo.create_file.call_count == 2
-    repo.create_file.assert_any_call("messi/hello.md", "hello and bye", b"hello")
-    repo.create_file.assert_any_call("messi/bye.md", "hello and bye", b"bye")
+    # a single commit, no per file request
+    repo.create_file.assert_not_called()
+    repo.create_git_blob.assert_not_called()
+    (elements, base_tree), _ = repo.create_git_tree.call_args
+    assert {e._identity["path"]: e._identity["content"] for e in elements} == {
+        "messi/hello.md": "hello",
+        "messi/bye.md": "bye",
+    }
+    assert base_tree == repo.get_git_commit.return_value.tree
+    repo.create_git_commit.assert_called_once_with(
+        "hello and bye", repo.create_git_tree.return_value, [repo.get_git_commit.return_value]
+    )
+    repo.get_git_ref.return_value.edit.assert_called_once_with(repo.create_git_commit.return_value.sha)
+
+
+def test_upload_many_binary_files_use_blobs(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    (tmp_path / "a.png").write_bytes(PNG_1x1)
+    (tmp_path / "b.md").write_bytes(b"b")
+    repo.create_git_blob.return_value.sha = "blobsha"
+    repo.html_url = "https://github.com/messi/pastebin"
+    repo.default_branch = "main"
+    monkeypatch.chdir(tmp_path)
+
+    main(["a.png", "b.md"])
+
+    repo.create_git_blob.assert_called_once_with(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGO4u+g9AATOAm+KxKvEAAAAAElFTkSuQmCC", "base64"
+    )
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity for e in elements] == [
+        {"path": "messi/a.png", "mode": "100644", "type": "blob", "sha": "blobsha"},
+        {"path": "messi/b.md", "mode": "100644", "type": "blob", "content": "b"},
+    ]
+    assert capsys.readouterr().out == "🔗📋 https://github.com/messi/pastebin/tree/main/messi\n"
+
+
+def test_upload_a_directory_keeps_structure(tmp_path, monkeypatch, patched_repo_and_user, repo):
+    for path in ["project/a.md", "project/sub/b.md", "project/sub/c.log", "project/.git/HEAD"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    monkeypatch.chdir(tmp_path)
+
+    main(["project", "--exclude", "*.log"])
+
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity["path"] for e in elements] == ["messi/project/a.md", "messi/project/sub/b.md"]
+
+
+def test_upload_many_force_new(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    repo.get_git_commit.return_value.tree.sha = "root"
+    repo.get_git_tree.side_effect = git_trees({"root": [("messi", "tree", "t1")], "t1": [("a.md", "blob", "s1")]})
+    monkeypatch.chdir(tmp_path)
+
+    with patch("shbin.batch.secrets.token_urlsafe", return_value="abc"):
+        main(["a.md", "b.md", "-n"])
+
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity["path"] for e in elements] == ["messi/a_abc.md", "messi/b.md"]
+    assert "a.md already exists. Creating as a_abc.md" in capsys.readouterr().err
+
+
+def test_upload_many_updates_existing_files(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    repo.get_git_commit.return_value.tree.sha = "root"
+    repo.get_git_tree.side_effect = git_trees({"root": [("messi", "tree", "t1")], "t1": [("a.md", "blob", "s1")]})
+    monkeypatch.chdir(tmp_path)
+
+    main(["a.md", "b.md"])
+
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity["path"] for e in elements] == ["messi/a.md", "messi/b.md"]
+    assert "a.md already exists. Updating it." in capsys.readouterr().err
+
+
+def test_upload_many_existing_files_in_a_big_namespace(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    repo.get_git_commit.return_value.tree.sha = "root"
+    trees = git_trees({"root": [("messi", "tree", "t1")], "t1": [("a.md", "blob", "s1")]})
+
+    def get_git_tree(sha, recursive=False):
+        tree = trees(sha, recursive)
+        # GitHub gives up listing it whole
+        tree.truncated = recursive
+        return tree
+
+    repo.get_git_tree.side_effect = get_git_tree
+    monkeypatch.chdir(tmp_path)
+
+    with patch("shbin.batch.secrets.token_urlsafe", return_value="abc"):
+        main(["a.md", "b.md", "-n"])
+
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity["path"] for e in elements] == ["messi/a_abc.md", "messi/b.md"]
+    assert repo.get_git_tree.call_args_list == [
+        call("root"),
+        call("t1", recursive=True),
+        call("root"),
+        call("t1"),
+    ]
+
+
+def test_upload_many_retries_if_branch_moved(tmp_path, monkeypatch, patched_repo_and_user, repo):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    repo.get_git_ref.return_value.edit.side_effect = [GithubException(422, data="", headers=None), None]
+    monkeypatch.chdir(tmp_path)
+
+    main(["*.md"])
+
+    assert repo.create_git_commit.call_count == 2
+    assert repo.get_git_ref.return_value.edit.call_count == 2
 
 
 def test_x_requires_functional_pyclip(pyclip, patched_repo_and_user, repo):
@@ -237,6 +368,29 @@ def test_png_from_clipboard(pyclip, patched_repo_and_user, repo, capsys):
     assert capsys.readouterr().out == "🔗📋 https://the-url\n"
 
 
+def test_png_from_clipboard_recompressed(pyclip, patched_repo_and_user, repo, mocker):
+    recompress = mocker.patch("shbin.image.recompress", return_value=(b"RIFFwebp", ".webp"))
+    pyclip.copy(PNG_1x1)
+    with patch("shbin.secrets.token_urlsafe", return_value="abc"):
+        main(["-x", "--image-quality=80"])
+    recompress.assert_called_once_with(PNG_1x1, ".png", "webp", 80)
+    repo.create_file.assert_any_call("messi/abc.webp", "", b"RIFFwebp")
+
+
+def test_png_from_stdin_with_name_recompressed(stdin, patched_repo_and_user, repo, mocker, monkeypatch):
+    monkeypatch.setenv("SHBIN_IMAGE_QUALITY", "avif:50")
+    mocker.patch("shbin.image.recompress", return_value=(b"avif", ".avif"))
+    stdin(PNG_1x1)
+    main(["-", "-f", "shot.png"])
+    repo.create_file.assert_any_call("messi/shot.avif", "", b"avif")
+
+
+def test_invalid_image_quality(pyclip, patched_repo_and_user):
+    pyclip.copy(PNG_1x1)
+    with pytest.raises(DocoptExit, match="image quality"):
+        main(["-x", "--image-quality=best"])
+
+
 def test_from_clipboard_with_name(pyclip, patched_repo_and_user, repo, capsys):
     pyclip.copy(b"data")
     main(["-x", "-f", "data.md"])
@@ -294,7 +448,7 @@ def test_png_from_stdin(stdin, pyclip, patched_repo_and_user, repo, capsys):
 
 
 def test_simple_update(pyclip, tmp_path, patched_repo_and_user, repo):
-    repo.create_file.side_effect = GithubException(400, data="", headers=None)
+    repo.create_file.side_effect = GithubException(422, data="", headers=None)
     repo.get_contents.return_value.sha = "abc123"
     file = tmp_path / "hello.py"
     file.write_bytes(b"hello")
@@ -305,7 +459,7 @@ def test_simple_update(pyclip, tmp_path, patched_repo_and_user, repo):
 
 def test_force_new(pyclip, tmp_path, patched_repo_and_user, repo, capsys):
     repo.create_file.side_effect = [
-        GithubException(400, data="", headers=None),
+        GithubException(422, data="", headers=None),
         {"content": Mock(html_url="https://the-url-2")},
     ]
     file = tmp_path / "hello.md"
@@ -318,9 +472,27 @@ def test_force_new(pyclip, tmp_path, patched_repo_and_user, repo, capsys):
     assert capsys.readouterr().out == "🔗📋 https://the-url-2\n"
 
 
+def test_upload_fails_on_errors_other_than_file_exists(tmp_path, patched_repo_and_user, repo):
+    repo.create_file.side_effect = GithubException(403, data="forbidden", headers=None)
+    file = tmp_path / "hello.py"
+    file.write_bytes(b"hello")
+    with pytest.raises(GithubException):
+        main([str(file)])
+    repo.get_contents.assert_not_called()
+    repo.update_file.assert_not_called()
+
+
+def test_download_not_found(tmp_path, patched_repo_and_user, repo, capsys):
+    repo.get_contents.side_effect = GithubException(404, data="", headers=None)
+    main(["dl", "nope.md"])
+    assert "content not found" in capsys.readouterr().out
+
+
 def test_download_a_file(tmp_path, patched_repo_and_user, repo):
     git_data = {
         "decoded_content": b"awesome content",
+        "encoding": "base64",
+        "size": 15,
     }
     repo.get_contents.return_value = create_github_downloable_files(git_data)
     working_dir = tmp_path / "working_dir"
@@ -328,3 +500,379 @@ def test_download_a_file(tmp_path, patched_repo_and_user, repo):
     os.chdir(working_dir)
     main(["dl", "hello.md"])
     assert (working_dir / "hello.md").read_bytes() == b"awesome content"
+
+
+def test_upload_many_with_jobs(tmp_path, monkeypatch, patched_repo_and_user, repo, mocker):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    monkeypatch.chdir(tmp_path)
+    commit_files = mocker.patch("shbin.batch.commit_files")
+
+    main(["*.md", "-j", "3"])
+    assert commit_files.call_args.args[5] == 3
+
+    monkeypatch.setenv("SHBIN_JOBS", "5")
+    main(["*.md"])
+    assert commit_files.call_args.args[5] == 5
+
+
+@pytest.mark.parametrize("jobs", ["0", "many"])
+def test_invalid_jobs(tmp_path, monkeypatch, patched_repo_and_user, repo, jobs):
+    (tmp_path / "a.md").write_bytes(b"a")
+    (tmp_path / "b.md").write_bytes(b"b")
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(DocoptExit, match="--jobs must be a positive integer"):
+        main(["*.md", "--jobs", jobs])
+
+
+def git_trees(trees):
+    """
+    A `get_git_tree` serving `trees`, as {sha: [(path, type, sha)]}. A recursive listing is
+    given as the entries of the tree followed by those of its subtrees.
+    """
+
+    def get_git_tree(sha, recursive=False):
+        entries = trees[sha] if recursive else [e for e in trees[sha] if "/" not in e[0]]
+        return Mock(truncated=False, tree=[Mock(path=path, type=type, sha=sha) for path, type, sha in entries])
+
+    return get_git_tree
+
+
+def test_download_a_directory_keeps_structure(tmp_path, monkeypatch, patched_repo_and_user, repo, mocker):
+    repo.default_branch = "main"
+    repo.full_name = "messi/pastebin"
+    repo.get_contents.return_value = []
+    repo.get_git_tree.side_effect = git_trees(
+        {
+            "main": [("dir", "tree", "t1"), ("dir2", "tree", "t3")],
+            "t1": [
+                ("foo.py", "blob", "s1"),
+                ("subdir", "tree", "t2"),
+                ("subdir/bar.py", "blob", "s2"),
+            ],
+        }
+    )
+    contents = {"s1": b"foo", "s2": b"bar"}
+    mocker.patch("shbin.fetch.download_blob", side_effect=lambda repo, sha, target: target.write_bytes(contents[sha]))
+    monkeypatch.chdir(tmp_path)
+
+    main(["dl", "dir"])
+
+    # the tree of the directory alone, not the whole branch
+    assert repo.get_git_tree.call_args_list == [call("main"), call("t1", recursive=True)]
+    assert (tmp_path / "dir/foo.py").read_bytes() == b"foo"
+    assert (tmp_path / "dir/subdir/bar.py").read_bytes() == b"bar"
+    assert not (tmp_path / "dir2").exists()
+
+
+def test_download_a_directory_url_skips_contents(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    repo.default_branch = "main"
+    repo.full_name = "messi/pastebin"
+    repo.get_git_tree.side_effect = git_trees({"main": []})
+    monkeypatch.chdir(tmp_path)
+
+    main(["dl", "https://github.com/messi/pastebin/tree/main/dir"])
+
+    repo.get_contents.assert_not_called()
+    assert "content not found" in capsys.readouterr().out
+
+
+def test_download_a_directory_too_big_to_list(tmp_path, monkeypatch, patched_repo_and_user, repo, capsys):
+    repo.default_branch = "main"
+    repo.get_git_tree.side_effect = [
+        Mock(truncated=False, tree=[Mock(path="dir", type="tree", sha="t1")]),
+        Mock(truncated=True, tree=[Mock(path="sub/foo.py", type="blob", sha="s1")]),
+    ]
+    monkeypatch.chdir(tmp_path)
+
+    main(["dl", "dir/"])
+
+    assert "dir has too many files to be listed. Download it with --archive" in capsys.readouterr().out
+    assert not (tmp_path / "dir").exists()
+
+
+def test_download_a_big_file_is_streamed(tmp_path, monkeypatch, patched_repo_and_user, repo, mocker):
+    repo.get_contents.return_value = create_github_downloable_files(
+        {"encoding": "none", "size": 5_000_000, "sha": "s1"}
+    )
+    download_blob = mocker.patch("shbin.download_blob")
+    monkeypatch.chdir(tmp_path)
+    main(["dl", "dumps/big.sql"])
+    download_blob.assert_called_once_with(repo, "s1", pathlib.Path("big.sql"))
+
+
+def test_big_stdin_is_streamed(stdin, patched_repo_and_user, repo, mocker, capsys):
+    repo.html_url = "https://github.com/messi/pastebin"
+    repo.default_branch = "main"
+    data = b"x" * (STREAM_THRESHOLD + 10)
+    stdin(data)
+    uploaded = []
+
+    def upload_blob(repo, fileobj, size):
+        uploaded.append((fileobj.read(), size))
+        return "blobsha"
+
+    mocker.patch("shbin.batch.upload_blob", side_effect=upload_blob)
+    main(["-", "-f", "big.log"])
+
+    repo.create_file.assert_not_called()
+    assert uploaded == [(data, len(data))]
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity for e in elements] == [
+        {"path": "messi/big.log", "mode": "100644", "type": "blob", "sha": "blobsha"}
+    ]
+    assert capsys.readouterr().out == "🔗📋 https://github.com/messi/pastebin/blob/main/messi/big.log\n"
+
+
+@pytest.fixture
+def cached_tree(monkeypatch, mocker, repo):
+    monkeypatch.setenv("SHBIN_CACHE", "1")
+    repo.html_url = "https://github.com/messi/pastebin"
+    repo.default_branch = "main"
+    repo.create_file.return_value["commit"] = MagicMock()
+    entries = {}
+    cache = mocker.patch("shbin.TreeCache").return_value
+    cache.get.side_effect = entries.get
+    return entries
+
+
+@pytest.mark.parametrize("argv", [["-x"], ["-"]])
+def test_paste_with_random_name_skips_the_tree(pyclip, stdin, patched_repo_and_user, repo, cached_tree, argv):
+    pyclip.copy(b"some data")
+    with patch("shbin.secrets.token_urlsafe", return_value="abc"):
+        main(argv)
+    shbin.TreeCache.return_value.refresh.assert_not_called()
+    repo.create_file.assert_called_once()
+
+
+def test_upload_skips_unchanged_files(tmp_path, monkeypatch, patched_repo_and_user, repo, cached_tree, capsys):
+    (tmp_path / "same.md").write_bytes(b"same")
+    (tmp_path / "new.md").write_bytes(b"new")
+    cached_tree["messi/same.md"] = {"sha": git_blob_sha(b"same")}
+    monkeypatch.chdir(tmp_path)
+
+    main(["same.md", "new.md"])
+
+    (elements, _), _ = repo.create_git_tree.call_args
+    assert [e._identity["path"] for e in elements] == ["messi/new.md"]
+    out, err = capsys.readouterr()
+    assert "1 uploaded, 1 unchanged" in err
+    assert out == "🔗📋 https://github.com/messi/pastebin/tree/main/messi\n"
+
+
+def test_upload_unchanged_single_file(tmp_path, patched_repo_and_user, repo, cached_tree, capsys):
+    file = tmp_path / "same.md"
+    file.write_bytes(b"same")
+    cached_tree["messi/same.md"] = {"sha": git_blob_sha(b"same")}
+
+    main([str(file)])
+
+    repo.create_file.assert_not_called()
+    repo.update_file.assert_not_called()
+    out, err = capsys.readouterr()
+    assert "0 uploaded, 1 unchanged" in err
+    assert out == "🔗📋 https://github.com/messi/pastebin/blob/main/messi/same.md\n"
+
+
+def test_upload_many_existing_files_from_the_cache(
+    tmp_path, monkeypatch, patched_repo_and_user, repo, cached_tree, capsys
+):
+    (tmp_path / "a.md").write_bytes(b"changed")
+    (tmp_path / "b.md").write_bytes(b"b")
+    cached_tree["messi/a.md"] = {"sha": git_blob_sha(b"a")}
+    monkeypatch.chdir(tmp_path)
+
+    main(["a.md", "b.md"])
+
+    repo.get_git_tree.assert_not_called()
+    err = capsys.readouterr().err
+    assert "a.md already exists. Updating it." in err
+    assert "b.md already exists" not in err
+
+
+def test_upload_unchanged_with_force_new(tmp_path, patched_repo_and_user, repo, cached_tree):
+    file = tmp_path / "same.md"
+    file.write_bytes(b"same")
+    cached_tree["messi/same.md"] = {"sha": git_blob_sha(b"same")}
+
+    with patch("shbin.secrets.token_urlsafe", return_value="abc"):
+        main([str(file), "-n"])
+
+    repo.create_file.assert_called_once_with("messi/same_abc.md", "", b"same")
+
+
+@pytest.fixture
+def metadata_config(mocker, monkeypatch):
+    monkeypatch.setenv("SHBIN_GITHUB_TOKEN", "123")
+    monkeypatch.setenv("SHBIN_REPO", "messi/pastebin")
+    mocker.patch("shbin.install_transport")
+    save_config = mocker.patch("shbin.save_config")
+    config = {}
+    mocker.patch("shbin.load_config", return_value=config)
+    return config, save_config
+
+
+def metadata_response(status_code=200, data=None, etag=None):
+    return Mock(status_code=status_code, headers={"ETag": etag}, json=Mock(return_value=data))
+
+
+REPO_DATA = {
+    "url": "https://api.github.com/repos/messi/pastebin",
+    "html_url": "https://github.com/messi/pastebin",
+    "full_name": "messi/pastebin",
+    "name": "pastebin",
+    "default_branch": "main",
+    "owner": {"login": "Messi"},
+    "description": "not cached",
+}
+
+
+@pytest.fixture
+def metadata_api(mocker):
+    responses = {
+        "https://api.github.com/repos/messi/pastebin": metadata_response(data=REPO_DATA, etag='"r"'),
+        "https://api.github.com/repos/messi/other": metadata_response(data=REPO_DATA, etag='"r"'),
+        "https://api.github.com/user": metadata_response(data={"login": "messi"}, etag='"u"'),
+    }
+    request = mocker.patch("shbin.transport.request", side_effect=lambda method, url, headers: responses[url])
+    request.responses = responses
+    return request
+
+
+def test_get_repo_and_user_fetches_and_caches_metadata(metadata_config, metadata_api):
+    config, save_config = metadata_config
+    repo, user = get_repo_and_user()
+    assert metadata_api.call_count == 2
+    assert user == "messi"
+    assert (repo.full_name, repo.default_branch, repo.owner.login) == ("messi/pastebin", "main", "Messi")
+    assert config["metadata"]["repo_etag"] == '"r"'
+    assert "description" not in config["metadata"]["repo"]
+    save_config.assert_called_once_with(config)
+
+
+def test_get_repo_and_user_uses_cached_metadata(metadata_config, metadata_api):
+    get_repo_and_user()
+    metadata_api.reset_mock()
+
+    repo, user = get_repo_and_user()
+    metadata_api.assert_not_called()
+    assert user == "messi"
+    assert repo.html_url == "https://github.com/messi/pastebin"
+
+
+def test_get_repo_and_user_revalidates_expired_metadata(metadata_config, metadata_api):
+    config, _ = metadata_config
+    get_repo_and_user()
+    config["metadata"]["checked_at"] -= shbin.METADATA_TTL + 1
+    metadata_api.reset_mock()
+    for url in metadata_api.responses:
+        metadata_api.responses[url] = metadata_response(status_code=304)
+
+    repo, user = get_repo_and_user()
+    assert metadata_api.call_count == 2
+    assert {call.kwargs["headers"]["If-None-Match"] for call in metadata_api.call_args_list} == {'"r"', '"u"'}
+    assert (repo.full_name, user) == ("messi/pastebin", "messi")
+
+
+def test_get_repo_and_user_ignores_metadata_of_another_repo(metadata_config, metadata_api, monkeypatch):
+    get_repo_and_user()
+    metadata_api.reset_mock()
+
+    monkeypatch.setenv("SHBIN_REPO", "messi/other")
+    get_repo_and_user()
+    assert metadata_api.call_count == 2
+
+
+def test_get_repo_and_user_with_shards(metadata_config, metadata_api, monkeypatch):
+    from shbin import shards
+
+    config, _ = metadata_config
+    other = dict(REPO_DATA, full_name="messi/other", url="https://api.github.com/repos/messi/other")
+    metadata_api.responses["https://api.github.com/repos/messi/other"] = metadata_response(data=other, etag='"o"')
+    monkeypatch.setenv("SHBIN_REPO", "messi/pastebin, messi/other")
+    monkeypatch.setattr("shbin.shards._repos", {})
+
+    repo, user = get_repo_and_user()
+
+    assert metadata_api.call_count == 3
+    assert repo.full_name == "messi/pastebin"
+    assert config["metadata"]["repo1"]["full_name"] == "messi/other"
+    assert [repo.full_name for repo in shards.all_repos(None)] == ["messi/pastebin", "messi/other"]
+    assert shards.repo_for(repo, "https://github.com/messi/other/blob/main/a/b.txt").full_name == "messi/other"
+
+
+@pytest.fixture
+def index(mocker):
+    index = mocker.patch("shbin.index.Index").return_value
+    index.is_stale.return_value = False
+    return index
+
+
+def test_ls_lists_the_namespace(patched_repo_and_user, index, capsys):
+    index.list.return_value = [("messi/hello.py", 5, "2024-01-02T00:00:00Z", "a message")]
+    main(["ls"])
+    index.list.assert_called_once_with("messi")
+    index.sync.assert_not_called()
+    assert capsys.readouterr().out == "2024-01-02  messi/hello.py\n"
+
+
+def test_ls_other_directory_synced(patched_repo_and_user, index, capsys):
+    index.list.return_value = []
+    main(["ls", "dibu/", "--sync"])
+    index.list.assert_called_once_with("dibu/")
+    index.sync.assert_called_once()
+    assert "nothing found" in capsys.readouterr().out
+
+
+def test_search(patched_repo_and_user, index, capsys):
+    index.is_stale.return_value = True
+    index.search.return_value = [
+        ("messi/hello.py", "2024-01-02T00:00:00Z", "say hello\nmore", None),
+        ("dibu/[notes].md", None, None, "shipping \x02labels\x03"),
+    ]
+    main(["search", "hello", "labels"])
+    index.sync.assert_called_once()
+    index.search.assert_called_once_with("hello labels")
+    assert capsys.readouterr().out.splitlines() == [
+        "2024-01-02  messi/hello.py  say hello",
+        "            dibu/[notes].md",
+        "            shipping labels",
+    ]
+
+
+@pytest.fixture
+def delete_files(mocker):
+    return mocker.patch("shbin.batch.delete_files")
+
+
+def test_gc_dry_run(patched_repo_and_user, index, delete_files, capsys):
+    index.list.return_value = [
+        ("messi/old.txt", 2048, "2020-01-02T00:00:00Z", "m"),
+        ("messi/new.txt", 2048, "2999-01-02T00:00:00Z", "m"),
+        ("dibu/old.txt", 2048, "2020-01-02T00:00:00Z", "m"),
+    ]
+    main(["gc", "--older-than=30", "--dry-run"])
+    index.sync.assert_called_once()
+    delete_files.assert_not_called()
+    out, err = capsys.readouterr()
+    assert out == "2020-01-02     2.0 KB  messi/old.txt\n"
+    assert "1 files, 2.0 KB would be reclaimed" in err
+
+
+def test_gc_deletes_in_a_single_commit(patched_repo_and_user, repo, index, delete_files, capsys):
+    index.list.return_value = [
+        ("messi/a.bin", 5000, "2020-01-02T00:00:00Z", "m"),
+        ("messi/logs/b.log", 5000, "2020-01-02T00:00:00Z", "m"),
+        ("messi/logs/c.log", 10, "2020-01-02T00:00:00Z", "m"),
+    ]
+    main(["gc", "messi/logs", "--larger-than=1KB", "-m", "cleanup"])
+    delete_files.assert_called_once_with(repo, ["messi/logs/b.log"], "cleanup", None)
+    assert "deleted 1 files" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "argv", (["gc"], ["gc", "--older-than=soon"], ["gc", "--larger-than=big"], ["gc", "--quota=-1"])
+)
+def test_gc_needs_a_valid_policy(patched_repo_and_user, index, argv):
+    with pytest.raises(DocoptExit):
+        main(argv)
@@ -0,0 +1,128 @@
+import datetime
+from unittest.mock import MagicMock, Mock
+
+from shbin.batch import delete_files
+from shbin.gc import collect, group_chunks, matcher, select
+
+NOW = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def files(*rows):
+    return group_chunks(rows)
+
+
+def paths(selected):
+    return [f["path"] for f in selected]
+
+
+def test_matcher():
+    match = matcher(["messi/logs", "*/*.tmp"])
+    assert match("messi/logs/a.txt")
+    assert match("messi/logs")
+    assert match("dibu/x.tmp")
+    assert not match("messi/logs.txt")
+    assert not match("dibu/deep/x.tmp")
+    assert matcher(["**"])("a/b/c")
+
+
+def test_group_chunks_folds_parts_into_their_manifest():
+    grouped = files(
+        ("messi/dump.bin.chunks.json", 100, "2024-01-01T00:00:00Z"),
+        ("messi/dump.bin.chunks/00000", 1000, None),
+        ("messi/dump.bin.chunks/00001", 500, None),
+        ("messi/other.chunks/00000", 7, None),
+    )
+    assert grouped == [
+        {
+            "path": "messi/dump.bin.chunks.json",
+            "size": 1600,
+            "date": "2024-01-01T00:00:00Z",
+            "parts": ["messi/dump.bin.chunks/00000", "messi/dump.bin.chunks/00001"],
+        },
+        # no manifest: just a file
+        {"path": "messi/other.chunks/00000", "size": 7, "date": None, "parts": []},
+    ]
+
+
+def test_select_older_than():
+    found = files(
+        ("messi/old.txt", 1, "2024-01-01T00:00:00Z"),
+        ("messi/new.txt", 1, "2024-05-30T00:00:00Z"),
+        ("messi/unknown.txt", 1, None),
+    )
+    assert paths(select(found, older_than=30, now=NOW)) == ["messi/old.txt"]
+
+
+def test_select_rules_must_all_be_broken():
+    found = files(
+        ("messi/old-big.bin", 2000, "2024-01-01T00:00:00Z"),
+        ("messi/old-small.txt", 10, "2024-01-01T00:00:00Z"),
+        ("messi/new-big.bin", 2000, "2024-05-30T00:00:00Z"),
+    )
+    assert paths(select(found, larger_than=1000)) == ["messi/old-big.bin", "messi/new-big.bin"]
+    assert paths(select(found, older_than=30, larger_than=1000, now=NOW)) == ["messi/old-big.bin"]
+
+
+def test_select_quota_keeps_the_newest_files_of_each_namespace():
+    found = files(
+        ("messi/a", 400, "2024-01-01T00:00:00Z"),
+        ("messi/b", 400, "2024-02-01T00:00:00Z"),
+        ("messi/c", 400, "2024-03-01T00:00:00Z"),
+        ("dibu/a", 900, "2024-01-01T00:00:00Z"),
+    )
+    assert paths(select(found, quota=1000)) == ["messi/a"]
+    assert paths(select(found, quota=500)) == ["messi/a", "messi/b", "dibu/a"]
+
+
+def test_collect_completes_sizes_and_dates(mocker):
+    index = MagicMock()
+    index.list.side_effect = [
+        [("messi/a.txt", None, "2024-01-01T00:00:00Z", "m"), ("messi/b.txt", 5, None, None)],
+        [("messi/a.txt", 3, "2024-01-01T00:00:00Z", "m"), ("messi/b.txt", 5, None, None), ("dibu/c", 1, None, None)],
+    ]
+    last_commits = mocker.patch(
+        "shbin.listing.last_commits", return_value=[{"date": "2023-01-01T00:00:00Z", "message": "old", "author": ""}]
+    )
+
+    found = collect(index, ["messi"], exclude=["*.log"], need_dates=True)
+
+    index.sync.assert_called_once()
+    index.snapshot.assert_called_once_with(index.get_meta.return_value)
+    last_commits.assert_called_once_with(index.repo, ["messi/b.txt"])
+    index.set_last_commit.assert_called_once_with("messi/b.txt", "2023-01-01T00:00:00Z", "old")
+    assert [(f["path"], f["size"], f["date"]) for f in found] == [
+        ("messi/a.txt", 3, "2024-01-01T00:00:00Z"),
+        ("messi/b.txt", 5, "2023-01-01T00:00:00Z"),
+    ]
+
+
+def test_delete_files_in_a_single_commit(mocker):
+    responses = {
+        ("GET", "git/ref/heads/main"): {"object": {"sha": "c1"}},
+        ("GET", "git/commits/c1"): {"tree": {"sha": "t1"}},
+        ("POST", "git/trees"): {"sha": "t2"},
+        ("POST", "git/commits"): {"sha": "c2"},
+        ("PATCH", "git/refs/heads/main"): {},
+    }
+    request = mocker.patch(
+        "shbin.transport.request",
+        side_effect=lambda method, url, **kwargs: Mock(json=Mock(return_value=responses[method, url[len("api/") :]])),
+    )
+    repo = Mock(url="api", default_branch="main")
+    cache = Mock()
+
+    assert delete_files(repo, ["messi/a", "messi/b"], "cleanup", cache) == "c2"
+
+    assert [(method, url[len("api/") :]) for method, url in (c.args for c in request.call_args_list)] == list(responses)
+    tree = request.call_args_list[2].kwargs["json"]
+    assert tree == {
+        "base_tree": "t1",
+        "tree": [
+            {"path": "messi/a", "mode": "100644", "type": "blob", "sha": None},
+            {"path": "messi/b", "mode": "100644", "type": "blob", "sha": None},
+        ],
+    }
+    assert request.call_args_list[3].kwargs["json"] == {"message": "cleanup", "tree": "t2", "parents": ["c1"]}
+    assert request.call_args.kwargs["json"] == {"sha": "c2"}
+    cache.record.assert_called_once_with("c1", "c2", {"messi/a": None, "messi/b": None})
+    assert delete_files(repo, [], "cleanup") is None
@@ -1,6 +1,15 @@
+import base64
+import os
+import io
+import json
+import threading
+import time
+
 import pytest
 
 from shbin import FakePath, expand_paths
+from shbin.batch import commit_files
+from shbin.blobs import CHUNK_SIZE, Base64Body
 
 
 def test_fake_path():
@@ -9,6 +18,29 @@ def test_fake_path():
     assert fp.suffix == ".py"
     assert fp.stem == "foo"
     assert fp.is_absolute() is False
+    assert fp.stat().st_size == 4
+    assert fp.open().read() == b"x123"
+
+
+def test_fake_path_with_fileobj(tmp_path):
+    with open(tmp_path / "content", "w+b") as fileobj:
+        fileobj.write(b"x123")
+        fp = FakePath("foo.py", fileobj=fileobj)
+        assert fp.stat().st_size == 4
+        with fp.open() as f:
+            assert f.read() == b"x123"
+        # it can be read again
+        assert fp.read_bytes() == b"x123"
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, CHUNK_SIZE - 1, CHUNK_SIZE, 2 * CHUNK_SIZE + 1])
+def test_base64_body(size):
+    content = bytes(range(256)) * (size // 256 + 1)
+    content = content[:size]
+    body = Base64Body(io.BytesIO(content), size)
+    encoded = b"".join(body)
+    assert len(encoded) == len(body)
+    assert json.loads(encoded) == {"encoding": "base64", "content": base64.b64encode(content).decode()}
 
 
 @pytest.fixture
@@ -38,3 +70,97 @@ def test_expand_path_with_relative_patterns(given, expected, a_dir):
 def test_expand_path_support_absolute(a_dir):
     a_absolute = (a_dir / "a.py").resolve()
     assert next(expand_paths([a_absolute])) == a_absolute
+
+
+def test_commit_files_uploads_blobs_concurrently(tmp_path, mocker):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def create_git_blob(content, encoding):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+        return mocker.Mock(sha="sha")
+
+    repo = mocker.Mock()
+    repo.create_git_blob.side_effect = create_git_blob
+    repo.get_git_tree.return_value.tree = []
+    files = []
+    for i in range(12):
+        files.append(tmp_path / f"{i}.bin")
+        files[-1].write_bytes(b"\xff" * (i + 1))
+
+    paths = commit_files(repo, files, "ns", "msg", jobs=3)
+
+    assert paths == [f"ns/{i}.bin" for i in range(12)]
+    assert repo.create_git_blob.call_count == 12
+    assert max(peak) == 3
+
+
+@pytest.fixture
+def a_project(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for path in [
+        "logo.png",
+        "docs/a.png",
+        "docs/deep/b.png",
+        "docs/deep/notes.md",
+        "docs/build/c.png",
+        "docs/keep.log",
+        "debug.log",
+        "node_modules/pkg/d.png",
+        ".git/e.png",
+        "env/lib/f.png",
+        "dir.png/g.txt",
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).touch()
+    (tmp_path / "env/pyvenv.cfg").touch()
+    (tmp_path / ".gitignore").write_text("# comment\n*.log\nbuild/\n")
+    (tmp_path / "docs/.shbinignore").write_text("!keep.log\n/deep/notes.md\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "given, exclude, expected",
+    [
+        (["**/*.png"], [], ["logo.png", "docs/a.png", "docs/deep/b.png"]),
+        (["*.png"], [], ["logo.png"]),
+        (["docs/*/*.png"], [], ["docs/deep/b.png"]),
+        (["**/*.log"], [], ["docs/keep.log"]),
+        (["**/*.png"], ["deep/", "logo.*"], ["docs/a.png"]),
+        # overlapping patterns
+        (["*.png", "logo.png", "**/*.png"], [], ["logo.png", "docs/a.png", "docs/deep/b.png"]),
+        # given explicitly, ignore files don't apply, but --exclude does
+        (["debug.log", "node_modules/pkg/d.png"], [], ["debug.log", "node_modules/pkg/d.png"]),
+        (["debug.log"], ["*.log"], []),
+        (["missing.txt", "missing/*.png"], [], []),
+    ],
+)
+def test_expand_paths_with_ignore_rules(a_project, given, exclude, expected):
+    assert [str(path) for path in expand_paths(given, exclude)] == expected
+
+
+def test_expand_paths_walks_directories(a_project):
+    files = list(expand_paths(["docs", "docs/a.png"]))
+    assert [f.name for f in files] == ["docs/a.png", "docs/keep.log", "docs/deep/b.png"]
+    assert files[2].stem == "docs/deep/b"
+    assert files[2].suffix == ".png"
+    assert files[2].read_bytes() == b""
+
+
+def test_expand_paths_walks_absolute_directories(a_project):
+    files = list(expand_paths([a_project / "docs" / "deep"]))
+    assert [f.name for f in files] == ["deep/b.png", "deep/notes.md"]
+    assert [str(f) for f in files] == [str(a_project / "docs/deep/b.png"), str(a_project / "docs/deep/notes.md")]
+
+
+def test_expand_paths_prunes_ignored_directories(a_project, mocker):
+    scandir = mocker.patch("shbin.walk.os.scandir", side_effect=os.scandir)
+    list(expand_paths(["**/*.png"]))
+    walked = sorted(call.args[0] for call in scandir.call_args_list)
+    assert walked == ["./", "./dir.png", "./docs", "./docs/deep"]
@@ -0,0 +1,86 @@
+import io
+import random
+
+import pytest
+
+from shbin.image import parse_quality, recompress
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+needs_pillow = pytest.mark.skipif(Image is None, reason="Pillow is not installed")
+
+
+def screenshot(fmt="PNG", **kwargs):
+    """
+    Something like a screenshot: flat areas with some detail, saved barely compressed.
+    """
+    rng = random.Random(0)
+    image = Image.new("RGB", (400, 300), "white")
+    for _ in range(200):
+        x, y = rng.randrange(400), rng.randrange(300)
+        image.paste((rng.randrange(256), 0, 0), (x, y, x + 20, y + 4))
+    output = io.BytesIO()
+    image.save(output, fmt, **kwargs)
+    return output.getvalue()
+
+
+def pixels(content):
+    with Image.open(io.BytesIO(content)) as image:
+        return image.convert("RGB").tobytes()
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("lossless", ("png", None)), ("80", ("webp", 80)), ("WebP:70", ("webp", 70)), (" avif:60 ", ("avif", 60))],
+)
+def test_parse_quality(value, expected):
+    assert parse_quality(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "0", "101", "best", "gif:50"])
+def test_parse_quality_invalid(value):
+    with pytest.raises(ValueError):
+        parse_quality(value)
+
+
+@needs_pillow
+def test_lossless_keeps_the_pixels():
+    content = screenshot(compress_level=0)
+    recompressed, extension = recompress(content, ".png", "png", None)
+    assert extension == ".png"
+    assert len(recompressed) < len(content) / 4
+    assert pixels(recompressed) == pixels(content)
+
+
+@needs_pillow
+def test_lossy_converts_to_webp():
+    content = screenshot(compress_level=0)
+    recompressed, extension = recompress(content, ".png", "webp", 80)
+    assert extension == ".webp"
+    assert recompressed.startswith(b"RIFF")
+    assert len(recompressed) < len(content)
+
+
+@needs_pillow
+def test_kept_when_not_smaller():
+    content = screenshot(optimize=True)
+    assert recompress(content, ".png", "png", None) == (content, ".png")
+
+
+@needs_pillow
+def test_only_png_and_jpeg():
+    content = screenshot("GIF")
+    assert recompress(content, ".gif", "webp", 80) == (content, ".gif")
+    # lossless is for PNG only
+    content = screenshot("JPEG")
+    assert recompress(content, ".jpg", "png", None) == (content, ".jpg")
+
+
+@needs_pillow
+def test_broken_image(capsys):
+    content = b"\x89PNG\r\n\x1a\n" + b"garbage" * 100
+    assert recompress(content, ".png", "webp", 80) == (content, ".png")
+    assert "not recompressed" in capsys.readouterr().err
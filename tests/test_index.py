@@ -0,0 +1,192 @@
+from unittest.mock import Mock
+
+import pytest
+from github import GithubException
+
+from shbin.index import Index
+
+
+class Response:
+    def __init__(self, data=None, status_code=200, headers=None, content=b""):
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def json(self):
+        return self.data
+
+    def iter_content(self, size):
+        yield self.content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def commit(sha, message, files):
+    return {
+        "sha": sha,
+        "commit": {"message": message, "author": {"date": f"2024-01-0{sha[-1]}T00:00:00Z"}},
+        "files": files,
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    A fake GitHub with a history of commits. `api.calls` records the requested paths.
+    """
+    api = Mock(calls=[], head="c1", etag='"e1"', blobs={})
+    api.tree = [
+        {"path": "messi", "type": "tree", "sha": "t1"},
+        {"path": "messi/hello.py", "type": "blob", "sha": "s1", "size": 5},
+        {"path": "messi/aws/fulfillment.ipynb", "type": "blob", "sha": "s2", "size": 10},
+        {"path": "dibu/notes.md", "type": "blob", "sha": "s3", "size": 3},
+    ]
+    api.commits = {
+        "c1": commit(
+            "c1",
+            "first",
+            [
+                {"filename": "messi/hello.py", "status": "added", "sha": "s1"},
+                {"filename": "messi/aws/fulfillment.ipynb", "status": "added", "sha": "s2"},
+                {"filename": "dibu/notes.md", "status": "added", "sha": "s3"},
+            ],
+        )
+    }
+    api.compare = {}
+
+    def request(method, url, headers=None, params=None, stream=False):
+        path = url.split("/repos/messi/pastebin/")[1]
+        api.calls.append(path)
+        if path.startswith("git/ref/"):
+            if (headers or {}).get("If-None-Match") == api.etag:
+                return Response(status_code=304)
+            return Response({"object": {"sha": api.head}}, headers={"ETag": api.etag})
+        if path.startswith("git/trees/"):
+            return Response({"sha": "root", "tree": api.tree, "truncated": False})
+        if path == "commits":
+            return Response([api.commits[sha] for sha in sorted(api.commits, reverse=True)])
+        if path.startswith("commits/"):
+            return Response(api.commits[path.split("/")[1]])
+        if path.startswith("compare/"):
+            if path not in api.compare:
+                raise GithubException(404, {"message": "Not Found"}, {})
+            return Response(api.compare[path])
+        if path.startswith("git/blobs/"):
+            return Response(content=api.blobs[path.split("/")[-1]])
+
+    monkeypatch.setattr("shbin.index.transport.request", request)
+    return api
+
+
+@pytest.fixture
+def repo():
+    return Mock(full_name="messi/pastebin", url="https://api/repos/messi/pastebin", default_branch="main")
+
+
+@pytest.fixture
+def index(tmp_path, repo):
+    index = Index(repo, tmp_path / "index.sqlite")
+    yield index
+    index.close()
+
+
+def test_first_sync_lists_the_tree(index, api):
+    index.sync()
+    assert api.calls == ["git/ref/heads/main", "git/trees/c1", "commits", "commits/c1"]
+    assert index.list("messi") == [
+        ("messi/aws/fulfillment.ipynb", 10, "2024-01-01T00:00:00Z", "first"),
+        ("messi/hello.py", 5, "2024-01-01T00:00:00Z", "first"),
+    ]
+    assert [row[0] for row in index.list()] == ["dibu/notes.md", "messi/aws/fulfillment.ipynb", "messi/hello.py"]
+    assert index.list("mes") == []
+
+
+def test_sync_not_modified_is_a_single_request(index, api, repo, tmp_path):
+    index.sync()
+    index.close()
+    api.calls.clear()
+
+    index = Index(repo, tmp_path / "index.sqlite")
+    assert not index.is_stale()
+    index.sync()
+    assert api.calls == ["git/ref/heads/main"]
+    index.close()
+
+
+def test_incremental_sync(index, api):
+    index.sync()
+    api.calls.clear()
+    api.head, api.etag = "c3", '"e3"'
+    api.commits["c2"] = commit(
+        "c2",
+        "rename and remove",
+        [
+            {"filename": "messi/hi.py", "previous_filename": "messi/hello.py", "status": "renamed", "sha": "s1"},
+            {"filename": "dibu/notes.md", "status": "removed", "sha": "s3"},
+        ],
+    )
+    api.commits["c3"] = commit(
+        "c3", "aws update", [{"filename": "messi/aws/orders.csv", "status": "added", "sha": "s4"}]
+    )
+    api.compare["compare/c1...c3"] = {"status": "ahead", "total_commits": 2, "commits": [{"sha": "c2"}, {"sha": "c3"}]}
+
+    index.sync()
+    assert api.calls == ["git/ref/heads/main", "compare/c1...c3", "commits/c2", "commits/c3"]
+    assert [(path, message) for path, _, _, message in index.list()] == [
+        ("messi/aws/fulfillment.ipynb", "first"),
+        ("messi/aws/orders.csv", "aws update"),
+        ("messi/hi.py", "rename and remove"),
+    ]
+
+
+def test_sync_after_force_push_lists_the_tree(index, api):
+    index.sync()
+    api.calls.clear()
+    api.head, api.etag = "c2", '"e2"'
+    api.tree = api.tree[:2]
+    api.commits = {"c2": commit("c2", "rewritten", [{"filename": "messi/hello.py", "status": "added", "sha": "s1"}])}
+
+    index.sync()
+    assert api.calls == ["git/ref/heads/main", "compare/c1...c2", "git/trees/c2", "commits", "commits/c2"]
+    assert index.list() == [("messi/hello.py", 5, "2024-01-02T00:00:00Z", "rewritten")]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("hello", ["messi/hello.py"]),
+        ("fulfil", ["messi/aws/fulfillment.ipynb"]),
+        ("messi aws", ["messi/aws/fulfillment.ipynb"]),
+        ("first", ["dibu/notes.md", "messi/aws/fulfillment.ipynb", "messi/hello.py"]),
+        ('"bad syntax', []),
+        ("", []),
+    ],
+)
+def test_search(index, api, query, expected):
+    index.sync()
+    assert sorted(row[0] for row in index.search(query)) == expected
+
+
+def test_search_without_fts(index, api):
+    index.fts = False
+    index.sync()
+    assert [row[0] for row in index.search("aws fulfil")] == ["messi/aws/fulfillment.ipynb"]
+
+
+def test_search_content(index, api, monkeypatch):
+    monkeypatch.setenv("SHBIN_INDEX_CONTENT", "1")
+    api.blobs = {"s1": b"print('hello')", "s2": b"\xff\xfe", "s3": b"shipping labels"}
+    index.sync()
+    ((path, _, _, snippet),) = index.search("labels")
+    assert path == "dibu/notes.md"
+    assert snippet == "shipping \x02labels\x03"
+
+    # contents are downloaded once
+    api.calls.clear()
+    index.sync()
+    assert not [call for call in api.calls if call.startswith("git/blobs/")]
@@ -0,0 +1,133 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from shbin.batch import commit_files
+from shbin.cache import git_blob_sha
+from shbin.chunks import download_chunked
+from shbin.fetch import download_directory
+from shbin.journal import Journal, file_key
+
+
+@pytest.fixture
+def repo():
+    return MagicMock(full_name="messi/pastebin", default_branch="main", url="https://api/repos/messi/pastebin")
+
+
+@pytest.fixture
+def pool():
+    return MagicMock(map=lambda f, *iterables: list(map(f, *iterables)))
+
+
+def test_journal_resume(tmp_path):
+    operation = {"operation": "upload", "namespace": "messi"}
+    with pytest.raises(KeyboardInterrupt):
+        with Journal(operation, directory=tmp_path) as journal:
+            journal.record("a", "sha-a")
+            assert journal.run("b", lambda: "sha-b") == "sha-b"
+            raise KeyboardInterrupt
+    # a half written line is ignored
+    with open(journal.path, "a") as f:
+        f.write('{"key": "c", "val')
+
+    with Journal(operation, resume=True, directory=tmp_path) as journal:
+        assert journal.run("a", pytest.fail) == "sha-a"
+        assert journal.get("b") == "sha-b"
+        assert journal.get("c") is None
+    # done: nothing left to resume
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_journal_without_resume_starts_over(tmp_path):
+    with pytest.raises(ValueError):
+        with Journal({"operation": "x"}, directory=tmp_path) as journal:
+            journal.record("a")
+            raise ValueError
+    with Journal({"operation": "x"}, directory=tmp_path) as journal:
+        assert journal.get("a") is None
+    with Journal({"operation": "y"}, resume=True, directory=tmp_path) as journal:
+        assert journal.done == {}
+
+
+def test_file_key_changes_with_the_file(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"1234")
+    key = file_key(path)
+    assert file_key(path) == key
+    assert file_key(path, 0, 2) != key
+    path.write_bytes(b"12345")
+    assert file_key(path) != key
+
+
+def test_resumed_upload_reuses_blobs(tmp_path, repo):
+    (tmp_path / "a.bin").write_bytes(b"\xffa")
+    (tmp_path / "b.bin").write_bytes(b"\xffb")
+    files = [tmp_path / "a.bin", tmp_path / "b.bin"]
+    repo.create_git_blob.side_effect = lambda content, encoding: MagicMock(sha="new")
+
+    with Journal({"operation": "upload"}, directory=tmp_path / "journal") as journal:
+        # a previous run uploaded a.bin before it was interrupted
+        journal.record(git_blob_sha(b"\xffa"))
+        commit_files(repo, files, "messi", "msg", journal=journal)
+
+    elements = repo.create_git_tree.call_args.args[0]
+    assert [element._identity["sha"] for element in elements] == [git_blob_sha(b"\xffa"), "new"]
+    assert repo.create_git_blob.call_count == 1
+
+
+def test_resumed_chunked_download_skips_the_parts_done(tmp_path, repo, pool, monkeypatch):
+    parts = [b"0123", b"4567", b"89"]
+    data = {"name": "f", "size": 10, "parts": [{"sha": git_blob_sha(part), "size": len(part)} for part in parts]}
+    requested = []
+
+    def download_part(repo, sha, size, f, offset):
+        requested.append(offset)
+        if offset == 8 and len(requested) == 3:
+            raise ConnectionError
+        f.seek(offset)
+        f.write(parts[offset // 4])
+        f.flush()
+
+    monkeypatch.setattr("shbin.chunks.download_part", download_part)
+    target = tmp_path / "f"
+    with pytest.raises(ConnectionError):
+        with Journal({"operation": "download"}, directory=tmp_path / "journal") as journal:
+            download_chunked(repo, data, target, pool, journal)
+    assert (tmp_path / "f.part").exists()
+
+    with Journal({"operation": "download"}, resume=True, directory=tmp_path / "journal") as journal:
+        download_chunked(repo, data, target, pool, journal)
+
+    assert requested == [0, 4, 8, 8]
+    assert target.read_bytes() == b"0123456789"
+    assert not (tmp_path / "f.part").exists()
+
+
+def test_download_directory_skips_files_up_to_date(tmp_path, repo, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "a.txt").write_bytes(b"a")
+    (tmp_path / "dir" / "b.txt").write_bytes(b"old b")
+    listing = [("a.txt", git_blob_sha(b"a")), ("b.txt", git_blob_sha(b"b"))]
+    monkeypatch.setattr("shbin.fetch.list_blobs", lambda *args: listing)
+    downloaded = []
+
+    def download_blob(repo, sha, target):
+        downloaded.append(target.name)
+        target.write_bytes(b"b")
+
+    monkeypatch.setattr("shbin.fetch.download_blob", download_blob)
+
+    download_directory(repo, "messi/dir")
+
+    assert downloaded == ["b.txt"]
+    assert (tmp_path / "dir" / "b.txt").read_bytes() == b"b"
+
+
+def test_journal_is_json_lines(tmp_path):
+    with pytest.raises(KeyboardInterrupt):
+        with Journal({"operation": "x"}, directory=tmp_path) as journal:
+            journal.record("a", [1, 2])
+            raise KeyboardInterrupt
+    assert [json.loads(line) for line in journal.path.read_text().splitlines()] == [{"key": "a", "value": [1, 2]}]
@@ -0,0 +1,117 @@
+from unittest.mock import MagicMock
+
+import pytest
+from github import GithubException
+
+from shbin import listing, main
+
+
+@pytest.fixture
+def repo():
+    return MagicMock(full_name="messi/pastebin", default_branch="main")
+
+
+@pytest.fixture
+def graphql(monkeypatch):
+    """
+    Answers the GraphQL queries with `answer(variables)`, recording them.
+    """
+    sent = []
+
+    def setup(answer):
+        def request(method, url, json):
+            sent.append((method, url, json))
+            return MagicMock(status_code=200, json=lambda: answer(json["variables"]))
+
+        monkeypatch.setattr("shbin.listing.transport.request", request)
+        return sent
+
+    return setup
+
+
+def entry(name, type="blob", size=None):
+    return {"name": name, "type": type, "object": {"byteSize": size} if type == "blob" else {}}
+
+
+def commit(date, login, message):
+    return {
+        "nodes": [
+            {"committedDate": date, "messageHeadline": message, "author": {"name": "x", "user": {"login": login}}}
+        ]
+    }
+
+
+def answer(variables):
+    if "expression" in variables:
+        tree = {
+            "entries": [
+                entry("b.txt", size=2048),
+                entry("sub", type="tree"),
+                entry("a.txt", size=10),
+            ]
+        }
+        return {"data": {"repository": {"object": tree}}}
+    paths = {key: value for key, value in variables.items() if key.startswith("p")}
+    history = {key: commit("2024-05-01T10:00:00Z", "messi", f"touch {path}") for key, path in paths.items()}
+    return {"data": {"repository": {"ref": {"target": history}}}}
+
+
+def test_graphql_url(monkeypatch):
+    monkeypatch.setattr("shbin.transport.API_URL", "https://api.github.com")
+    assert listing.graphql_url() == "https://api.github.com/graphql"
+    monkeypatch.setattr("shbin.transport.API_URL", "https://ghe.example.com/api/v3")
+    assert listing.graphql_url() == "https://ghe.example.com/api/graphql"
+
+
+def test_long_listing_in_pages(repo, graphql):
+    sent = graphql(answer)
+
+    pages = list(listing.long_listing(repo, "messi/", page_size=2))
+
+    assert [[entry["name"] for entry in page] for page in pages] == [["sub", "a.txt"], ["b.txt"]]
+    assert pages[0][1] == {
+        "name": "a.txt",
+        "path": "messi/a.txt",
+        "type": "blob",
+        "size": 10,
+        "commit": {"date": "2024-05-01T10:00:00Z", "author": "messi", "message": "touch messi/a.txt"},
+    }
+    # the entries, then a query per page
+    assert len(sent) == 3
+    assert sent[0][2]["variables"]["expression"] == "main:messi"
+    assert sent[1][2]["variables"] == {
+        "owner": "messi",
+        "name": "pastebin",
+        "ref": "refs/heads/main",
+        "p0": "messi/sub",
+        "p1": "messi/a.txt",
+    }
+    assert "p1: history(first: 1, path: $p1)" in sent[1][2]["query"]
+
+
+def test_no_such_directory(repo, graphql):
+    sent = graphql(lambda variables: {"data": {"repository": {"object": None}}})
+    assert list(listing.long_listing(repo, "nope")) == []
+    assert len(sent) == 1
+
+
+def test_errors_are_raised(repo, graphql):
+    graphql(lambda variables: {"errors": [{"message": "Bad credentials"}]})
+    with pytest.raises(GithubException):
+        list(listing.long_listing(repo, "messi"))
+
+
+def test_ls_l(repo, graphql, monkeypatch, capsys):
+    graphql(answer)
+    monkeypatch.setattr("shbin.get_repo_and_user", lambda: (repo, "messi"))
+    monkeypatch.setenv("SHBIN_AGENT", "0")
+
+    main(["ls", "-l"])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[:3] for line in lines] == [
+        ["2024-05-01", "messi", "sub/"],
+        ["2024-05-01", "10", "B"],
+        ["2024-05-01", "2.0", "KB"],
+    ]
+    assert lines[1].rstrip().endswith("a.txt  touch messi/a.txt")
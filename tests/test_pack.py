@@ -0,0 +1,115 @@
+import io
+import tarfile
+from unittest.mock import MagicMock
+
+import pytest
+
+from shbin import FakePath
+from shbin.pack import is_pack, open_pack, pack, pack_name, unpack
+from shbin.walk import DirectoryFile
+
+
+@pytest.fixture(params=[".pack.tar.gz", ".pack.tar.zst"])
+def suffix(request):
+    if request.param.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def packed(files, name):
+    fileobj = io.BytesIO()
+    pack(files, fileobj, name)
+    fileobj.seek(0)
+    return fileobj
+
+
+def test_pack_and_unpack(tmp_path, suffix):
+    (tmp_path / "a.log").write_text("a" * 1000)
+    (tmp_path / "b.txt").write_text("b")
+    files = [tmp_path / "a.log", DirectoryFile(tmp_path / "b.txt", "sub/b.txt")]
+    fileobj = packed(files, f"logs{suffix}")
+
+    with open_pack(fileobj, f"logs{suffix}") as tar:
+        assert unpack(tar, tmp_path / "out") == 2
+    assert (tmp_path / "out/a.log").read_text() == "a" * 1000
+    assert (tmp_path / "out/sub/b.txt").read_bytes() == b"b"
+
+
+def test_text_is_compressed(suffix):
+    content = b"2024-01-01 INFO all good\n" * 10_000
+    fileobj = packed([FakePath("app.log", content=content)], f"logs{suffix}")
+    assert len(fileobj.getvalue()) < len(content) / 10
+
+
+def test_unpack_skips_unsafe_members(tmp_path, capsys):
+    fileobj = io.BytesIO()
+    with tarfile.open(fileobj=fileobj, mode="w|gz") as tar:
+        for name in ["../evil.txt", "/etc/evil.txt", "ok.txt"]:
+            info = tarfile.TarInfo(name)
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b"ok"))
+        link = tarfile.TarInfo("link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        tar.addfile(link)
+    fileobj.seek(0)
+
+    with open_pack(fileobj, "x.pack.tar.gz") as tar:
+        assert unpack(tar, tmp_path / "out") == 1
+    assert [p.name for p in (tmp_path / "out").iterdir()] == ["ok.txt"]
+    assert not (tmp_path / "evil.txt").exists()
+    assert capsys.readouterr().out.count("skipping") == 3
+
+
+def test_pack_name(monkeypatch):
+    monkeypatch.setattr("shbin.pack.has_zstd", lambda: False)
+    assert pack_name("logs") == "logs.pack.tar.gz"
+    assert pack_name("logs.pack.tar.zst") == "logs.pack.tar.zst"
+    assert is_pack(pack_name())
+    assert not is_pack("logs.tar.gz")
+
+
+def test_upload_pack(tmp_path, monkeypatch):
+    from shbin import main
+
+    repo = MagicMock()
+    monkeypatch.setattr("shbin.get_repo_and_user", lambda: (repo, "messi"))
+    monkeypatch.setattr("shbin.pack.has_zstd", lambda: False)
+    monkeypatch.setenv("SHBIN_CACHE", "0")
+    monkeypatch.setenv("SHBIN_COPY_URL", "0")
+    monkeypatch.chdir(tmp_path)
+    for i in range(50):
+        (tmp_path / f"{i}.log").write_text(f"line {i}\n")
+
+    main(["*.log", "--pack", "-f", "logs"])
+
+    file_name, _, content = repo.create_file.call_args.args
+    assert file_name == "messi/logs.pack.tar.gz"
+    with tarfile.open(fileobj=io.BytesIO(content), mode="r:gz") as tar:
+        assert len(tar.getnames()) == 50
+
+
+def test_download_pack(tmp_path, monkeypatch, capsys):
+    from shbin import download
+
+    (tmp_path / "b.txt").write_text("bb")
+    fileobj = packed(
+        [FakePath("a.txt", content=b"a"), DirectoryFile(tmp_path / "b.txt", "sub/b.txt")], "logs.pack.tar.gz"
+    )
+    response = MagicMock(raw=fileobj)
+    response.__enter__.return_value = response
+    request = MagicMock(return_value=response)
+    monkeypatch.setattr("shbin.pack.transport.request", request)
+    monkeypatch.chdir(tmp_path)
+    repo = MagicMock(full_name="messi/pastebin", default_branch="main", url="https://api/repos/messi/pastebin")
+    repo.get_contents.return_value.sha = "packsha"
+
+    download("messi/logs.pack.tar.gz", repo, "messi", list_pack=True)
+    assert capsys.readouterr().out.split() == ["1", "a.txt", "2", "sub/b.txt"]
+    assert not (tmp_path / "logs").exists()
+
+    fileobj.seek(0)
+    download("messi/logs.pack.tar.gz", repo, "messi")
+    assert request.call_args.args == ("GET", "https://api/repos/messi/pastebin/git/blobs/packsha")
+    assert (tmp_path / "logs/sub/b.txt").read_bytes() == b"bb"
+    assert "extracted 2 files into logs" in capsys.readouterr().out
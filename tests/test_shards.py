@@ -0,0 +1,58 @@
+from unittest.mock import Mock
+
+import pytest
+
+from shbin import shards
+
+NAMES = ["org/pastebin", "org/pastebin-2", "org/pastebin-3"]
+
+
+@pytest.fixture(autouse=True)
+def no_repos(monkeypatch):
+    monkeypatch.setattr("shbin.shards._repos", {})
+
+
+def test_parse():
+    assert shards.parse("org/pastebin") == ["org/pastebin"]
+    assert shards.parse(" org/pastebin, org/pastebin-2 ,") == ["org/pastebin", "org/pastebin-2"]
+    assert shards.parse(["org/pastebin"]) == ["org/pastebin"]
+    assert shards.parse(None) == []
+
+
+def test_a_namespace_lives_in_a_single_repo():
+    chosen = shards.choose(NAMES, "messi")
+    assert shards.choose(NAMES, "messi/notebooks/a.ipynb") == chosen
+    assert shards.choose(NAMES, "/messi/") == chosen
+    assert shards.choose(list(reversed(NAMES)), "messi/x") == chosen
+
+
+def test_namespaces_are_spread():
+    chosen = {shards.choose(NAMES, f"user{i}") for i in range(100)}
+    assert chosen == set(NAMES)
+
+
+def test_adding_a_repo_only_moves_namespaces_to_it():
+    namespaces = [f"user{i}" for i in range(200)]
+    before = {namespace: shards.choose(NAMES, namespace) for namespace in namespaces}
+    after = {namespace: shards.choose(NAMES + ["org/pastebin-4"], namespace) for namespace in namespaces}
+    moved = {namespace for namespace in namespaces if before[namespace] != after[namespace]}
+    assert moved
+    assert all(after[namespace] == "org/pastebin-4" for namespace in moved)
+
+
+def test_repo_for():
+    default = Mock(full_name="org/pastebin")
+    # a single repo
+    assert shards.repo_for(default, "messi/a.txt") is default
+
+    repos = {name: Mock(full_name=name) for name in NAMES}
+    shards.register(repos)
+    assert shards.repo_for(default, "messi/a.txt") is repos[shards.choose(NAMES, "messi")]
+    assert shards.repo_for(default, "https://github.com/Org/Pastebin-3/blob/main/dibu/a.txt") is repos["org/pastebin-3"]
+    assert shards.all_repos(default) == list(repos.values())
+
+
+def test_name_for():
+    assert shards.name_for(NAMES, "messi/a.txt") == shards.choose(NAMES, "messi")
+    assert shards.name_for(NAMES, "https://github.com/Org/Pastebin-2/blob/main/messi/a.txt") == "org/pastebin-2"
+    assert shards.name_for(["org/pastebin"], "anything") == "org/pastebin"
@@ -0,0 +1,78 @@
+import json
+import sys
+from unittest.mock import Mock
+
+import pytest
+
+from shbin.sniff import SNIFF_SIZE, get_extension
+
+NOTEBOOK = json.dumps({"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, indent=1).encode()
+
+
+@pytest.fixture
+def no_libmagic(monkeypatch):
+    # importing a module set to None raises ImportError
+    monkeypatch.setitem(sys.modules, "magic", None)
+
+
+@pytest.mark.parametrize(
+    "content, extension",
+    [
+        (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", ".png"),
+        (b"\xff\xd8\xff\xe0\x00\x10JFIF", ".jpg"),
+        (b"GIF89a\x01\x00", ".gif"),
+        (b"RIFF\x00\x00\x00\x00WEBPVP8 ", ".webp"),
+        (b"%PDF-1.7\n", ".pdf"),
+        (b"PK\x03\x04\x14\x00", ".zip"),
+        (b"\x1f\x8b\x08\x00", ".gz"),
+        (NOTEBOOK, ".ipynb"),
+        (b'{"a": [1, 2]}', ".json"),
+        (b"[1, 2]", ".json"),
+        (b"id,name\n1,messi\n2,dibu\n", ".csv"),
+        (b"id\tname\n1\tmessi\n", ".tsv"),
+        (b"<!DOCTYPE html>\n<html></html>", ".html"),
+        (b"#!/usr/bin/env python3\nprint(1)\n", ".py"),
+        (b"#!/bin/bash\necho hi\n", ".sh"),
+        (b"diff --git a/x b/x\n--- a/x\n+++ b/x\n", ".diff"),
+        (b"some data", ".txt"),
+        ("¡hola!".encode(), ".txt"),
+        (b"{not json", ".txt"),
+        (b"\x00\x01\x02", ""),
+    ],
+)
+def test_get_extension_without_libmagic(no_libmagic, content, extension):
+    assert get_extension(content) == extension
+
+
+def test_get_extension_of_str(no_libmagic):
+    assert get_extension('{"a": 1}') == ".json"
+
+
+def test_get_extension_looks_at_the_head_only(monkeypatch):
+    magic = Mock(**{"from_buffer.return_value": "application/octet-stream"})
+    monkeypatch.setitem(sys.modules, "magic", magic)
+    get_extension(b"\x00" * (50 * SNIFF_SIZE))
+    (head,), _ = magic.from_buffer.call_args
+    assert len(head) == SNIFF_SIZE
+
+
+@pytest.mark.parametrize(
+    "content, extension",
+    [
+        # the csv's last line is cut
+        (b"id,name\n" + b"1,messi\n" * SNIFF_SIZE, ".csv"),
+        (b'[{"id": 1}, ' * SNIFF_SIZE, ".json"),
+        # a multibyte character cut by the head
+        (b"a" * (SNIFF_SIZE - 1) + "ñ".encode() * 10, ".txt"),
+    ],
+)
+def test_get_extension_of_long_text(no_libmagic, content, extension):
+    assert get_extension(content) == extension
+
+
+def test_libmagic_is_the_last_resort(monkeypatch):
+    magic = Mock(**{"from_buffer.return_value": "text/x-python"})
+    monkeypatch.setitem(sys.modules, "magic", magic)
+    assert get_extension(b"print(1)\n") == ".py"
+    assert get_extension(b"%PDF-1.7") == ".pdf"
+    magic.from_buffer.assert_called_once()
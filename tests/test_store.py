@@ -0,0 +1,137 @@
+import io
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from shbin import download
+from shbin.cache import git_blob_sha
+from shbin.chunks import download_chunked
+from shbin.fetch import download_directory
+from shbin.store import BlobStore, max_size, parse_size
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs", max_size=10)
+
+
+@pytest.fixture
+def repo():
+    return MagicMock(full_name="messi/pastebin", default_branch="main", url="https://api/repos/messi/pastebin")
+
+
+def add(store, content):
+    store.add(git_blob_sha(content), io.BytesIO(content), len(content))
+    return git_blob_sha(content)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("1048576", 1024**2), ("500MB", 500 * 1024**2), ("2G", 2 * 1024**3), ("1.5 GiB", 1536 * 1024**2), ("0", 0)],
+)
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+def test_max_size(monkeypatch):
+    monkeypatch.setenv("SHBIN_CACHE_SIZE", "10kb")
+    assert max_size() == 10 * 1024
+    monkeypatch.setenv("SHBIN_CACHE_SIZE", "lots")
+    assert max_size() == 1024**3
+
+
+def test_get(tmp_path, store):
+    sha = add(store, b"abc")
+    assert store.get(sha, tmp_path / "a.txt")
+    assert (tmp_path / "a.txt").read_bytes() == b"abc"
+    assert not store.get(git_blob_sha(b"other"), tmp_path / "b.txt")
+    assert not (tmp_path / "b.txt").exists()
+
+
+def test_least_recently_used_are_evicted(tmp_path, store):
+    first, second = add(store, b"1111"), add(store, b"2222")
+    # the first is used, so the second is the least recently used
+    os.utime(store.blob_path(second), ns=(0, 0))
+    assert store.open(first).read() == b"1111"
+    third = add(store, b"3333")
+
+    assert store.touch(first) and store.touch(third)
+    assert store.touch(second) is None
+    assert store.size == 8
+    # too big to be stored at all
+    assert add(store, b"x" * 11) and store.size == 8
+
+
+def test_download_a_file_from_the_store(tmp_path, monkeypatch, repo, store):
+    monkeypatch.chdir(tmp_path)
+    sha = add(store, b"notebook")
+    cache = MagicMock()
+    cache.get.return_value = {"sha": sha, "size": 8, "mode": "100644"}
+
+    download("messi/nb.ipynb", repo, "messi", cache=cache, store=store)
+
+    cache.refresh.assert_called_once_with("messi")
+    repo.get_contents.assert_not_called()
+    assert (tmp_path / "nb.ipynb").read_bytes() == b"notebook"
+
+
+def test_downloaded_files_are_stored(tmp_path, monkeypatch, repo, store):
+    monkeypatch.chdir(tmp_path)
+    cache = MagicMock()
+    cache.get.return_value = None
+    repo.get_contents.return_value = MagicMock(
+        sha=git_blob_sha(b"data"), decoded_content=b"data", encoding="base64", size=4
+    )
+
+    download("messi/a.txt", repo, "messi", cache=cache, store=store)
+
+    assert store.open(git_blob_sha(b"data")).read() == b"data"
+
+
+def test_download_directory_from_the_store(tmp_path, monkeypatch, repo, store):
+    monkeypatch.chdir(tmp_path)
+    listing = [("a.txt", add(store, b"a")), ("b.txt", git_blob_sha(b"b"))]
+    monkeypatch.setattr("shbin.fetch.list_blobs", lambda *args: listing)
+    downloaded = []
+
+    def download_blob(repo, sha, target):
+        downloaded.append(target.name)
+        target.write_bytes(b"b")
+
+    monkeypatch.setattr("shbin.fetch.download_blob", download_blob)
+
+    download_directory(repo, "messi/dir", store=store)
+
+    assert downloaded == ["b.txt"]
+    assert (tmp_path / "dir" / "a.txt").read_bytes() == b"a"
+    assert store.touch(git_blob_sha(b"b"))
+
+
+def test_chunked_parts_from_the_store(tmp_path, monkeypatch, repo, store):
+    parts = [b"0123", b"4567"]
+    add(store, parts[0])
+    data = {"name": "f", "size": 8, "parts": [{"sha": git_blob_sha(part), "size": 4} for part in parts]}
+    requested = []
+
+    def download_part(repo, sha, size, f, offset):
+        requested.append(offset)
+        os.pwrite(f.fileno(), parts[offset // 4], offset)
+
+    monkeypatch.setattr("shbin.chunks.download_part", download_part)
+    pool = MagicMock(map=lambda f, *iterables: list(map(f, *iterables)))
+
+    download_chunked(repo, data, tmp_path / "f", pool, store=store)
+
+    assert requested == [4]
+    assert (tmp_path / "f").read_bytes() == b"01234567"
+    assert store.open(git_blob_sha(b"4567")).read() == b"4567"
+
+
+def test_manifests_are_not_looked_up(repo, store):
+    from shbin import cached_content
+
+    cache = MagicMock()
+    assert cached_content("messi/f.chunks.json", cache, store) is None
+    assert cached_content("messi/f", cache, None) is None
+    cache.refresh.assert_not_called()
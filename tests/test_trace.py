@@ -0,0 +1,110 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+import requests
+
+from shbin import trace, transport
+
+
+@pytest.fixture(autouse=True)
+def no_tracer(monkeypatch):
+    monkeypatch.delenv("SHBIN_TRACE", raising=False)
+    monkeypatch.setattr("shbin.trace._tracer", None)
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://api.github.com/user", "/user"),
+        ("https://api.github.com/repos/messi/pastebin", "/repos/:repo"),
+        ("https://api.github.com/repos/messi/pastebin/contents/messi/a.md", "/repos/:repo/contents/:path"),
+        ("https://api.github.com/repos/messi/pastebin/git/blobs/" + "a" * 40, "/repos/:repo/git/blobs/:sha"),
+        ("https://api.github.com/repos/messi/pastebin/git/ref/heads/main", "/repos/:repo/git/ref/:ref"),
+        ("https://ghe.example.com/api/v3/repos/messi/pastebin/git/trees", "/repos/:repo/git/trees"),
+    ],
+)
+def test_endpoint(url, expected):
+    assert trace.endpoint(url) == expected
+
+
+def test_disabled_by_default():
+    assert trace.enable() is None
+    trace.phase("config")
+    trace.request("GET", "https://api/x", 200, 0, 0, 0.1)
+    trace.finish()
+
+
+def test_trace_to_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHBIN_TRACE", str(tmp_path / "trace.jsonl"))
+    tracer = trace.enable()
+    trace.phase("config")
+    trace.request("GET", "https://api.github.com/user", 200, 0, 18, 0.1, {"X-RateLimit-Remaining": "4999"})
+    trace.phase("upload")
+    trace.finish()
+
+    events = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert [(e["type"], e.get("name")) for e in events] == [
+        ("phase", "startup"),
+        ("request", None),
+        ("phase", "config"),
+        ("phase", "upload"),
+        ("summary", None),
+    ]
+    assert events[1]["endpoint"] == "/user"
+    assert events[1]["remaining"] == 4999
+    assert events[1]["phase"] == "config"
+    assert [name for name, _ in tracer.phases] == ["startup", "config", "upload"]
+    assert not trace.is_enabled()
+
+
+def test_send_records_requests(monkeypatch):
+    session = Mock()
+    ok = Mock(status_code=200, headers={"X-RateLimit-Remaining": "10"}, content=b"{}")
+    ok.request.headers = {"Content-Length": "2"}
+    session.request.side_effect = [requests.ConnectionError(), ok]
+    monkeypatch.setattr("shbin.transport.get_session", lambda: session)
+    monkeypatch.setattr("shbin.transport.limiter", transport.RateLimiter())
+    monkeypatch.setattr("shbin.transport.time.sleep", Mock())
+    tracer = trace.enable(profile=True)
+
+    transport.send("POST", "https://api.github.com/repos/messi/pastebin/git/blobs", data="{}")
+
+    assert [(r["status"], r["sent"], r["received"], r["remaining"]) for r in tracer.requests] == [
+        ("ConnectionError", 0, 0, None),
+        (200, 2, 2, 10),
+    ]
+
+
+def test_profile_prints_a_summary(monkeypatch, capsys):
+    from shbin import main
+
+    monkeypatch.setattr("shbin.get_repo_and_user", lambda: (Mock(), "messi"))
+    monkeypatch.setattr(
+        "shbin.download", lambda *args, **kwargs: trace.request("GET", "https://api/x", 200, 0, 5, 0.01)
+    )
+    monkeypatch.setenv("SHBIN_CACHE", "0")
+
+    main(["dl", "messi/a.md", "--profile"])
+
+    err = capsys.readouterr().err
+    assert "phases" in err
+    assert "config" in err
+    assert "GET /x" in err
+    assert not trace.is_enabled()
+
+
+def test_no_startup_estimate_within_the_agent(monkeypatch):
+    from shbin import main
+
+    monkeypatch.setattr("shbin.get_repo_and_user", lambda: (Mock(), "messi"))
+    monkeypatch.setattr("shbin.download", lambda *args, **kwargs: None)
+    monkeypatch.setenv("SHBIN_CACHE", "0")
+    # an agent that has been busy for a while
+    monkeypatch.setattr("shbin.time.process_time", lambda: 1000.0)
+    enable = Mock(wraps=trace.enable)
+    monkeypatch.setattr("shbin.trace.enable", enable)
+
+    main(["dl", "messi/a.md", "--profile"], use_agent=False)
+
+    assert enable.call_args.kwargs["started"] is None
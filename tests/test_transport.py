@@ -0,0 +1,132 @@
+import time
+from unittest.mock import Mock
+
+import pytest
+import requests
+from github import GithubException
+
+from shbin import transport
+
+
+def response(status_code=200, headers=None, text=""):
+    return Mock(status_code=status_code, headers=headers or {}, text=text)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Mock()
+    monkeypatch.setattr("shbin.transport.get_session", lambda: session)
+    return session
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    limiter = transport.RateLimiter()
+    monkeypatch.setattr("shbin.transport.limiter", limiter)
+    return limiter
+
+
+@pytest.fixture
+def sleep(monkeypatch):
+    sleep = Mock()
+    monkeypatch.setattr("shbin.transport.time.sleep", sleep)
+    monkeypatch.setattr("shbin.transport.random.uniform", lambda a, b: 1)
+    return sleep
+
+
+def test_send_ok(session, sleep):
+    session.request.return_value = response(200)
+    assert transport.send("GET", "https://api/x").status_code == 200
+    sleep.assert_not_called()
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_retry_server_errors_with_backoff(session, sleep, status):
+    session.request.side_effect = [response(status), response(status), response(200)]
+    assert transport.send("GET", "https://api/x").status_code == 200
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2]
+
+
+def test_retry_network_errors(session, sleep):
+    session.request.side_effect = [requests.ConnectionError(), response(200)]
+    assert transport.send("POST", "https://api/x", data="{}").status_code == 200
+    assert session.request.call_count == 2
+
+
+def test_give_up_after_max_retries(session, sleep):
+    session.request.return_value = response(502)
+    assert transport.send("GET", "https://api/x").status_code == 502
+    assert session.request.call_count == transport.MAX_RETRIES + 1
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 409, 422])
+def test_client_errors_are_not_retried(session, sleep, status):
+    session.request.return_value = response(status)
+    assert transport.send("PUT", "https://api/x").status_code == status
+    assert session.request.call_count == 1
+
+
+def test_403_without_permission_is_not_retried(session, sleep):
+    session.request.return_value = response(403, text='{"message": "Resource not accessible"}')
+    assert transport.send("GET", "https://api/x").status_code == 403
+    assert session.request.call_count == 1
+
+
+def test_retry_after(session, sleep, limiter):
+    session.request.side_effect = [response(429, {"Retry-After": "7"}), response(200)]
+    assert transport.send("GET", "https://api/x").status_code == 200
+    assert sleep.call_args.args[0] == pytest.approx(7, abs=0.1)
+
+
+def test_secondary_rate_limit(session, sleep):
+    session.request.side_effect = [
+        response(403, text='{"message": "You have exceeded a secondary rate limit"}'),
+        response(200),
+    ]
+    assert transport.send("POST", "https://api/x").status_code == 200
+    assert sleep.call_args.args[0] == pytest.approx(transport.SECONDARY_RATE_LIMIT_WAIT, abs=0.1)
+
+
+def test_primary_rate_limit_waits_until_reset(session, sleep):
+    reset = time.time() + 30
+    session.request.side_effect = [
+        response(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)}),
+        response(200),
+    ]
+    assert transport.send("GET", "https://api/x").status_code == 200
+    assert sleep.call_args.args[0] == pytest.approx(31, abs=0.5)
+
+
+def test_too_long_rate_limit_is_not_waited(session, sleep):
+    reset = time.time() + 3600
+    session.request.return_value = response(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)})
+    assert transport.send("GET", "https://api/x").status_code == 403
+    sleep.assert_not_called()
+
+
+def test_pacing_when_few_requests_remain(limiter):
+    limiter.update({"X-RateLimit-Remaining": "1000", "X-RateLimit-Reset": str(time.time() + 100)})
+    assert limiter.delay() == 0
+    limiter.update({"X-RateLimit-Remaining": "9", "X-RateLimit-Reset": str(time.time() + 100)})
+    assert limiter.delay() == pytest.approx(10, abs=0.1)
+
+
+def test_request_raises_github_exception(session, sleep):
+    session.request.return_value = Mock(status_code=404, headers={}, json=Mock(return_value={"message": "Not Found"}))
+    with pytest.raises(GithubException) as e:
+        transport.request("GET", "https://api/x")
+    assert e.value.status == 404
+    assert e.value.data == {"message": "Not Found"}
+
+
+def test_reserve_grows_the_pool(monkeypatch):
+    monkeypatch.setattr("shbin.transport._session", None)
+    monkeypatch.setattr("shbin.transport._pool_size", 4 * transport.DEFAULT_JOBS)
+
+    def pool_size():
+        return transport.get_session().get_adapter("https://api.github.com")._pool_maxsize
+
+    transport.reserve(2)
+    assert pool_size() == 4 * transport.DEFAULT_JOBS
+    transport.reserve(50)
+    assert pool_size() == 200
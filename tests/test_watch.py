@@ -0,0 +1,145 @@
+import os
+import sys
+from unittest.mock import Mock
+
+import pytest
+
+from shbin.cache import file_blob_sha
+from shbin.watch import Inotify, Poller, Watch
+
+
+@pytest.fixture
+def commit_files(mocker):
+    return mocker.patch("shbin.batch.commit_files")
+
+
+def touch(path, content):
+    path.write_text(content)
+    # make the change visible even on filesystems with a coarse mtime
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def uploaded(commit_files):
+    return [sorted(path.name for path in call.args[1]) for call in commit_files.call_args_list]
+
+
+def test_sync_uploads_only_what_changed(tmp_path, monkeypatch, commit_files):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "reports").mkdir()
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (tmp_path / "reports" / name).write_text(name)
+    watch = Watch(Mock(), ["reports"], "messi", "sync")
+
+    watch.sync()
+    assert watch.sync()[0] == []
+    touch(tmp_path / "reports" / "b.txt", "new b")
+    (tmp_path / "reports" / "d.txt").write_text("d")
+    watch.sync()
+
+    assert uploaded(commit_files) == [
+        ["reports/a.txt", "reports/b.txt", "reports/c.txt"],
+        ["reports/b.txt", "reports/d.txt"],
+    ]
+    assert commit_files.call_args.args[2:4] == ("messi", "sync")
+
+
+def test_sync_skips_content_already_in_the_repo(tmp_path, monkeypatch, commit_files):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    cache = Mock()
+    cache.get.side_effect = lambda path: {"sha": file_blob_sha(tmp_path / "a.txt")} if path == "messi/a.txt" else None
+    watch = Watch(Mock(), ["a.txt", "b.txt"], "messi", cache=cache)
+
+    assert [path.name for path in watch.sync()[0]] == ["b.txt"]
+    cache.refresh.assert_called_once_with("messi")
+    # both are synced: none is compared again until it changes
+    assert watch.sync()[0] == []
+    assert cache.refresh.call_count == 1
+
+
+def test_run_commits_once_per_burst(tmp_path, monkeypatch, commit_files):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    watch = Watch(Mock(), ["*.txt"], "messi")
+
+    # a burst of changes, noticed one by one, then quiet, then interrupted
+    events = iter([True, True, False])
+
+    def wait(timeout=None):
+        if timeout is None:
+            touch(tmp_path / "a.txt", "new a")
+            touch(tmp_path / "b.txt", "new b")
+            return True
+        try:
+            return next(events)
+        except StopIteration:
+            raise KeyboardInterrupt
+
+    watcher = Mock(wait=Mock(side_effect=wait))
+    watch.run(debounce=0.01, watcher=watcher)
+
+    assert uploaded(commit_files) == [["a.txt", "b.txt"], ["a.txt", "b.txt"]]
+    watcher.watch.assert_called_with({str(tmp_path)})
+    watcher.close.assert_called_once()
+
+
+def test_run_watches_where_files_will_appear(tmp_path, monkeypatch, commit_files):
+    monkeypatch.chdir(tmp_path)
+    watch = Watch(Mock(), ["logs/**/*.log"], "messi")
+    # nothing matches yet: the directory and the files are created while watching
+    steps = iter(
+        [
+            lambda: (tmp_path / "logs").mkdir(),
+            lambda: (tmp_path / "logs" / "today").mkdir(),
+            lambda: (tmp_path / "logs" / "today" / "a.log").write_text("a"),
+        ]
+    )
+
+    def wait(timeout=None):
+        if timeout is not None:
+            return False
+        try:
+            next(steps)()
+        except StopIteration:
+            raise KeyboardInterrupt
+        return True
+
+    watcher = Mock(wait=Mock(side_effect=wait))
+    watch.run(debounce=0.01, watcher=watcher)
+
+    assert [call.args[0] for call in watcher.watch.call_args_list] == [
+        {str(tmp_path)},
+        {str(tmp_path / "logs")},
+        {str(tmp_path / "logs"), str(tmp_path / "logs" / "today")},
+        {str(tmp_path / "logs"), str(tmp_path / "logs" / "today")},
+    ]
+    assert uploaded(commit_files) == [["a.log"]]
+
+
+def test_poller_notices_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_text("a")
+    watch = Watch(Mock(), ["a.txt"], "messi")
+    poller = Poller(watch.scan, interval=0.01)
+
+    assert not poller.wait(0.02)
+    touch(tmp_path / "a.txt", "changed")
+    assert poller.wait(0.02)
+    assert not poller.wait(0.02)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is linux only")
+def test_inotify_notices_changes(tmp_path):
+    inotify = Inotify()
+    try:
+        inotify.watch([str(tmp_path)])
+        assert not inotify.wait(0.01)
+        (tmp_path / "a.txt").write_text("a")
+        assert inotify.wait(1)
+        # the events were consumed
+        assert not inotify.wait(0.01)
+    finally:
+        inotify.close()